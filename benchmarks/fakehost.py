@@ -0,0 +1,281 @@
+"""
+Stand-in for a Windows host running Buddy and a GameStream server, so that the runner
+can be exercised offline on Linux.
+
+Buddy is served over HTTPS with a self-signed certificate (generated with `openssl`),
+implements every endpoint used by `BuddyRequests` and pushes the state changes through
+`/notifyOnChanges`. The state changes are driven by scripts - timelines of changes that
+are played back when a request (or the fake Moonlight) triggers them. The defaults behave
+like a well-mannered host and can be overridden per trigger.
+"""
+
+import asyncio
+import html
+import json
+import pathlib
+import ssl
+import subprocess
+import sys
+import tempfile
+
+from typing import Any, Callable, Optional, TypedDict
+
+# Same layout as the plugin, the dependencies are bundled with it
+for directory in [["python"], ["python", "externals"]]:
+    sys.path.append(str(pathlib.Path(__file__).parent.parent.joinpath("defaults", *directory).resolve()))
+
+from aiohttp import web  # noqa: E402
+from lib import constants  # noqa: E402
+
+
+FAKE_MOONLIGHT_EXEC = str(pathlib.Path(__file__).parent.joinpath("fakemoonlight.py").resolve())
+FAKE_MOONLIGHT_CONTROL_ENV = "FAKE_MOONLIGHT_CONTROL_URL"
+
+
+class FakeHostTimings(TypedDict):
+    request_latency: float
+    stream_start: float
+    steam_start: float
+    app_start: float
+    app_run: float
+    stream_end: float
+    steam_close: float
+
+
+DEFAULT_TIMINGS = FakeHostTimings({
+    "request_latency": 0.002,
+    "stream_start": 0.5,
+    "steam_start": 1.0,
+    "app_start": 1.0,
+    "app_run": 2.0,
+    "stream_end": 0.3,
+    "steam_close": 0.5
+})
+
+# Changes are the topic values (as sent by Buddy) that are applied after the delay
+Timeline = list[tuple[float, dict[str, Any]]]
+Script = Callable[[dict[str, Any]], Timeline]
+
+
+def generate_certificate(directory: str):
+    certfile = str(pathlib.Path(directory).joinpath("cert.pem"))
+    keyfile = str(pathlib.Path(directory).joinpath("key.pem"))
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=FakeBuddy", "-keyout", keyfile, "-out", certfile],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+class FakeHost:
+    def __init__(self, timings: FakeHostTimings = DEFAULT_TIMINGS, scripts: Optional[dict[str, Script]] = None,
+                 host_id: str = "FAKE-HOST-ID", hostname: str = "FakeHost", user_id: str = "76561198000000000"):
+        self.timings = timings
+        self.host_id = host_id
+        self.hostname = hostname
+        self.user_id = user_id
+        self.address = "127.0.0.1"
+        self.buddy_port = 0
+        self.host_port = 0
+        self.cafile = ""
+        self.requests: dict[str, int] = {}
+        self.topics: dict[str, Any] = {
+            "StreamState": {"state": "NotStreaming"},
+            "SteamUiMode": {"mode": "Unknown"},
+            "CurrentUser": {"user": None},
+            "StreamedAppData": {"data": None}
+        }
+        self.__scripts = {**self.__default_scripts(), **(scripts or {})}
+        self.__subscribers: set[tuple[web.WebSocketResponse, tuple[str, ...]]] = set()
+        self.__tasks: set[asyncio.Task] = set()
+        self.__runners: list[web.AppRunner] = []
+        self.__directory = tempfile.TemporaryDirectory(prefix="fakehost-")
+
+    @property
+    def control_url(self):
+        return f"http://{self.address}:{self.host_port}/fake"
+
+    def __default_scripts(self) -> dict[str, Script]:
+        timings = self.timings
+
+        def launch_steam(data: dict[str, Any]) -> Timeline:
+            mode = "BigPicture" if data["big_picture_mode"] else "Desktop"
+            if self.topics["SteamUiMode"]["mode"] == mode:
+                return []
+            return [(timings["steam_start"], {"SteamUiMode": {"mode": mode}, "CurrentUser": {"user": {"id": self.user_id}}})]
+
+        def launch_steam_app(data: dict[str, Any]) -> Timeline:
+            def app_data(state: str):
+                return {"StreamedAppData": {"data": {"app_id": data["app_id"], "app_state": state}}}
+
+            # Buddy starts tracking the app as soon as it is asked to launch it
+            return [(0, app_data("Stopped")),
+                    (timings["app_start"], app_data("Running")),
+                    (timings["app_start"] + timings["app_run"], app_data("Stopped"))]
+
+        return {
+            "moonlight_started": lambda _: [(timings["stream_start"], {"StreamState": {"state": "Streaming"}})],
+            "moonlight_stopped": lambda _: [(0, {"StreamState": {"state": "NotStreaming"}})],
+            "/launchSteam": launch_steam,
+            "/launchSteamApp": launch_steam_app,
+            "/closeSteam": lambda _: [(timings["steam_close"], {"SteamUiMode": {"mode": "Unknown"}, "CurrentUser": {"user": None}})],
+            "/closeSteamBigPictureMode": lambda _: [(timings["steam_close"], {"SteamUiMode": {"mode": "Desktop"}})],
+            "/clearStreamedAppData": lambda _: [(0, {"StreamedAppData": {"data": None}})],
+            "/endStream": lambda _: [(0, {"StreamState": {"state": "StreamEnding"}}),
+                                     (timings["stream_end"], {"StreamState": {"state": "NotStreaming"}, "StreamedAppData": {"data": None}})],
+        }
+
+    def set(self, changes: dict[str, Any]):
+        self.topics.update(changes)
+        for ws, topics in list(self.__subscribers):
+            if any(topic in changes for topic in topics) and not ws.closed:
+                self.__spawn(ws.send_json([self.topics[topic] for topic in topics]))
+
+    def trigger(self, name: str, data: dict[str, Any]):
+        script = self.__scripts.get(name)
+        if script is None:
+            return
+
+        timeline = sorted(script(data), key=lambda item: item[0])
+
+        # Immediate changes are visible before the request is answered, like with the real Buddy
+        while timeline and timeline[0][0] <= 0:
+            self.set(timeline.pop(0)[1])
+
+        async def play():
+            elapsed = 0.0
+            for delay, changes in timeline:
+                await asyncio.sleep(delay - elapsed)
+                elapsed = delay
+                self.set(changes)
+
+        if timeline:
+            self.__spawn(play())
+
+    def __spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    def __make_buddy_app(self):
+        @web.middleware
+        async def middleware(request: web.Request, handler):
+            endpoint = f"{request.method} /{request.path.split('/')[1]}"
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if self.timings["request_latency"] > 0:
+                await asyncio.sleep(self.timings["request_latency"])
+            return await handler(request)
+
+        def get(response: Callable[[], Any]):
+            async def handler(request: web.Request):
+                return web.json_response(response())
+            return handler
+
+        def post(name: str, result: bool = True):
+            async def handler(request: web.Request):
+                data = await request.json() if request.can_read_body else {}
+                self.trigger(name, data or {})
+                return web.json_response({"result": result})
+            return handler
+
+        async def app_data(request: web.Request):
+            data = await request.json()
+            streamed = self.topics["StreamedAppData"]["data"]
+            return web.json_response({"data": streamed if streamed and streamed["app_id"] == data["app_id"] else None})
+
+        async def notify_on_changes(request: web.Request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            topics = tuple(await ws.receive_json())
+            await ws.send_json({"result": all(topic in self.topics for topic in topics)})
+            await ws.send_json([self.topics[topic] for topic in topics])
+
+            subscriber = (ws, topics)
+            self.__subscribers.add(subscriber)
+            try:
+                async for _ in ws:
+                    pass
+            finally:
+                self.__subscribers.discard(subscriber)
+            return ws
+
+        app = web.Application(middlewares=[middleware])
+        app.router.add_get("/apiVersion", get(lambda: {"version": constants.BUDDY_API_VERSION}))
+        app.router.add_get("/pairingState/{id}", get(lambda: {"state": "Paired"}))
+        app.router.add_get("/pcState", get(lambda: {"state": "Normal"}))
+        app.router.add_get("/hostInfo", get(lambda: {"mac": "00:11:22:33:44:55", "os": "Windows"}))
+        app.router.add_get("/steamUiMode", get(lambda: self.topics["SteamUiMode"]))
+        app.router.add_get("/currentUser", get(lambda: self.topics["CurrentUser"]))
+        app.router.add_get("/streamState", get(lambda: self.topics["StreamState"]))
+        app.router.add_get("/streamedAppData", get(lambda: self.topics["StreamedAppData"]))
+        app.router.add_get("/appData", app_data)
+        app.router.add_get("/gameStreamAppNames", get(lambda: {"app_names": ["Desktop", "MoonDeckStream"]}))
+        app.router.add_get("/nonSteamAppData", get(lambda: {"data": [{"app_id": "1", "app_name": "Fake Game"}]}))
+        app.router.add_get("/notifyOnChanges", notify_on_changes)
+        for name in ["/pair", "/abortPairing", "/launchSteam", "/launchSteamApp", "/closeSteam", "/closeSteamBigPictureMode",
+                     "/restartHost", "/shutdownHost", "/suspendHost", "/hibernateHost", "/abortHostStateChange",
+                     "/clearStreamedAppData", "/endStream"]:
+            app.router.add_post(name, post(name))
+        return app
+
+    def __make_gamestream_app(self):
+        async def server_info(request: web.Request):
+            return web.Response(text=f"<root><hostname>{html.escape(self.hostname)}</hostname>"
+                                     f"<uniqueid>{html.escape(self.host_id)}</uniqueid></root>")
+
+        def moonlight(name: str):
+            async def handler(request: web.Request):
+                self.trigger(name, {})
+                return web.Response()
+            return handler
+
+        app = web.Application()
+        app.router.add_get("/serverinfo", server_info)
+        app.router.add_post("/fake/moonlight/started", moonlight("moonlight_started"))
+        app.router.add_post("/fake/moonlight/stopped", moonlight("moonlight_stopped"))
+        return app
+
+    async def __serve(self, app: web.Application, ssl_context: Optional[ssl.SSLContext] = None):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, self.address, 0, ssl_context=ssl_context)
+        await site.start()
+        self.__runners.append(runner)
+        return site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    async def start(self):
+        self.cafile, keyfile = generate_certificate(self.__directory.name)
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(self.cafile, keyfile)
+
+        self.buddy_port = await self.__serve(self.__make_buddy_app(), ssl_context)
+        self.host_port = await self.__serve(self.__make_gamestream_app())
+        return self
+
+    async def stop(self):
+        for task in list(self.__tasks):
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+
+        for ws, _ in list(self.__subscribers):
+            await ws.close()
+        for runner in self.__runners:
+            await runner.cleanup()
+        self.__runners.clear()
+        self.__directory.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+
+async def main():
+    async with FakeHost() as host:
+        print(json.dumps({"address": host.address, "buddyPort": host.buddy_port, "hostPort": host.host_port,
+                          "cafile": host.cafile, "hostId": host.host_id, "controlUrl": host.control_url}, indent=2))
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
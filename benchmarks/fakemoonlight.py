@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Moonlight executable. Accepts the same command line as Moonlight
+and reports the start and the end of the "stream" to the fake host, which in turn
+plays it back to the runner via Buddy notifications.
+"""
+
+import os
+import signal
+import sys
+import threading
+import urllib.request
+
+
+def notify(event: str):
+    control_url = os.environ.get("FAKE_MOONLIGHT_CONTROL_URL")
+    if control_url:
+        urllib.request.urlopen(urllib.request.Request(f"{control_url}/moonlight/{event}", method="POST"), timeout=5).close()
+
+
+def main():
+    args = sys.argv[1:]
+    if "list" in args:
+        print("Desktop")
+        print("MoonDeckStream")
+        return 0
+
+    if "stream" not in args:
+        print(f"Unsupported arguments: {args}", file=sys.stderr)
+        return 1
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+
+    print(f"Streaming {' '.join(args[args.index('stream') + 1:])}", flush=True)
+    notify("started")
+    stopped.wait()
+    notify("stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Compares utils.from_dict (with and without copying) with the previous recursive
+implementation that inspected the types on every call, and decoding the polled
+responses with utils.from_json with decoding them to text first.
+
+Usage: python benchmarks/from_dict.py [iterations]
+"""
+
+import copy
+import json
+import sys
+import timeit
+
+from enum import Enum
+from pathlib import Path
+from typing import Any, List, Literal, Union, get_args, get_origin, is_typeddict
+
+sys.path.append(str(Path(__file__).parent.parent.joinpath("defaults", "python").resolve()))
+
+from lib import utils  # noqa: E402
+from lib.buddyrequests import CurrentUserResponse, HostInfoResponse, PcStateResponse, SteamUiModeResponse, StreamedAppDataResponse, StreamStateResponse  # noqa: E402
+from lib.plugin.settings import UserSettingsManager  # noqa: E402
+
+
+def legacy_from_list(item_type, data: List[Any]):
+    assert isinstance(data, list), f"Expected list (\"{item_type}\"), got {data}"
+
+    verified_data = []
+    for item in data:
+        if get_origin(item_type) == list:
+            verified_item = legacy_from_list(get_args(item_type)[0], item)
+        elif is_typeddict(item_type) or get_origin(item_type) == dict:
+            verified_item = legacy_from_dict(item_type, item)
+        else:
+            assert isinstance(item, item_type)
+            verified_item = item
+
+        verified_data.append(verified_item)
+    return verified_data
+
+
+def legacy_from_dict(output_type, data):
+    import inspect
+
+    assert isinstance(data, dict), f"Expected dict (\"{output_type}\"), got {data}"
+
+    def get_annotations(data_type, data):
+        if is_typeddict(data_type):
+            for key, key_type in data_type.__annotations__.items():
+                yield (key, key_type)
+        else:
+            for key in data.keys():
+                yield (key, data_type[1])
+
+    verified_data = {}
+    for key, key_type in get_annotations(output_type, data):
+        if key not in data:
+            raise ValueError(f"Key \"{key}\" is not available in {data}.")
+
+        args = get_args(key_type)
+        if get_origin(key_type) == Union and len(args) == 2 and args[1] == type(None):
+            if data[key] is None:
+                verified_data[key] = None
+                continue
+            else:
+                key_type = args[0]
+
+        actual_type = get_args(key_type) or key_type
+        if inspect.isclass(actual_type) and issubclass(actual_type, Enum):
+            verified_data[key] = actual_type[data[key]]
+            continue
+        elif is_typeddict(key_type) or get_origin(key_type) == dict:
+            verified_data[key] = legacy_from_dict(actual_type, data[key])
+            continue
+        elif get_origin(key_type) == list:
+            verified_data[key] = legacy_from_list(actual_type[0], data[key])
+            continue
+        elif get_origin(key_type) == Literal:
+            if data[key] not in actual_type:
+                raise TypeError(f"Value {data[key]} of \"{key}\" does not match the valid literal value(s) {actual_type}")
+        elif not isinstance(data[key], actual_type):
+            raise TypeError(f"\"{key}\" value {data[key]} is not of valid type(s) {actual_type}")
+
+        verified_data[key] = copy.deepcopy(data[key])
+
+    return output_type(**verified_data) if is_typeddict(output_type) else verified_data
+
+
+def make_user_settings():
+    settings: Any = UserSettingsManager("/dev/null")._default_settings()
+    host = {
+        "hostInfoPort": 47989,
+        "address": "192.168.1.2",
+        "staticAddress": False,
+        "hostName": "Host",
+        "mac": "00:11:22:33:44:55",
+        "os": "Windows",
+        "resolution": {
+            "automatic": True,
+            "appResolutionOverride": "CustomResolution",
+            "appResolutionOverrideForInternalDisplay": False,
+            "useCustomDimensions": True,
+            "useLinkedDisplays": True,
+            "selectedDimensionIndex": 0,
+            "defaultBitrate": None,
+            "defaultFps": None,
+            "defaultHdr": None,
+            "dimensions": [{"width": 1280, "height": 800, "bitrate": None, "fps": None, "hdr": None,
+                            "linkedDisplays": ["Internal"]}] * 4
+        },
+        "audio": {"defaultOption": None, "useLinkedAudio": True, "linkedAudio": {"stereo": ["Internal"]}},
+        "runnerTimeouts": {
+            "buddyRequests": 5, "servicePing": 5, "initialConditions": 30, "streamReadiness": 30,
+            "steamReadiness": 60, "appLaunch": 30, "appLaunchStability": 15, "streamEnd": 15,
+            "wakeOnLan": 60, "steamLaunch": 60, "userSwitch": 60
+        },
+        "passToMoonlight": True,
+        "showPerformanceStats": None,
+        "enableVSync": None,
+        "enableFramePacing": None,
+        "videoCodec": None,
+        "buddy": {
+            "bigPictureMode": True,
+            "port": 59999,
+            "closeSteam": None,
+            "hostApp": {"selectedAppIndex": 0, "apps": ["MoonDeckStream", "Desktop"]},
+            "hibernateHost": False
+        },
+        "gameStreamApps": {"showQuickAccessButton": False},
+        "nonSteamApps": {"showQuickAccessButton": False},
+        "wolSettings": {"useCustomWolExec": False, "customWolExecPath": "", "port": 9}
+    }
+    settings["currentHostId"] = "HOST0"
+    settings["hostSettings"] = {f"HOST{i}": copy.deepcopy(host) for i in range(3)}
+    return settings
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    settings = make_user_settings()
+    user_settings_type = UserSettingsManager("/dev/null").settings_type
+    notifications = [
+        (StreamedAppDataResponse, {"data": {"app_id": "123", "app_state": "Running"}}),
+        (SteamUiModeResponse, {"mode": "BigPicture"}),
+        (CurrentUserResponse, {"user": {"id": "76561198000000000"}}),
+        (StreamStateResponse, {"state": "Streaming"}),
+    ]
+
+    # Sanity check that both implementations agree
+    assert utils.from_dict(user_settings_type, settings) == legacy_from_dict(user_settings_type, settings)
+    assert utils.from_dict(user_settings_type, settings, copy=False) == legacy_from_dict(user_settings_type, settings)
+    for output_type, data in notifications:
+        assert utils.from_dict(output_type, data) == legacy_from_dict(output_type, data)
+        assert utils.from_dict(output_type, data, copy=False) == legacy_from_dict(output_type, data)
+
+    def notification_run(implementation, **kwargs):
+        def run():
+            for output_type, data in notifications:
+                implementation(output_type, data, **kwargs)
+        return run
+
+    cases = [
+        ("UserSettings", lambda: legacy_from_dict(user_settings_type, settings),
+                         lambda: utils.from_dict(user_settings_type, settings),
+                         lambda: utils.from_dict(user_settings_type, settings, copy=False)),
+        ("notifications", notification_run(legacy_from_dict),
+                          notification_run(utils.from_dict),
+                          notification_run(utils.from_dict, copy=False)),
+    ]
+
+    def measure(fn):
+        return min(timeit.repeat(fn, number=iterations, repeat=5)) / iterations * 1e6
+
+    print(f"{'case':<16}{'legacy (us)':>14}{'compiled (us)':>16}{'no copy (us)':>15}{'speedup':>10}")
+    for name, legacy, compiled, no_copy in cases:
+        legacy_time = measure(legacy)
+        compiled_time = measure(compiled)
+        no_copy_time = measure(no_copy)
+        print(f"{name:<16}{legacy_time:>14.2f}{compiled_time:>16.2f}{no_copy_time:>15.2f}{legacy_time / no_copy_time:>9.1f}x")
+
+    # What a poll of every state endpoint costs once the response has been read
+    polls = [(output_type, json.dumps(data).encode("utf-8")) for output_type, data in notifications] + [
+        (PcStateResponse, b'{"state": "Normal"}'),
+        (HostInfoResponse, b'{"mac": "00:11:22:33:44:55", "os": "Windows"}'),
+    ]
+    for output_type, body in polls:
+        assert utils.from_json(output_type, body) == utils.from_dict(output_type, json.loads(body.decode("utf-8")))
+
+    def poll_as_text():
+        for output_type, body in polls:
+            utils.from_dict(output_type, json.loads(body.decode("utf-8")), copy=False)
+
+    def poll_from_json():
+        for output_type, body in polls:
+            utils.from_json(output_type, body)
+
+    text_time = measure(poll_as_text)
+    from_json_time = measure(poll_from_json)
+    print()
+    print(f"{'case':<16}{'as text (us)':>14}{'from_json (us)':>16}{'speedup':>10}")
+    print(f"{'polls':<16}{text_time:>14.2f}{from_json_time:>16.2f}{text_time / from_json_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
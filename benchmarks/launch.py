@@ -0,0 +1,200 @@
+"""
+Measures the launch sequence of MoonDeckAppRunner against the fake host, phase by phase,
+from the connectivity check to the teardown after the app has closed.
+
+The phases are run the same way `MoonDeckAppRunner.run` runs them, except that the
+Buddy session trusts the fake host's certificate and Moonlight is the fake executable.
+
+Usage: python benchmarks/launch.py [-n ITERATIONS] [--latency SECONDS] [--warm] [--json] [--capture FILE]
+
+With `--capture` the Buddy traffic of the first launch is recorded for `replay.py`.
+
+Note that starting Moonlight kills every process with "moonlight" in its command line.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+
+from typing import Any, Callable, Optional, cast
+
+from fakehost import DEFAULT_TIMINGS, FAKE_MOONLIGHT_CONTROL_ENV, FAKE_MOONLIGHT_EXEC, FakeHost, FakeHostTimings
+
+from lib.buddyclient import BuddyClient  # noqa: E402
+from lib.buddyrequests import BuddyRequests  # noqa: E402
+from lib.buddytraffic import TrafficRecorder  # noqa: E402
+from lib.gamestreaminfo import close_server_info_session  # noqa: E402
+from lib.moonlightproxy import MoonlightProxy  # noqa: E402
+from lib.runner.moondeckapprunner import MoonDeckAppLauncher, MoonDeckAppRunner  # noqa: E402
+
+
+CLIENT_ID = "fake-client"
+APP_ID = "1234"
+TIMEOUT = 30
+
+# Phase name and the mark it ends at (it starts at the previous mark)
+PHASES = [
+    ("connectivity", "connectivity"),
+    ("initial conditions", "initial_conditions"),
+    ("moonlight start", "moonlight_started"),
+    ("stream ready", "stream_ready"),
+    ("steam ready", "steam_ready"),
+    ("app launch", "app_running"),
+    ("app session", "app_closed"),
+    ("stream end", "stream_ended"),
+    ("moonlight exit", "moonlight_exited"),
+]
+TOTALS = [
+    ("time to stream", None, "stream_ready"),
+    ("time to app running", None, "app_running"),
+    ("teardown", "app_closed", "moonlight_exited"),
+]
+
+
+def make_marks():
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    marks: dict[str, float] = {}
+
+    def mark(name: str):
+        marks[name] = loop.time() - started_at
+
+    return marks, mark
+
+
+async def launch(client: BuddyClient, hostname: str, app_id: str, stability_timeout: float, mark: Callable[[str], None]):
+    """
+    Runs the stages after the connectivity check, up to Moonlight's exit.
+    """
+    async with MoonlightProxy(FAKE_MOONLIGHT_EXEC) as proxy:
+        await MoonDeckAppRunner.wait_for_initial_conditions(client=client, app_id=app_id, user_id=None, timeout=TIMEOUT)
+        mark("initial_conditions")
+
+        await MoonDeckAppRunner.start_moonlight(proxy=proxy, hostname=hostname, host_app="MoonDeckStream",
+                                                cmd_options=cast(Any, None))
+        mark("moonlight_started")
+
+        proxy_task = asyncio.create_task(proxy.wait())
+        try:
+            await MoonDeckAppLauncher.wait_for_stream_to_be_ready(client=client, timeout=TIMEOUT)
+            mark("stream_ready")
+
+            await client.launch_steam(True, None)
+            await MoonDeckAppLauncher.wait_for_steam_to_be_ready(client=client, big_picture_mode=True, user_id=None,
+                                                                 can_retry_user_switch=False, timeout=TIMEOUT)
+            mark("steam_ready")
+
+            await client.launch_app(app_id)
+            await MoonDeckAppLauncher.wait_for_app_to_be_launched(client=client, app_id=app_id,
+                                                                  stability_timeout=cast(Any, stability_timeout),
+                                                                  launch_timeout=TIMEOUT)
+            mark("app_running")
+
+            await MoonDeckAppLauncher.wait_for_app_to_close(client=client)
+            mark("app_closed")
+        finally:
+            proxy_task.cancel()
+            await asyncio.gather(proxy_task, return_exceptions=True)
+
+        await MoonDeckAppRunner.end_successful_stream(client=client, close_steam=None, timeout=TIMEOUT)
+        mark("stream_ended")
+    mark("moonlight_exited")
+
+
+async def run_once(host: FakeHost, stability_timeout: float, recorder: Optional[TrafficRecorder] = None):
+    marks, mark = make_marks()
+    session = BuddyRequests.create_session(CLIENT_ID, cafile=host.cafile)
+    try:
+        buddy_client = BuddyClient(host.address, host.buddy_port, CLIENT_ID, TIMEOUT, session=session, recorder=recorder)
+        async with buddy_client as client:
+            await MoonDeckAppRunner.check_connectivity(client=client,
+                                                       overlay_stack=cast(Any, None),
+                                                       mac="00:11:22:33:44:55",
+                                                       host_id=host.host_id,
+                                                       hostname=host.hostname,
+                                                       host_port=host.host_port,
+                                                       wol_port=9,
+                                                       custom_wol_exec=None,
+                                                       wol_timeout=0,
+                                                       server_timeout=TIMEOUT)
+            mark("connectivity")
+
+            await launch(client, host.hostname, APP_ID, stability_timeout, mark)
+    finally:
+        await session.close()
+
+    return marks
+
+
+def summarize(runs: list[dict[str, float]], phases_to_skip: int = 0):
+    def stats(values: list[float]):
+        values = sorted(values)
+        return {"medianMs": statistics.median(values) * 1000,
+                "p95Ms": values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+                "maxMs": values[-1] * 1000}
+
+    phases = {}
+    previous = None
+    for name, end in PHASES[phases_to_skip:]:
+        phases[name] = stats([run[end] - (run[previous] if previous else 0) for run in runs])
+        previous = end
+
+    totals = {name: stats([run[end] - (run[start] if start else 0) for run in runs]) for name, start, end in TOTALS}
+    return {"phases": phases, "totals": totals}
+
+
+def print_result(result: dict[str, Any]):
+    print(f"{'phase':<22}{'median (ms)':>13}{'p95 (ms)':>11}{'max (ms)':>11}")
+    for section in ["phases", "totals"]:
+        for name, values in result[section].items():
+            print(f"{name:<22}{values['medianMs']:>13.1f}{values['p95Ms']:>11.1f}{values['maxMs']:>11.1f}")
+        print()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the runner's launch sequence against a fake host.")
+    parser.add_argument("-n", "--iterations", type=int, default=5, help="number of launches to measure")
+    parser.add_argument("--latency", type=float, default=DEFAULT_TIMINGS["request_latency"], help="Buddy response delay in seconds")
+    parser.add_argument("--stability", type=float, default=0.5, help="app launch stability timeout in seconds")
+    parser.add_argument("--warm", action="store_true", help="reuse one host, so Steam is already running after the first launch")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--capture", help="file to record the Buddy traffic of the first launch to")
+    args = parser.parse_args()
+
+    timings = FakeHostTimings({**DEFAULT_TIMINGS, "request_latency": args.latency})
+    runs: list[dict[str, float]] = []
+    host = None
+    try:
+        for _ in range(args.iterations):
+            if host is None or not args.warm:
+                if host is not None:
+                    await host.stop()
+                host = await FakeHost(timings).start()
+                # The fake Moonlight inherits the environment and reports to whichever host is current
+                os.environ[FAKE_MOONLIGHT_CONTROL_ENV] = host.control_url
+
+            recorder = TrafficRecorder(args.capture) if args.capture and not runs else None
+            try:
+                runs.append(await run_once(host, args.stability, recorder))
+            finally:
+                if recorder is not None:
+                    recorder.close()
+    finally:
+        if host is not None:
+            await host.stop()
+        await close_server_info_session()
+
+    result = summarize(runs)
+    if args.json:
+        print(json.dumps({"iterations": args.iterations, "timings": timings, **result}, indent=2))
+        return
+
+    print_result(result)
+    print(f"Fake host timings (s): {', '.join(f'{key}={value}' for key, value in timings.items())}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""
+Replays a Buddy traffic capture to the runner's launch sequence, phase by phase, to profile
+the launcher logic and the `TimedPooler` timeouts against a launch that has already happened.
+
+The capture can come from the runner (set `MOONDECK_CAPTURE_FILE` in the game's launch options)
+or from `launch.py --capture`. The connectivity check talks to the GameStream server as well,
+so the replay starts with the initial conditions.
+
+The launcher's own timers run on the wall clock, so unless given, the app launch stability
+timeout is scaled with the replay speed (and is zero when replaying as fast as possible).
+
+Usage: python benchmarks/replay.py CAPTURE [-n ITERATIONS] [--speed FACTOR] [--stability SECONDS] [--json]
+
+Note that starting Moonlight kills every process with "moonlight" in its command line.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+
+from typing import Optional
+
+from fakehost import FAKE_MOONLIGHT_CONTROL_ENV
+from launch import CLIENT_ID, TIMEOUT, launch, make_marks, print_result, summarize
+
+from lib.buddyclient import BuddyClient  # noqa: E402
+from lib.buddytraffic import ReplaySession, read_capture  # noqa: E402
+
+
+# Skips the connectivity phase
+PHASES_TO_SKIP = 1
+STABILITY_TIMEOUT = 0.5
+
+
+def get_launched_app_id(capture: str):
+    # Only the parameters of the queries are recorded, so look for the app that Buddy has reported
+    for entry in read_capture(capture):
+        for item in entry.get("r") or [] if entry["k"] == "msg" else [entry.get("r")]:
+            data = item.get("data") if isinstance(item, dict) else None
+            if isinstance(data, dict) and "app_id" in data:
+                return data["app_id"]
+    raise ValueError(f"No app launch in {capture}")
+
+
+async def run_once(capture: str, app_id: str, speed: Optional[float], stability_timeout: float):
+    marks, mark = make_marks()
+    async with ReplaySession(capture, CLIENT_ID, speed) as session:
+        async with BuddyClient("replay", 0, CLIENT_ID, TIMEOUT, session=session) as client:  # type: ignore
+            await launch(client, "replay", app_id, stability_timeout, mark)
+    return marks
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replays a Buddy traffic capture to the runner's launch sequence.")
+    parser.add_argument("capture", help="traffic capture to replay")
+    parser.add_argument("-n", "--iterations", type=int, default=1, help="number of replays to measure")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed relative to the capture, 0 for as fast as possible")
+    parser.add_argument("--stability", type=float, help=f"app launch stability timeout in seconds (default: {STABILITY_TIMEOUT} / speed)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    # The fake Moonlight must not report to any host, the capture has the stream changes already
+    os.environ.pop(FAKE_MOONLIGHT_CONTROL_ENV, None)
+
+    speed = args.speed or None
+    stability = args.stability if args.stability is not None else (STABILITY_TIMEOUT / speed if speed else 0)
+
+    app_id = get_launched_app_id(args.capture)
+    runs = [await run_once(args.capture, app_id, speed, stability) for _ in range(args.iterations)]
+
+    result = summarize(runs, PHASES_TO_SKIP)
+    if args.json:
+        print(json.dumps({"iterations": args.iterations, "speed": args.speed, "stability": stability, **result}, indent=2))
+        return
+
+    print_result(result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
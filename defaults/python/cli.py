@@ -65,7 +65,7 @@ TYPE_STEAM_USER = arg_type(pair_type(str, str))
 # Common descriptions
 DESC_HOST = "host id, name or address (default: the \"default\" host)"
 DESC_HOST_NON_OPT = "host id, name or address"
-DESC_BUDDY_TIMEOUT = "time for Buddy to respond to requests (default: %(default)s second(s))"
+DESC_BUDDY_TIMEOUT = "time for Buddy to complete each operation, including all of its requests (default: %(default)s second(s))"
 DESC_SERVER_TIMEOUT = "time for GameStream server to respond to requests (default: %(default)s second(s))"
 DESC_PING_TIMEOUT = "how long to continue pinging until Buddy and GameStream server are both \"online\" (default: %(default)s second(s))"
 DESC_JSON = "print the output in JSON format"
@@ -319,6 +319,18 @@ def add_cmd_host(main_subparsers: _SubParsersAction[ArgumentParserWithRedirect])
     shutdown_parser.add_argument(
         "--buddy-timeout", type=TYPE_TIMEOUT, default=DEF_TIMEOUT, help=DESC_BUDDY_TIMEOUT)
     
+    # -------- Setup `stats` command
+    stats_parser = host_subparsers.add_parser(
+        "stats", help="probe Buddy and print the per-endpoint latency, error and traffic stats")
+    stats_parser.add_argument(
+        "--host", type=str, help=DESC_HOST)
+    stats_parser.add_argument(
+        "--samples", type=TYPE_RETRY, default=5, help="how many times to probe Buddy (default: %(default)s time(s))")
+    stats_parser.add_argument(
+        "--json", action="store_true", help=DESC_JSON)
+    stats_parser.add_argument(
+        "--buddy-timeout", type=TYPE_TIMEOUT, default=DEF_TIMEOUT, help=DESC_BUDDY_TIMEOUT)
+
     # -------- Setup `suspend` command
     suspend_parser = host_subparsers.add_parser(
         "suspend", help="suspend the paired host")
@@ -505,6 +517,7 @@ async def main():
                 "restart",
                 "scan",
                 "shutdown",
+                "stats",
                 "suspend",
                 "wake"
             ],
@@ -574,6 +587,12 @@ async def main():
         logger.exception("Unhandled exception")
         sys.exit(1)
 
+    finally:
+        # Only the commands that have probed a host have a session to close, the others must not pay for the import
+        gamestreaminfo = sys.modules.get("lib.gamestreaminfo")
+        if gamestreaminfo is not None:
+            await gamestreaminfo.close_server_info_session()
+
 
 if __name__ == "__main__":
     import asyncio
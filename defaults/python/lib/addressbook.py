@@ -0,0 +1,307 @@
+import contextlib
+
+from typing import Callable, Optional, TypedDict
+from .circuitbreaker import get_circuit_breaker
+from .deadline import remaining
+from .logger import logger
+
+
+class RaceWinner(TypedDict):
+    address: str
+    rttMs: float
+    measuredAt: float
+
+
+class AddressBookEntry(TypedDict):
+    # Every address the host has been seen at and when
+    addresses: dict[str, float]
+    # Fastest address per port
+    winners: dict[str, RaceWinner]
+
+
+def url_host(address: str):
+    # IPv6 addresses must be bracketed in the URLs
+    return f"[{address}]" if ":" in address else address
+
+
+class AddressBook:
+    """
+    Remembers every address a host has been seen at (i.e. LAN, VPN and IPv6 addresses announced via
+    mDNS or added manually) and which of them has answered the fastest on each port. With a state
+    file the addresses are shared between the plugin, runner and CLI processes.
+    """
+
+    MAX_ADDRESS_AGE = 7 * 24 * 3600
+    WINNER_TTL = 300
+
+    def __init__(self, state_file: Optional[str] = None):
+        self.state_file = state_file
+        self.__entries: dict[str, AddressBookEntry] = {}
+        self.__file_stamp: Optional[tuple[int, int, int]] = None
+
+    @staticmethod
+    def now():
+        # Lazy import to improve CLI performance
+        import time
+
+        # Wall clock is needed as the timestamps are shared between processes
+        return time.time()
+
+    def __read_state_file(self):
+        # Lazy import to improve CLI performance
+        import json
+
+        if self.state_file is None:
+            return self.__entries
+
+        try:
+            with open(self.state_file, "r") as file:
+                data = json.load(file)
+                if isinstance(data, dict):
+                    return {k: v for k, v in data.items()
+                            if isinstance(v, dict) and isinstance(v.get("addresses"), dict) and isinstance(v.get("winners"), dict)}
+        except FileNotFoundError:
+            pass
+        except Exception as err:
+            logger.debug(f"Failed to read address book: {err}")
+
+        return {}
+
+    def __get_file_stamp(self):
+        # Lazy import to improve CLI performance
+        import os
+
+        assert self.state_file is not None
+        try:
+            stat = os.stat(self.state_file)
+            # Every update replaces the file, so the inode changes even within the mtime granularity
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    @contextlib.contextmanager
+    def __locked(self):
+        # Lazy import to improve CLI performance
+        import fcntl
+
+        # The state file itself is replaced on every update, so it cannot hold the lock
+        with open(f"{self.state_file}.lock", "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def __update_state_file(self, update: Callable[[dict[str, AddressBookEntry]], None]):
+        # Lazy import to improve CLI performance
+        import json
+        import os
+
+        if self.state_file is None:
+            update(self.__entries)
+            return
+
+        try:
+            # Other processes must not write back what they have read before this update
+            with self.__locked():
+                entries = self.__read_state_file()
+                update(entries)
+
+                tmp_file = f"{self.state_file}.{os.getpid()}"
+                with open(tmp_file, "w") as file:
+                    json.dump(entries, file)
+                os.replace(tmp_file, self.state_file)
+                self.__entries = entries
+                self.__file_stamp = self.__get_file_stamp()
+        except Exception as err:
+            logger.warning(f"Failed to update address book: {err}")
+
+    def __load(self):
+        if self.state_file is None:
+            return self.__entries
+
+        # Other processes might have learned something in the meantime, otherwise there is nothing to read
+        file_stamp = self.__get_file_stamp()
+        if file_stamp is None or file_stamp != self.__file_stamp:
+            self.__entries = self.__read_state_file()
+            self.__file_stamp = file_stamp
+        return self.__entries
+
+    @staticmethod
+    def __find_in(entries: dict[str, AddressBookEntry], address: str) -> tuple[Optional[str], Optional[AddressBookEntry]]:
+        for host_id, entry in entries.items():
+            if address in entry["addresses"]:
+                return host_id, entry
+        return None, None
+
+    def __find(self, address: str):
+        return self.__find_in(self.__load(), address)
+
+    def learn(self, host_id: str, addresses: list[str]):
+        now = self.now()
+
+        def update(entries: dict[str, AddressBookEntry]):
+            entry = entries.setdefault(host_id, AddressBookEntry({"addresses": {}, "winners": {}}))
+            entry["addresses"] = {k: v for k, v in entry["addresses"].items() if now - v < self.MAX_ADDRESS_AGE}
+            for address in addresses:
+                entry["addresses"][address] = now
+
+            # An address belongs to a single host, it might have been given to another one since
+            for other_id, other in list(entries.items()):
+                if other_id != host_id:
+                    other["addresses"] = {k: v for k, v in other["addresses"].items() if k not in addresses}
+                    if not other["addresses"]:
+                        del entries[other_id]
+
+        self.__update_state_file(update)
+
+    def candidates(self, address: str, port: int):
+        """
+        Returns the addresses the host (known by any of its addresses) can be reached at, the
+        last race winner first and then the given address.
+        """
+        _, entry = self.__find(address)
+        if entry is None:
+            return [address]
+
+        winner = self.__fresh_winner(entry, port)
+        first = [winner["address"]] if winner is not None else []
+        return list(dict.fromkeys(first + [address] + list(entry["addresses"])))
+
+    def __fresh_winner(self, entry: AddressBookEntry, port: int):
+        winner = entry["winners"].get(str(port))
+        if winner is None or not 0 <= self.now() - winner["measuredAt"] < self.WINNER_TTL:
+            return None
+        if winner["address"] not in entry["addresses"]:
+            return None
+        return winner
+
+    def get_winner(self, address: str, port: int):
+        _, entry = self.__find(address)
+        if entry is None:
+            return None
+
+        winner = self.__fresh_winner(entry, port)
+        # A winner that has since gone offline needs a new race
+        if winner is None or not get_circuit_breaker(winner["address"], port).allow():
+            return None
+        return winner
+
+    def set_winner(self, address: str, port: int, rtt: float):
+        _, entry = self.__find(address)
+        if entry is None:
+            return
+
+        winner = RaceWinner({"address": address, "rttMs": rtt * 1000, "measuredAt": self.now()})
+
+        def update(entries: dict[str, AddressBookEntry]):
+            _, entry = self.__find_in(entries, address)
+            if entry is not None:
+                entry["winners"][str(port)] = winner
+
+        self.__update_state_file(update)
+
+    def get_entries(self):
+        return dict(self.__load())
+
+
+async def race(candidates: list[str], port: int, timeout: float, delay: float) -> Optional[tuple[str, float]]:
+    """
+    Connects to the candidates one after another, `delay` apart (or as soon as the previous one
+    fails), and returns the first one to connect together with its connect time (happy eyeballs).
+    """
+    # Lazy import to improve CLI performance
+    import asyncio
+    import contextlib
+
+    loop = asyncio.get_running_loop()
+
+    async def connect(address: str):
+        started_at = loop.time()
+        try:
+            _, writer = await asyncio.open_connection(address, port)
+        except OSError:
+            # Refused or unreachable, either way there is no point in racing it again right away
+            get_circuit_breaker(address, port).record_failure()
+            raise
+        rtt = loop.time() - started_at
+        writer.close()
+        with contextlib.suppress(Exception):
+            await writer.wait_closed()
+        return address, rtt
+
+    remaining = list(candidates)
+    pending: set[asyncio.Task] = set()
+    try:
+        async with asyncio.timeout(timeout):
+            while remaining or pending:
+                if remaining:
+                    pending.add(asyncio.create_task(connect(remaining.pop(0))))
+
+                done, pending = await asyncio.wait(pending, timeout=delay if remaining else None, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    logger.debug(f"Failed to connect to {port} while racing: {task.exception()}")
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    return None
+
+
+# Resolving must not take much longer than connecting to the configured address would
+RACE_TIMEOUT = 2
+RACE_DELAY = 0.25
+
+_address_book: Optional[AddressBook] = None
+
+
+def get_address_book():
+    # Lazy import to improve CLI performance
+    from .constants import ADDRESS_BOOK_FILE
+
+    global _address_book
+    if _address_book is None:
+        _address_book = AddressBook(ADDRESS_BOOK_FILE)
+    return _address_book
+
+
+def learn_addresses(host_id: str, addresses: list[str]):
+    get_address_book().learn(host_id, addresses)
+
+
+async def resolve_address(address: str, port: int, timeout: float = RACE_TIMEOUT):
+    """
+    Returns the fastest address of the host for the port. Hosts with a single known
+    address are returned as they are, otherwise the addresses are raced and the winner
+    is used until it gets stale or goes offline. The race draws from the current deadline.
+    """
+    # Lazy import to improve CLI performance
+    import asyncio
+
+    book = get_address_book()
+    winner = book.get_winner(address, port)
+    if winner is not None:
+        return winner["address"]
+
+    candidates = [candidate for candidate in book.candidates(address, port) if get_circuit_breaker(candidate, port).allow()]
+    if len(candidates) < 2:
+        return address
+
+    try:
+        race_timeout = remaining(min(timeout, RACE_TIMEOUT))
+    except asyncio.TimeoutError:
+        # Nothing left to race with, the request is going to fail anyway
+        return address
+
+    result = await race(candidates, port, race_timeout, RACE_DELAY)
+    if result is None:
+        logger.debug(f"None of {candidates} is reachable on {port}")
+        return address
+
+    winner_address, rtt = result
+    if winner_address != address:
+        logger.info(f"Using {winner_address} instead of {address} for port {port} (connected in {rtt * 1000:.1f} ms)")
+    book.set_winner(winner_address, port, rtt)
+    return winner_address
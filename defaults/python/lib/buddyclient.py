@@ -2,10 +2,18 @@ import contextlib
 from . import constants
 
 from enum import Enum
-from typing import Any, AsyncGenerator, Awaitable, Type, overload
-from .buddyrequests import BuddyRequests, PairingState, PcState, BuddyException
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Awaitable, Optional, Type, TypedDict, overload
+from .buddyrequests import ApiVersionResponse, BuddyRequests, CurrentUserResponse, HostInfoResponse, PairingState, PairingStateResponse, PcState, PcStateResponse, SteamUiModeResponse, StreamedAppDataResponse, StreamStateResponse, BuddyException
+from .circuitbreaker import CircuitOpenError
+from .deadline import deadline
+from .hellocache import HelloCache
 from .utils import T, T1, T2, T3
 
+if TYPE_CHECKING:
+    import aiohttp
+    from .buddytraffic import TrafficRecorder
+    from .notificationhub import NotificationHub
+
 
 class HelloResult(Enum):
     SslVerificationFailed = "SSL certificate could not be verified!"
@@ -121,16 +129,45 @@ class GetCurrentUserResult(Enum):
     Failed = "Failed to get current user id via Buddy!"
 
 
+class SnapshotResult(Enum):
+    Failed = "Failed to get state snapshot via Buddy!"
+
+
+class StateEndpoint(Enum):
+    SteamUiMode = 0
+    CurrentUser = 1
+    StreamState = 2
+    StreamedAppData = 3
+    HostInfo = 4
+    PcState = 5
+
+
+class StateSnapshot(TypedDict):
+    # Wall clock time of when all of the responses were in
+    timestamp: float
+    steam_ui_mode: Optional[SteamUiModeResponse]
+    current_user: Optional[CurrentUserResponse]
+    stream_state: Optional[StreamStateResponse]
+    streamed_app_data: Optional[StreamedAppDataResponse]
+    host_info: Optional[HostInfoResponse]
+    pc_state: Optional[PcStateResponse]
+
+
 class BuddyClient(contextlib.AbstractAsyncContextManager):
 
     CAN_BE_ABORTED_STATES = [HelloResult.Restarting, HelloResult.ShuttingDown, HelloResult.Suspending, HelloResult.Hibernating]
 
-    def __init__(self, address: str, port: int, client_id: str, timeout: float) -> None:
+    def __init__(self, address: str, port: int, client_id: str, timeout: float, session: Optional["aiohttp.ClientSession"] = None, hello_cache: Optional[HelloCache] = None, concurrent_hello: bool = True, notification_hub: Optional["NotificationHub"] = None, recorder: Optional["TrafficRecorder"] = None,
+                 notification_heartbeat: Optional[float] = constants.NOTIFICATION_HEARTBEAT) -> None:
         super().__init__()
         self.__address = address
         self.__port = port
-        self.__requests = BuddyRequests(address, port, client_id, timeout)
+        self.__requests = BuddyRequests(address, port, client_id, timeout, session=session, notification_hub=notification_hub, recorder=recorder,
+                                        notification_heartbeat=notification_heartbeat)
         self.__hello_was_ok = False
+        self.__hello_cache = hello_cache
+        self.__hello_cache_key = HelloCache.make_key(address, port, client_id) if hello_cache else ""
+        self.__concurrent_hello = concurrent_hello
 
     @property
     def address(self):
@@ -151,34 +188,50 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
     async def __aexit__(self, *args):
         return await self.__requests.__aexit__(*args)
 
+    def __invalidate_hello_cache(self):
+        if self.__hello_cache:
+            self.__hello_cache.invalidate(self.__hello_cache_key)
+
+    def __invalidate_hello(self):
+        # Host or pairing state is about to change, hello must be redone
+        self.__hello_was_ok = False
+        self.__invalidate_hello_cache()
+
     async def _try_request(self, request: Awaitable[T], default_error_value: Enum):
         # Lazy import to improve CLI performance
         import asyncio
         import aiohttp
 
         try:
-            return await request
-        
-        except asyncio.TimeoutError as e:
-            raise BuddyException(default_error_value)
-        except aiohttp.ClientSSLError as e:
-            raise BuddyException(HelloResult.SslVerificationFailed)
-        except (aiohttp.ServerConnectionError, aiohttp.ClientConnectorError, aiohttp.ClientResponseError) as e:
-            raise BuddyException(default_error_value)
+            try:
+                # Every request of the operation (including the hello) draws from the same budget
+                with deadline(self.__requests.timeout):
+                    return await request
+            
+            except asyncio.TimeoutError as e:
+                raise BuddyException(default_error_value)
+            except aiohttp.ClientSSLError as e:
+                raise BuddyException(HelloResult.SslVerificationFailed)
+            except (aiohttp.ServerConnectionError, aiohttp.ClientConnectorError, aiohttp.ClientResponseError, CircuitOpenError) as e:
+                raise BuddyException(default_error_value)
+
+        except Exception:
+            # Whatever we knew about the host can no longer be trusted
+            self.__invalidate_hello_cache()
+            raise
 
     async def say_hello(self, force=False):
-        async def request():
-            resp = await self.__requests.get_api_version()
+        def check_api_version(resp: ApiVersionResponse):
             if resp["version"] != constants.BUDDY_API_VERSION:
                 raise BuddyException(HelloResult.VersionMismatch)
 
-            resp = await self.__requests.get_pairing_state()
+        def check_pairing_state(resp: PairingStateResponse):
             if resp["state"] == PairingState.NotPaired:
                 raise BuddyException(HelloResult.NotPaired)
             elif resp["state"] == PairingState.Pairing:
                 raise BuddyException(HelloResult.Pairing)
 
-            resp = await self.__requests.get_pc_state()
+        def check_pc_state(resp: PcStateResponse):
             if resp["state"] == PcState.Restarting:
                 raise BuddyException(HelloResult.Restarting)
             elif resp["state"] == PcState.ShuttingDown:
@@ -189,14 +242,55 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
                 raise BuddyException(HelloResult.Hibernating)
             elif resp["state"] == PcState.Transient:
                 raise BuddyException(HelloResult.Offline)
+
+        async def request():
+            check_api_version(await self.__requests.get_api_version())
+            check_pairing_state(await self.__requests.get_pairing_state())
+            check_pc_state(await self.__requests.get_pc_state())
+
+        async def concurrent_request():
+            # Lazy import to improve CLI performance
+            import asyncio
+
+            tasks = [asyncio.create_task(self.__requests.get_api_version()),
+                     asyncio.create_task(self.__requests.get_pairing_state()),
+                     asyncio.create_task(self.__requests.get_pc_state())]
+            try:
+                # Results are checked in the same order as the sequential requests
+                # are made to keep the same error precedence
+                check_api_version(await tasks[0])
+                check_pairing_state(await tasks[1])
+                check_pc_state(await tasks[2])
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
             
-        if self.__hello_was_ok and not force:
-            return
+        if not force:
+            if self.__hello_was_ok:
+                return
+
+            if self.__hello_cache and self.__hello_cache.is_valid(self.__hello_cache_key):
+                self.__hello_was_ok = True
+                return
 
         self.__hello_was_ok = False
-        await self._try_request(request(), HelloResult.Offline)
+        await self._try_request(concurrent_request() if self.__concurrent_hello else request(), HelloResult.Offline)
         self.__hello_was_ok = True
 
+        if self.__hello_cache:
+            self.__hello_cache.mark_ok(self.__hello_cache_key)
+
+    async def refresh_hello(self):
+        """
+        Redoes the hello once the shared hello cache has expired, so that a long-lived client
+        notices the PC state and pairing changes, which are not notified.
+        """
+        if self.__hello_cache and self.__hello_cache.is_valid(self.__hello_cache_key):
+            return
+
+        await self.say_hello(force=True)
+
     async def start_pairing(self, pin: int):
         async def request():
             try:
@@ -209,6 +303,7 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
             resp = await self.__requests.post_start_pairing(pin)
             if not resp["result"]:
                 raise BuddyException(PairingResult.BuddyRefused)
+            self.__invalidate_hello()
 
         return await self._try_request(request(), PairingResult.Failed)
 
@@ -224,6 +319,7 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
             resp = await self.__requests.post_abort_pairing()
             if not resp["result"]:
                 raise BuddyException(AbortPairingResult.BuddyRefused)
+            self.__invalidate_hello()
 
         return await self._try_request(request(), AbortPairingResult.Failed)
 
@@ -276,6 +372,7 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
             resp = await self.__requests.post_restart_host(delay_s)
             if not resp["result"]:
                 raise BuddyException(RestartHostResult.BuddyRefused)
+            self.__invalidate_hello()
 
         return await self._try_request(request(), RestartHostResult.Failed)
     
@@ -285,6 +382,7 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
             resp = await self.__requests.post_shutdown_host(delay_s)
             if not resp["result"]:
                 raise BuddyException(ShutdownHostResult.BuddyRefused)
+            self.__invalidate_hello()
 
         return await self._try_request(request(), ShutdownHostResult.Failed)
     
@@ -294,6 +392,7 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
             resp = await self.__requests.post_suspend_host(delay_s)
             if not resp["result"]:
                 raise BuddyException(SuspendHostResult.BuddyRefused)
+            self.__invalidate_hello()
 
         return await self._try_request(request(), SuspendHostResult.Failed)
     
@@ -303,6 +402,7 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
             resp = await self.__requests.post_hibernate_host(delay_s)
             if not resp["result"]:
                 raise BuddyException(HibernateHostResult.BuddyRefused)
+            self.__invalidate_hello()
 
         return await self._try_request(request(), HibernateHostResult.Failed)
     
@@ -318,6 +418,7 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
             resp = await self.__requests.post_abort_host_state_change()
             if not resp["result"]:
                 raise BuddyException(AbortHostStateChangeResult.BuddyRefused)
+            self.__invalidate_hello()
 
         return await self._try_request(request(), AbortHostStateChangeResult.Failed)
 
@@ -390,12 +491,54 @@ class BuddyClient(contextlib.AbstractAsyncContextManager):
 
         return await self._try_request(request(), GetCurrentUserResult.Failed)
     
+    async def snapshot(self, *endpoints: StateEndpoint) -> StateSnapshot:
+        """
+        Gets the state from all of the endpoints at once, the endpoints that were not asked for are None.
+        """
+        async def request():
+            # Lazy import to improve CLI performance
+            import asyncio
+            import time
+
+            requests = {
+                StateEndpoint.SteamUiMode: self.__requests.get_steam_ui_mode,
+                StateEndpoint.CurrentUser: self.__requests.get_current_user,
+                StateEndpoint.StreamState: self.__requests.get_stream_state,
+                StateEndpoint.StreamedAppData: self.__requests.get_streamed_app_data,
+                StateEndpoint.HostInfo: self.__requests.get_host_info,
+                StateEndpoint.PcState: self.__requests.get_pc_state,
+            }
+
+            # The hello is mostly cached, otherwise there's no need to wait for it before asking for the rest
+            hello_task = asyncio.ensure_future(self.say_hello())
+            tasks = {endpoint: asyncio.ensure_future(requests[endpoint]()) for endpoint in dict.fromkeys(endpoints)}
+            try:
+                # Same error precedence as when the hello is done first
+                await hello_task
+                results: dict[StateEndpoint, Any] = {endpoint: await task for endpoint, task in tasks.items()}
+            finally:
+                for task in [hello_task, *tasks.values()]:
+                    task.cancel()
+                await asyncio.gather(hello_task, *tasks.values(), return_exceptions=True)
+
+            return StateSnapshot({
+                "timestamp": time.time(),
+                "steam_ui_mode": results.get(StateEndpoint.SteamUiMode),
+                "current_user": results.get(StateEndpoint.CurrentUser),
+                "stream_state": results.get(StateEndpoint.StreamState),
+                "streamed_app_data": results.get(StateEndpoint.StreamedAppData),
+                "host_info": results.get(StateEndpoint.HostInfo),
+                "pc_state": results.get(StateEndpoint.PcState)
+            })
+
+        return await self._try_request(request(), SnapshotResult.Failed)
+
     @overload
-    async def notify_on_changes(self, t1: Type[T1], /) -> AsyncGenerator[tuple[T1], None]: ...
+    async def notify_on_changes(self, t1: Type[T1], /, *, changes_only: bool = False) -> AsyncGenerator[tuple[T1], None]: ...
     @overload
-    async def notify_on_changes(self, t1: Type[T1], t2: Type[T2], /) -> AsyncGenerator[tuple[T1, T2], None]: ...
+    async def notify_on_changes(self, t1: Type[T1], t2: Type[T2], /, *, changes_only: bool = False) -> AsyncGenerator[tuple[T1, T2], None]: ...
     @overload
-    async def notify_on_changes(self, t1: Type[T1], t2: Type[T2], t3: Type[T3], /) -> AsyncGenerator[tuple[T1, T2, T3], None]: ...
-    async def notify_on_changes(self, *topic_types: Type[Any]) -> AsyncGenerator[tuple[Any, ...], None]:
+    async def notify_on_changes(self, t1: Type[T1], t2: Type[T2], t3: Type[T3], /, *, changes_only: bool = False) -> AsyncGenerator[tuple[T1, T2, T3], None]: ...
+    async def notify_on_changes(self, *topic_types: Type[Any], changes_only: bool = False) -> AsyncGenerator[tuple[Any, ...], None]:
         await self.say_hello()
-        return self.__requests.notify_on_changes(*topic_types)
+        return self.__requests.notify_on_changes(*topic_types, changes_only=changes_only)
@@ -1,10 +1,19 @@
 import contextlib
-from . import utils
+from . import constants, utils
+from .addressbook import url_host
 from .logger import logger
+from .circuitbreaker import CircuitOpenError, get_circuit_breaker, is_offline_error
+from .deadline import remaining
+from .rttestimator import get_rtt_estimator
 
-from typing import Any, AsyncGenerator, List, Literal, Optional, Type, TypedDict, overload
+from typing import TYPE_CHECKING, Any, AsyncGenerator, List, Literal, Optional, Type, TypedDict, overload
 from enum import Enum
 
+if TYPE_CHECKING:
+    import aiohttp
+    from .buddytraffic import TrafficRecorder
+    from .notificationhub import NotificationHub
+
 
 class PairingState(Enum):
     Paired = 0
@@ -120,48 +129,187 @@ class BuddyException(Exception):
         self.result = result
 
 
+_get_single_flight = utils.SingleFlight()
+
+# How much a request's timeout can be cut by the operation's budget and still count as timing out on its own
+DEADLINE_SLACK = 0.05
+
+
+def get_single_flight_stats():
+    return _get_single_flight.stats
+
+
 class BuddyRequests(contextlib.AbstractAsyncContextManager):
 
-    def __init__(self, address: str, port: int, client_id: str, timeout: float) -> None:
+    def __init__(self, address: str, port: int, client_id: str, timeout: float, session: Optional["aiohttp.ClientSession"] = None, notification_hub: Optional["NotificationHub"] = None, recorder: Optional["TrafficRecorder"] = None,
+                 notification_heartbeat: Optional[float] = constants.NOTIFICATION_HEARTBEAT) -> None:
         super().__init__()
         
+        # Lazy import to improve CLI performance
+        import aiohttp
+
+        self.base_url = f"https://{url_host(address)}:{port}"
+        self.client_id = client_id
+        self.__timeout = aiohttp.ClientTimeout(total=0.1 if timeout <= 0 else timeout)
+        self.__rtt_estimator = get_rtt_estimator(address, port)
+        self.__circuit_breaker = get_circuit_breaker(address, port)
+        self.__address = address
+        self.__port = port
+        self.__owns_session = session is None
+        self.__session = session or self.create_session(client_id, timeout=self.__timeout)
+        self.__owns_notification_hub = notification_hub is None
+        self.__changed_at: Optional[float] = None
+        self.__notification_hub = notification_hub
+        self.__notification_heartbeat = notification_heartbeat
+        self.__recorder = recorder
+
+    @property
+    def timeout(self) -> float:
+        return self.__timeout.total or 0
+
+    @staticmethod
+    def create_session(client_id: str, timeout: Optional["aiohttp.ClientTimeout"] = None, keepalive_timeout: Optional[float] = None, cafile: Optional[str] = None):
         # Lazy import to improve CLI performance
         import aiohttp
         import base64
         import pathlib
-        import ssl
+        from .tlscache import create_trace_config, get_ssl_context
 
         headers = {"authorization": f"basic {base64.b64encode(client_id.encode('utf-8')).decode('utf-8')}"}
-        cafile = str(pathlib.Path(__file__).parent.joinpath("..", "ssl", "moondeck_cert.pem").resolve())
-        ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=cafile)
-        ssl_context.check_hostname = False
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
+        cafile = cafile or str(pathlib.Path(__file__).parent.joinpath("..", "ssl", "moondeck_cert.pem").resolve())
+        ssl_context = get_ssl_context(cafile)
+        connector = aiohttp.TCPConnector(ssl=ssl_context) if keepalive_timeout is None \
+                    else aiohttp.TCPConnector(ssl=ssl_context, keepalive_timeout=keepalive_timeout)
 
-        self.base_url = f"https://{address}:{port}"
-        self.client_id = client_id
-        self.__session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=0.1 if timeout <= 0 else timeout), 
+        return aiohttp.ClientSession(
+            timeout=timeout or aiohttp.ClientTimeout(total=None),
             raise_for_status=True, 
             headers=headers,
-            connector=connector
+            connector=connector,
+            trace_configs=[create_trace_config()]
         )
 
     async def __aenter__(self):
-        await self.__session.__aenter__()
+        if self.__owns_session:
+            await self.__session.__aenter__()
         return self
 
     async def __aexit__(self, *args):
-        return await self.__session.__aexit__(*args)
+        if self.__owns_notification_hub and self.__notification_hub is not None:
+            await self.__notification_hub.close()
+            self.__notification_hub = None
+        if self.__owns_session:
+            return await self.__session.__aexit__(*args)
+
+    def __get_timeouts(self, adaptive_timeout: bool):
+        # The configured timeout is only the ceiling for the requests that are answered right away
+        intended_timeout = self.__rtt_estimator.timeout(self.timeout) if adaptive_timeout else self.timeout
+        # The operation's deadline might leave less than that
+        return intended_timeout, remaining(intended_timeout)
+
+    async def __fetch(self, method: str, path: str, json: Any, adaptive_timeout: bool) -> bytes:
+        # Lazy import to improve CLI performance
+        import aiohttp
+        import asyncio
+        import json as jsonlib
+        import time
+        from .requeststats import record
+
+        intended_timeout, request_timeout = self.__get_timeouts(adaptive_timeout)
+        timeout = aiohttp.ClientTimeout(total=request_timeout)
+        # Running out of the operation's budget says nothing about the host
+        measured_timeout = adaptive_timeout and intended_timeout - request_timeout < DEADLINE_SLACK
+
+        # Path parameters (like the client id) are not part of the endpoint
+        endpoint = f"{method} /{path.split('/')[1]}"
+        if not self.__circuit_breaker.allow():
+            record(endpoint, None, error=CircuitOpenError(self.__address, self.__port))
+            raise CircuitOpenError(self.__address, self.__port)
+
+        bytes_sent = len(jsonlib.dumps(json)) if json is not None else 0
+        bytes_received = 0
+        started_at = time.perf_counter()
+        try:
+            async with self.__session.request(method, f"{self.base_url}{path}", json=json, timeout=timeout) as resp:
+                # The body is decoded by the caller straight from the bytes
+                body = await resp.read()
+                bytes_received = len(body)
+                if resp.content_type != "application/json":
+                    raise aiohttp.ContentTypeError(resp.request_info, resp.history, status=resp.status,
+                                                   message=f"Attempt to decode JSON with unexpected mimetype: {resp.content_type}",
+                                                   headers=resp.headers)
+        except Exception as err:
+            if measured_timeout and isinstance(err, asyncio.TimeoutError):
+                self.__rtt_estimator.on_timeout()
+            if is_offline_error(err):
+                # Slow requests that time out say nothing about the host being down
+                if measured_timeout or not isinstance(err, asyncio.TimeoutError):
+                    self.__circuit_breaker.record_failure()
+            else:
+                # Something has answered
+                self.__circuit_breaker.record_success()
+            record(endpoint, time.perf_counter() - started_at, bytes_sent, bytes_received, error=err)
+            self.__record_exchange(method, path, json, time.perf_counter() - started_at, error=err)
+            raise
+
+        elapsed = time.perf_counter() - started_at
+        self.__circuit_breaker.record_success()
+        if adaptive_timeout:
+            self.__rtt_estimator.add_sample(elapsed)
+        record(endpoint, elapsed, bytes_sent, bytes_received)
+        self.__record_exchange(method, path, json, elapsed, body=body)
+        return body
+
+    def __record_exchange(self, method: str, path: str, json: Any, elapsed: float, body: Optional[bytes] = None, error: Optional[BaseException] = None):
+        if self.__recorder is None:
+            return
+
+        # Lazy import to improve CLI performance
+        import json as jsonlib
+        from .buddytraffic import redact
+
+        # Only the parameters of the queries are needed for the replay, the bodies of the other requests might contain secrets
+        params = redact(json, self.client_id) if method == "GET" else None
+        data = jsonlib.loads(body) if body is not None else None
+        self.__recorder.record_request(method, redact(path, self.client_id), params, elapsed, data=data, error=error)
+
+    async def __request(self, method: str, path: str, output_type: Type[utils.T], json: Any = None, adaptive_timeout: Optional[bool] = None) -> utils.T:
+        # Buddy might do some work before answering the mutating requests, so they can use the whole timeout
+        adaptive_timeout = method == "GET" if adaptive_timeout is None else adaptive_timeout
+
+        if method != "GET":
+            # Lazy import to improve CLI performance
+            import time
+
+            # Mutating requests must always reach Buddy
+            body = await self.__fetch(method, path, json, adaptive_timeout)
+            self.__changed_at = time.monotonic()
+        else:
+            # Lazy import to improve CLI performance
+            import asyncio
+            import json as jsonlib
+
+            params = jsonlib.dumps(json, sort_keys=True) if json is not None else None
+            key = (method, self.base_url, path, self.client_id, params)
+
+            # A request cut short by its operation's deadline is not shared with the callers that can wait longer
+            intended_timeout, request_timeout = self.__get_timeouts(adaptive_timeout)
+            gives_up_at = None
+            if intended_timeout - request_timeout >= DEADLINE_SLACK:
+                gives_up_at = asyncio.get_running_loop().time() + request_timeout
+
+            # Every caller still waits with its own timeout
+            async with asyncio.timeout(remaining(self.timeout)):
+                body = await _get_single_flight.run(key, lambda: self.__fetch(method, path, json, adaptive_timeout), gives_up_at)
+
+        # Responses are only ever read, so the callers (and the polls getting the same answer) can share the result
+        return utils.from_json(output_type, body)
 
     async def get_api_version(self):
-        async with self.__session.get(f"{self.base_url}/apiVersion") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ApiVersionResponse, data)
+        return await self.__request("GET", "/apiVersion", ApiVersionResponse)
 
     async def get_pairing_state(self):
-        async with self.__session.get(f"{self.base_url}/pairingState/{self.client_id}") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(PairingStateResponse, data)
+        return await self.__request("GET", f"/pairingState/{self.client_id}", PairingStateResponse)
 
     async def post_start_pairing(self, pin: int):
         # Lazy import to improve CLI performance
@@ -172,23 +320,17 @@ class BuddyRequests(contextlib.AbstractAsyncContextManager):
             "hashed_id": base64.b64encode((self.client_id + str(pin)).encode("utf-8")).decode("utf-8")
         }
 
-        async with self.__session.post(f"{self.base_url}/pair", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/pair", ResultLikeResponse, json=data)
 
     async def post_abort_pairing(self):
         data = {
             "id": self.client_id
         }
 
-        async with self.__session.post(f"{self.base_url}/abortPairing", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/abortPairing", ResultLikeResponse, json=data)
 
     async def get_steam_ui_mode(self):
-        async with self.__session.get(f"{self.base_url}/steamUiMode") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(SteamUiModeResponse, data)
+        return await self.__request("GET", "/steamUiMode", SteamUiModeResponse)
 
     async def post_launch_steam(self, big_picture_mode: bool, username: Optional[str]):
         data = {
@@ -196,164 +338,106 @@ class BuddyRequests(contextlib.AbstractAsyncContextManager):
             "username": username
         }
 
-        async with self.__session.post(f"{self.base_url}/launchSteam", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/launchSteam", ResultLikeResponse, json=data)
 
     async def post_launch_steam_app(self, app_id: str):
         data = {
             "app_id": app_id
         }
 
-        async with self.__session.post(f"{self.base_url}/launchSteamApp", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/launchSteamApp", ResultLikeResponse, json=data)
 
     async def post_close_steam(self, keep_stream_alive: bool):
         data = {
             "keep_stream_alive": keep_stream_alive
         }
 
-        async with self.__session.post(f"{self.base_url}/closeSteam", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/closeSteam", ResultLikeResponse, json=data)
         
     async def post_close_steam_big_picture_mode(self):
-        async with self.__session.post(f"{self.base_url}/closeSteamBigPictureMode") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/closeSteamBigPictureMode", ResultLikeResponse)
 
     async def get_pc_state(self):
-        async with self.__session.get(f"{self.base_url}/pcState") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(PcStateResponse, data)
+        return await self.__request("GET", "/pcState", PcStateResponse)
         
     async def post_restart_host(self, delay_s: int):
         data = {
             "delay": delay_s
         }
 
-        async with self.__session.post(f"{self.base_url}/restartHost", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/restartHost", ResultLikeResponse, json=data)
         
     async def post_shutdown_host(self, delay_s: int):
         data = {
             "delay": delay_s
         }
 
-        async with self.__session.post(f"{self.base_url}/shutdownHost", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/shutdownHost", ResultLikeResponse, json=data)
         
     async def post_suspend_host(self, delay_s: int):
         data = {
             "delay": delay_s
         }
 
-        async with self.__session.post(f"{self.base_url}/suspendHost", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/suspendHost", ResultLikeResponse, json=data)
         
     async def post_hibernate_host(self, delay_s: int):
         data = {
             "delay": delay_s
         }
 
-        async with self.__session.post(f"{self.base_url}/hibernateHost", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/hibernateHost", ResultLikeResponse, json=data)
         
     async def post_abort_host_state_change(self):
-        async with self.__session.post(f"{self.base_url}/abortHostStateChange") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/abortHostStateChange", ResultLikeResponse)
 
     async def get_host_info(self):
-        async with self.__session.get(f"{self.base_url}/hostInfo") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(HostInfoResponse, data)
+        return await self.__request("GET", "/hostInfo", HostInfoResponse)
         
     async def get_stream_state(self):
-        async with self.__session.get(f"{self.base_url}/streamState") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(StreamStateResponse, data)
+        return await self.__request("GET", "/streamState", StreamStateResponse)
 
     async def get_streamed_app_data(self):
-        async with self.__session.get(f"{self.base_url}/streamedAppData") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(StreamedAppDataResponse, data)
+        return await self.__request("GET", "/streamedAppData", StreamedAppDataResponse)
         
     async def get_app_data(self, app_id: str):
         data = {
             "app_id": app_id
         }
 
-        async with self.__session.get(f"{self.base_url}/appData", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(AppDataResponse, data)
+        return await self.__request("GET", "/appData", AppDataResponse, json=data)
         
     async def post_clear_streamed_app_data(self):
-        async with self.__session.post(f"{self.base_url}/clearStreamedAppData") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/clearStreamedAppData", ResultLikeResponse)
 
     async def post_end_stream(self):
-        async with self.__session.post(f"{self.base_url}/endStream") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(ResultLikeResponse, data)
+        return await self.__request("POST", "/endStream", ResultLikeResponse)
     
     async def get_game_stream_app_names(self):
-        async with self.__session.get(f"{self.base_url}/gameStreamAppNames") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(GameStreamAppNamesResponse, data)
+        return await self.__request("GET", "/gameStreamAppNames", GameStreamAppNamesResponse, adaptive_timeout=False)
 
     async def get_non_steam_app_data(self, user_id: str):
         data = {
             "user_id": user_id
         }
 
-        async with self.__session.get(f"{self.base_url}/nonSteamAppData", json=data) as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(NonSteamAppDataResponse, data)
+        return await self.__request("GET", "/nonSteamAppData", NonSteamAppDataResponse, json=data, adaptive_timeout=False)
         
     async def get_current_user(self):
-        async with self.__session.get(f"{self.base_url}/currentUser") as resp:
-            data = await resp.json(encoding="utf-8")
-            return utils.from_dict(CurrentUserResponse, data)
+        return await self.__request("GET", "/currentUser", CurrentUserResponse)
         
     @overload
-    def notify_on_changes(self, t1: Type[utils.T1], /) -> AsyncGenerator[tuple[utils.T1], None]: ...
+    def notify_on_changes(self, t1: Type[utils.T1], /, *, changes_only: bool = False) -> AsyncGenerator[tuple[utils.T1], None]: ...
     @overload
-    def notify_on_changes(self, t1: Type[utils.T1], t2: Type[utils.T2], /) -> AsyncGenerator[tuple[utils.T1, utils.T2], None]: ...
+    def notify_on_changes(self, t1: Type[utils.T1], t2: Type[utils.T2], /, *, changes_only: bool = False) -> AsyncGenerator[tuple[utils.T1, utils.T2], None]: ...
     @overload
-    def notify_on_changes(self, t1: Type[utils.T1], t2: Type[utils.T2], t3: Type[utils.T3], /) -> AsyncGenerator[tuple[utils.T1, utils.T2, utils.T3], None]: ...
-    async def notify_on_changes(self, *topic_types: Type[Any]) -> AsyncGenerator[tuple[Any, ...], None]:
+    def notify_on_changes(self, t1: Type[utils.T1], t2: Type[utils.T2], t3: Type[utils.T3], /, *, changes_only: bool = False) -> AsyncGenerator[tuple[utils.T1, utils.T2, utils.T3], None]: ...
+    def notify_on_changes(self, *topic_types: Type[Any], changes_only: bool = False) -> AsyncGenerator[tuple[Any, ...], None]:
         # Lazy import to improve CLI performance
-        import aiohttp
-
-        topic_mapping = {
-            StreamedAppDataResponse: "StreamedAppData",
-            SteamUiModeResponse: "SteamUiMode",
-            CurrentUserResponse: "CurrentUser",
-            StreamStateResponse: "StreamState",
-        }
-        topics = [topic_mapping[topic_type] for topic_type in topic_types]
-
-        async with self.__session.ws_connect(f"{self.base_url}/notifyOnChanges") as ws:
-            await ws.send_json(topics)
-            response = utils.from_dict(ResultLikeResponse, await ws.receive_json())
-
-            if not response["result"]:
-                raise BuddyException(NotifyOnChangesResult.BuddyRefused)
-
-            async for msg in ws:
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    items = msg.json()
-                    yield tuple(utils.from_dict(topic_type, item) for topic_type, item in zip(topic_types, items))
-                else:
-                    logger.error(f"Unexpected WebSocket message: {msg}")
-                    raise BuddyException(NotifyOnChangesResult.UnexpectedMessageType)
+        from .notificationhub import NotificationHub
 
-            if ws.closed:
-                raise BuddyException(NotifyOnChangesResult.WebSocketClosed)
+        if self.__notification_hub is None:
+            self.__notification_hub = NotificationHub(self.__session, self.base_url, recorder=self.__recorder,
+                                                      heartbeat=self.__notification_heartbeat,
+                                                      breaker_key=(self.__address, self.__port))
+        return self.__notification_hub.subscribe(topic_types, self.timeout, self.__changed_at, changes_only)
@@ -0,0 +1,354 @@
+from typing import TYPE_CHECKING, Any, Optional, TypedDict
+from .logger import logger
+
+if TYPE_CHECKING:
+    import aiohttp
+    import asyncio
+
+
+CAPTURE_VERSION = 1
+CLIENT_ID_PLACEHOLDER = "{client_id}"
+
+
+class CaptureEntry(TypedDict, total=False):
+    # Kind: "http" exchange, "ws" subscription, "msg" WebSocket frame or "end" of the WebSocket
+    k: str
+    # Start of the exchange in seconds since the capture has started
+    t: float
+    # Duration of the exchange in seconds
+    d: float
+    # HTTP method
+    m: str
+    # Request path or the subscribed topics
+    p: Any
+    # Request parameters
+    q: Any
+    # Response, ack or the frame
+    r: Any
+    # Error type name and the HTTP status if any
+    e: str
+    c: Optional[int]
+    # WebSocket stream id
+    s: int
+
+
+def redact(value: Any, client_id: str) -> Any:
+    # The client id is a secret, so don't store it as is
+    if isinstance(value, str):
+        return value.replace(client_id, CLIENT_ID_PLACEHOLDER) if client_id else value
+    if isinstance(value, list):
+        return [redact(item, client_id) for item in value]
+    if isinstance(value, dict):
+        return {key: redact(item, client_id) for key, item in value.items()}
+    return value
+
+
+class TrafficRecorder:
+    """
+    Captures the Buddy traffic - every request, response, WebSocket frame and their timing - to
+    a JSON lines file that can later be fed back to the client via `ReplaySession`.
+    """
+
+    def __init__(self, path: str):
+        # Lazy import to improve CLI performance
+        import time
+
+        self.path = path
+        self.__started_at = time.monotonic()
+        self.__streams = 0
+        self.__file = open(path, "w", encoding="utf-8")
+        self.__write({"v": CAPTURE_VERSION, "time": time.time()})
+
+    def __now(self):
+        # Lazy import to improve CLI performance
+        import time
+
+        return time.monotonic() - self.__started_at
+
+    def __write(self, entry: Any):
+        # Lazy import to improve CLI performance
+        import json
+
+        if self.__file.closed:
+            return
+
+        try:
+            self.__file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            # The captures are for the runs that go wrong, so don't lose anything to a crash
+            self.__file.flush()
+        except Exception as err:
+            logger.debug(f"Failed to write traffic capture: {err}")
+
+    @staticmethod
+    def __error(entry: CaptureEntry, error: Optional[BaseException]):
+        if error is not None:
+            entry["e"] = type(error).__name__
+            entry["c"] = getattr(error, "status", None)
+        return entry
+
+    def record_request(self, method: str, path: str, params: Any, elapsed: float, data: Any = None, error: Optional[BaseException] = None):
+        now = self.__now()
+        entry = CaptureEntry({"k": "http", "t": round(now - elapsed, 4), "d": round(elapsed, 4), "m": method, "p": path})
+        if params is not None:
+            entry["q"] = params
+        if error is None:
+            entry["r"] = data
+        self.__write(self.__error(entry, error))
+
+    def record_subscription(self, topics: list[str], elapsed: float, ack: Any = None, error: Optional[BaseException] = None) -> int:
+        now = self.__now()
+        self.__streams += 1
+        entry = CaptureEntry({"k": "ws", "t": round(now - elapsed, 4), "d": round(elapsed, 4), "p": topics, "s": self.__streams})
+        if error is None:
+            entry["r"] = ack
+        self.__write(self.__error(entry, error))
+        return self.__streams
+
+    def record_message(self, stream: int, data: Any):
+        self.__write(CaptureEntry({"k": "msg", "t": round(self.__now(), 4), "s": stream, "r": data}))
+
+    def record_end(self, stream: int):
+        self.__write(CaptureEntry({"k": "end", "t": round(self.__now(), 4), "s": stream}))
+
+    def close(self):
+        self.__file.close()
+
+
+def read_capture(path: str) -> list[CaptureEntry]:
+    # Lazy import to improve CLI performance
+    import json
+
+    with open(path, "r", encoding="utf-8") as file:
+        lines = [json.loads(line) for line in file if line.strip()]
+
+    if not lines or lines[0].get("v") != CAPTURE_VERSION:
+        raise ValueError(f"Unsupported traffic capture: {path}")
+    return lines[1:]
+
+
+def _replay_error(entry: CaptureEntry, method: str, url: str) -> BaseException:
+    # Lazy import to improve CLI performance
+    import aiohttp
+    import asyncio
+    import multidict
+    import yarl
+
+    if entry.get("c") is not None:
+        request_info = aiohttp.RequestInfo(yarl.URL(url), method, multidict.CIMultiDictProxy(multidict.CIMultiDict()))
+        return aiohttp.ClientResponseError(request_info, (), status=entry["c"] or 0, message=entry["e"])
+    if "Timeout" in entry["e"]:
+        return asyncio.TimeoutError()
+    return aiohttp.ClientConnectionError(f"Replayed {entry['e']}")
+
+
+class ReplaySession:
+    """
+    Stands in for the `aiohttp.ClientSession` of `BuddyClient` and answers from a traffic capture,
+    either at the recorded speed (scaled by `speed`) or as fast as possible (`speed` is None).
+
+    Requests are matched by their method, path and parameters and are answered in the recorded
+    order. WebSocket frames are only sent once every state changing request that was made before
+    them has been replayed, so that the client sees the changes in the same order no matter the speed.
+    """
+
+    def __init__(self, path: str, client_id: str, speed: Optional[float] = 1.0):
+        # Lazy import to improve CLI performance
+        import collections
+
+        self.client_id = client_id
+        self.speed = speed
+        self.__exchanges: dict[tuple, collections.deque[CaptureEntry]] = collections.defaultdict(collections.deque)
+        self.__last_exchanges: dict[tuple, CaptureEntry] = {}
+        self.__subscriptions: dict[tuple, collections.deque[CaptureEntry]] = collections.defaultdict(collections.deque)
+        self.__messages: dict[int, list[CaptureEntry]] = collections.defaultdict(list)
+        self.__ended: set[int] = set()
+        # Start times of the state changing requests that are yet to be replayed
+        self.__pending_changes: list[float] = []
+        self.__progress: Optional["asyncio.Condition"] = None
+        self.closed = False
+
+        for entry in read_capture(path):
+            kind = entry["k"]
+            if kind == "http":
+                self.__exchanges[self.__key(entry["m"], entry["p"], entry.get("q"))].append(entry)
+                if entry["m"] != "GET":
+                    self.__pending_changes.append(entry["t"])
+            elif kind == "ws":
+                self.__subscriptions[tuple(entry["p"])].append(entry)
+            elif kind == "msg":
+                self.__messages[entry["s"]].append(entry)
+            elif kind == "end":
+                self.__ended.add(entry["s"])
+
+    @staticmethod
+    def __key(method: str, path: str, params: Any):
+        # Lazy import to improve CLI performance
+        import json
+
+        return (method, path, json.dumps(params, sort_keys=True) if params is not None else None)
+
+    async def __sleep(self, duration: float):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        if self.speed and duration > 0:
+            await asyncio.sleep(duration / self.speed)
+
+    def __get_progress(self):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        if self.__progress is None:
+            self.__progress = asyncio.Condition()
+        return self.__progress
+
+    async def __changed(self, entry: CaptureEntry):
+        if entry["m"] == "GET" or entry["t"] not in self.__pending_changes:
+            return
+
+        self.__pending_changes.remove(entry["t"])
+        progress = self.__get_progress()
+        async with progress:
+            progress.notify_all()
+
+    async def wait_for_changes_before(self, time: float):
+        progress = self.__get_progress()
+        async with progress:
+            await progress.wait_for(lambda: not any(started_at < time for started_at in self.__pending_changes))
+
+    def __next_exchange(self, method: str, path: str, params: Any) -> Optional[CaptureEntry]:
+        key = self.__key(method, path, params)
+        queue = self.__exchanges.get(key)
+        if queue:
+            self.__last_exchanges[key] = queue.popleft()
+        # Polling might go on for longer than it did, so keep giving the last answer
+        return self.__last_exchanges.get(key)
+
+    def __path(self, url: str):
+        # Lazy import to improve CLI performance
+        import urllib.parse
+
+        return redact(urllib.parse.urlsplit(url).path, self.client_id)
+
+    def request(self, method: str, url: str, json: Any = None, timeout: Optional["aiohttp.ClientTimeout"] = None, **kwargs):
+        # Lazy import to improve CLI performance
+        import aiohttp
+        import asyncio
+        import contextlib
+
+        @contextlib.asynccontextmanager
+        async def exchange():
+            path = self.__path(url)
+            entry = self.__next_exchange(method, path, redact(json, self.client_id) if method == "GET" else None)
+            if entry is None:
+                logger.warning(f"No recorded response for {method} {path}")
+                raise aiohttp.ClientConnectionError(f"No recorded response for {method} {path}")
+
+            async with asyncio.timeout(timeout.total if timeout is not None else None):
+                await self.__sleep(entry["d"])
+            await self.__changed(entry)
+
+            if "e" in entry:
+                raise _replay_error(entry, method, url)
+            yield ReplayResponse(entry.get("r"))
+
+        return exchange()
+
+    async def ws_connect(self, url: str, **kwargs):
+        return ReplayWebSocket(self)
+
+    def next_subscription(self, topics: list[str]) -> tuple[Optional[CaptureEntry], list[CaptureEntry], bool]:
+        queue = self.__subscriptions.get(tuple(topics))
+        if not queue:
+            return None, [], False
+
+        entry = queue.popleft()
+        return entry, self.__messages.get(entry["s"], []), entry["s"] in self.__ended
+
+    async def sleep(self, duration: float):
+        await self.__sleep(duration)
+
+    async def close(self):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+class ReplayResponse:
+    content_type = "application/json"
+
+    def __init__(self, data: Any):
+        self.__data = data
+
+    async def read(self):
+        # Lazy import to improve CLI performance
+        import json
+
+        return json.dumps(self.__data).encode("utf-8")
+
+    async def json(self, **kwargs):
+        return self.__data
+
+
+class ReplayWebSocket:
+    def __init__(self, session: ReplaySession):
+        self.__session = session
+        self.__subscription: Optional[CaptureEntry] = None
+        self.__messages: list[CaptureEntry] = []
+        self.__ends = False
+        self.closed = False
+
+    async def send_str(self, data: str):
+        # Lazy import to improve CLI performance
+        import json
+
+        self.__subscription, self.__messages, self.__ends = self.__session.next_subscription(json.loads(data))
+
+    async def receive_str(self):
+        # Lazy import to improve CLI performance
+        import aiohttp
+        import json
+
+        entry = self.__subscription
+        if entry is None:
+            raise aiohttp.ClientConnectionError("No recorded WebSocket for the topics")
+
+        await self.__session.sleep(entry["d"])
+        if "e" in entry:
+            raise _replay_error(entry, "GET", "/notifyOnChanges")
+        return json.dumps(entry.get("r"))
+
+    async def __messages_generator(self):
+        # Lazy import to improve CLI performance
+        import aiohttp
+        import asyncio
+        import json
+
+        assert self.__subscription is not None
+        last_time = self.__subscription["t"] + self.__subscription["d"]
+        for entry in self.__messages:
+            await self.__session.sleep(entry["t"] - last_time)
+            await self.__session.wait_for_changes_before(entry["t"])
+            last_time = entry["t"]
+            yield aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, json.dumps(entry["r"]), None)
+
+        if not self.__ends:
+            # Buddy has kept it open until the end of the capture
+            await asyncio.Event().wait()
+        self.closed = True
+
+    def __aiter__(self):
+        return self.__messages_generator()
+
+    async def close(self):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
@@ -0,0 +1,154 @@
+from enum import Enum
+from typing import Dict, Optional, TypedDict
+
+
+class CircuitState(Enum):
+    Closed = "Closed"
+    Open = "Open"
+    HalfOpen = "HalfOpen"
+
+
+class CircuitBreakerState(TypedDict):
+    state: str
+    failures: int
+    retryInS: float
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, address: str, port: int):
+        super().__init__(f"{address}:{port} is known to be offline")
+        self.address = address
+        self.port = port
+
+
+class CircuitBreaker:
+    """
+    Remembers that a host is down, so that the requests can fail right away instead of waiting
+    for the connect timeout every time. Once open, the requests are let through again on an
+    exponential schedule (half-open) and any success closes the circuit immediately.
+    """
+
+    FAILURE_THRESHOLD = 2
+    BASE_DELAY = 1
+    MAX_DELAY = 30
+
+    def __init__(self, max_delay: float = MAX_DELAY):
+        self.max_delay = max_delay
+        self.__failures = 0
+        self.__delay: float = 0
+        self.__open_until: float = 0
+
+    @staticmethod
+    def __now():
+        # Lazy import to improve CLI performance
+        import time
+
+        return time.monotonic()
+
+    @property
+    def state(self):
+        if self.__failures < self.FAILURE_THRESHOLD:
+            return CircuitState.Closed
+        return CircuitState.Open if self.retry_in > 0 else CircuitState.HalfOpen
+
+    @property
+    def retry_in(self):
+        return max(0, self.__open_until - self.__now())
+
+    @property
+    def stats(self):
+        return CircuitBreakerState({
+            "state": self.state.value,
+            "failures": self.__failures,
+            "retryInS": self.retry_in
+        })
+
+    def allow(self):
+        # Every request made while half-open is a probe, so the concurrent requests are not starved
+        return self.retry_in <= 0
+
+    def record_success(self):
+        self.__failures = 0
+        self.__delay = 0
+        self.__open_until = 0
+
+    def record_failure(self):
+        now = self.__now()
+        if now < self.__open_until:
+            # Stragglers from before the circuit was opened
+            return
+
+        self.__failures += 1
+        if self.__failures >= self.FAILURE_THRESHOLD:
+            self.__delay = min(self.__delay * 2, self.max_delay) if self.__delay > 0 else min(self.BASE_DELAY, self.max_delay)
+            self.__open_until = now + self.__delay
+
+    def reset(self):
+        """
+        Puts an open circuit back to the fastest probe schedule, i.e. when the host is expected to come up.
+        """
+        self.__delay = 0
+        self.__open_until = 0
+
+
+_breakers: Dict[tuple[str, int], CircuitBreaker] = {}
+_max_delay: float = CircuitBreaker.MAX_DELAY
+
+
+def get_circuit_breaker(address: str, port: int):
+    breaker = _breakers.get((address, port))
+    if breaker is None:
+        breaker = CircuitBreaker(_max_delay)
+        _breakers[(address, port)] = breaker
+    return breaker
+
+
+def set_max_delay(max_delay: float):
+    """
+    Caps how long any circuit stays open, i.e. for a process that polls the hosts at a fixed interval.
+    """
+    global _max_delay
+    _max_delay = max_delay
+    for breaker in _breakers.values():
+        breaker.max_delay = max_delay
+
+
+def close_circuits(address: str):
+    for (breaker_address, _), breaker in _breakers.items():
+        if breaker_address == address:
+            breaker.record_success()
+
+
+def reset_circuits(address: str):
+    for (breaker_address, _), breaker in _breakers.items():
+        if breaker_address == address:
+            breaker.reset()
+
+
+async def wait_for_probe(address: str, ports: list[int], max_delay: float):
+    """
+    Sleeps until any of the open circuits can be probed again. Useful for the retry loops
+    which would otherwise spin as the requests to an offline host no longer take any time.
+    """
+    # Lazy import to improve CLI performance
+    import asyncio
+
+    delays = [breaker.retry_in for breaker in (_breakers.get((address, port)) for port in ports)
+              if breaker is not None and breaker.state == CircuitState.Open]
+    if delays:
+        await asyncio.sleep(min(min(delays), max_delay))
+
+
+def get_circuit_breaker_states():
+    return {f"{address}:{port}": breaker.stats for (address, port), breaker in _breakers.items()}
+
+
+def is_offline_error(error: Optional[BaseException]):
+    # Lazy import to improve CLI performance
+    import asyncio
+    import aiohttp
+
+    if isinstance(error, aiohttp.ClientSSLError):
+        # Something has answered, even if it was not the right thing
+        return False
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectorError, aiohttp.ServerConnectionError))
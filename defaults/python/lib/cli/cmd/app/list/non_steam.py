@@ -5,8 +5,7 @@ from lib.buddyrequests import NonSteamAppDataItem
 
 
 def convert_to_sorted_dict(apps: list[NonSteamAppDataItem]):
-    apps.sort(key=lambda item: item["app_name"])
-    return { item["app_id"]: item["app_name"] for item in apps }
+    return { item["app_id"]: item["app_name"] for item in sorted(apps, key=lambda item: item["app_name"]) }
 
 
 @settings_watcher()
@@ -1,6 +1,7 @@
-from typing import TypedDict
+from typing import TypedDict, cast
 from lib.cli.utils import buddy_session, cmd_entry, host_pattern_matcher, settings_watcher
-from lib.buddyclient import BuddyClient
+from lib.buddyclient import BuddyClient, StateEndpoint
+from lib.buddyrequests import AppDataResponse
 from lib.logger import logger
 
 
@@ -18,7 +19,11 @@ class AppData(TypedDict):
 @buddy_session()
 @cmd_entry
 async def execute(buddy_client: BuddyClient, app_id: str | None, json: bool):
-    resp = await buddy_client.get_streamed_app_data() if app_id is None else await buddy_client.get_app_data(app_id)
+    if app_id is None:
+        snapshot = await buddy_client.snapshot(StateEndpoint.StreamedAppData)
+        resp = cast(AppDataResponse, snapshot["streamed_app_data"])
+    else:
+        resp = await buddy_client.get_app_data(app_id)
     data = AppData({ "status": None })
 
     if resp["data"]:
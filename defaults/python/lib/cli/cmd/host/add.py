@@ -1,3 +1,4 @@
+from lib.addressbook import learn_addresses
 from lib.cli.utils import cmd_entry, log_gamestream_host, settings_watcher
 from lib.gamestreaminfo import get_server_info
 from lib.cli.settings import CliSettings
@@ -27,6 +28,8 @@ async def execute(settings: CliSettings, timeout: float, dry: bool, json: bool,
         return 0
     
     host_id = host["uniqueId"]
+    # Manually added addresses take part in the address racing alongside the announced ones
+    learn_addresses(host_id, [host["address"]])
     if host_id in settings["hosts"]:
         settings["hosts"][host_id]["address"] = host["address"]
         settings["hosts"][host_id]["infoPort"] = host["port"]
@@ -0,0 +1,49 @@
+from lib.cli.utils import buddy_session, cmd_entry, host_pattern_matcher, settings_watcher
+from lib.buddyclient import BuddyClient
+from lib.buddyrequests import StreamStateResponse
+from lib.requeststats import get_request_stats
+from lib.logger import logger
+
+
+async def probe(buddy_client: BuddyClient, timeout: float):
+    # Lazy import to improve CLI performance
+    import asyncio
+
+    try:
+        await buddy_client.say_hello(force=True)
+        await buddy_client.get_host_info()
+
+        async with asyncio.timeout(timeout):
+            async for _ in await buddy_client.notify_on_changes(StreamStateResponse):
+                break
+    except Exception as err:
+        # Failures are recorded in the stats as well
+        logger.debug(f"Probe failed: {err!r}")
+
+
+@settings_watcher()
+@host_pattern_matcher(match_one=True)
+@buddy_session()
+@cmd_entry
+async def execute(buddy_client: BuddyClient, buddy_timeout: float, samples: int, json: bool):
+    for _ in range(samples):
+        await probe(buddy_client, buddy_timeout)
+
+    stats = get_request_stats()
+    if json:
+        # Lazy import to improve CLI performance
+        import json as jlib
+
+        logger.info(jlib.dumps(stats, indent=2))
+    else:
+        def ms(value: float | None):
+            return "-" if value is None else f"{value:.0f}"
+
+        logger.info(f"Buddy stats after {samples} probe(s):")
+        logger.info(f"  {"Endpoint":<24} {"Count":>6} {"Errors":>6} {"p50 ms":>7} {"p95 ms":>7} {"Max ms":>7} {"Sent B":>8} {"Recv B":>8}")
+        for endpoint, data in stats.items():
+            errors = sum(data["errors"].values())
+            logger.info(f"  {endpoint:<24} {data["count"]:>6} {errors:>6} {ms(data["p50Ms"]):>7} {ms(data["p95Ms"]):>7} "
+                        f"{ms(data["latency"]["maxMs"] if data["latency"]["sumMs"] else None):>7} {data["bytesSent"]:>8} {data["bytesReceived"]:>8}")
+
+    return 0
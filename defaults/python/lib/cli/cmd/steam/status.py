@@ -1,7 +1,7 @@
-from typing import TypedDict
+from typing import TypedDict, cast
 from lib.cli.utils import buddy_session, cmd_entry, host_pattern_matcher, settings_watcher
-from lib.buddyclient import BuddyClient
-from lib.buddyrequests import SteamUiMode
+from lib.buddyclient import BuddyClient, StateEndpoint
+from lib.buddyrequests import CurrentUserResponse, SteamUiMode, SteamUiModeResponse
 from lib.logger import logger
 
 
@@ -20,8 +20,9 @@ class SteamData(TypedDict):
 @buddy_session()
 @cmd_entry
 async def execute(buddy_client: BuddyClient, json: bool):
-    resp1 = await buddy_client.get_steam_ui_mode()
-    resp2 = await buddy_client.get_current_user()
+    snapshot = await buddy_client.snapshot(StateEndpoint.SteamUiMode, StateEndpoint.CurrentUser)
+    resp1 = cast(SteamUiModeResponse, snapshot["steam_ui_mode"])
+    resp2 = cast(CurrentUserResponse, snapshot["current_user"])
     data = SteamData({ "status": SteamStatus({ 
         "running": resp2["user"] is not None,
         "bpm": None if resp1["mode"] == SteamUiMode.Unknown else resp1["mode"] == SteamUiMode.BigPicture,
@@ -1,6 +1,7 @@
-from typing import TypedDict
+from typing import TypedDict, cast
 from lib.cli.utils import buddy_session, cmd_entry, host_pattern_matcher, settings_watcher
-from lib.buddyclient import BuddyClient
+from lib.buddyclient import BuddyClient, StateEndpoint
+from lib.buddyrequests import StreamStateResponse
 from lib.logger import logger
 
 
@@ -17,7 +18,8 @@ class StreamData(TypedDict):
 @buddy_session()
 @cmd_entry
 async def execute(buddy_client: BuddyClient, json: bool):
-    resp = await buddy_client.get_stream_state()
+    snapshot = await buddy_client.snapshot(StateEndpoint.StreamState)
+    resp = cast(StreamStateResponse, snapshot["stream_state"])
     data = StreamData({ "status": StreamStatus({ "streamState": resp["state"].name }) })
 
     if json:
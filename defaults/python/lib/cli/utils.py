@@ -1,9 +1,12 @@
 from typing import cast
+from lib.addressbook import resolve_address
 from lib.cli.settings import CliSettingsManager, CliSettings
 from lib.gamestreaminfo import GameStreamHost, get_server_info
 from lib.logger import logger
 from lib.buddyclient import BuddyClient, HelloResult
 from lib.buddyrequests import BuddyException
+from lib.hellocache import HelloCache
+import lib.constants as constants
 
 
 def cmd_entry(f):
@@ -166,11 +169,14 @@ def buddy_session(auto_sync_mac: bool = True):
                 logger.error("Buddy port is not specified or not set in config!")
                 return 1
 
+            # The host might be reachable at a faster address than the configured one
+            address = await resolve_address(settings["hosts"][host_id]["address"], buddy_port, buddy_timeout)
             buddy_client = BuddyClient(
-                address=settings["hosts"][host_id]["address"],
+                address=address,
                 port=buddy_port,
                 client_id=settings["clientId"],
-                timeout=buddy_timeout)
+                timeout=buddy_timeout,
+                hello_cache=HelloCache(constants.HELLO_CACHE_TTL, constants.HELLO_CACHE_FILE))
 
             async with buddy_client as client:
                 result = await f(*args, buddy_client=client, **kwargs)
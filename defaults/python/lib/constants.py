@@ -8,6 +8,10 @@ RUNNER_READY_FILE = "/tmp/moondeck-runner-ready"
 RUNNER_SUSPENDED_FILE = "/tmp/moondeck-runner-suspended"
 RUNNER_PID_FILE = "/tmp/moondeck-runner-pid"
 RUNNER_SUSPEND_CANCEL_MSG = "suspended"
+HELLO_CACHE_FILE = "/tmp/moondeck-hello-cache"
+HELLO_CACHE_TTL = 15
+ADDRESS_BOOK_FILE = "/tmp/moondeck-address-book"
+NOTIFICATION_HEARTBEAT = 2
 
 def get_config_file_path():
     # Lazy import to improve CLI performance
@@ -0,0 +1,51 @@
+import contextlib
+
+from contextvars import ContextVar
+from typing import Optional
+
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def _now():
+    # Lazy import to improve CLI performance
+    import time
+
+    return time.monotonic()
+
+
+@contextlib.contextmanager
+def deadline(timeout: Optional[float]):
+    """
+    Gives everything within the scope one absolute deadline to share. Nested scopes
+    can only shorten it, so a multi-step operation can never take longer than its budget.
+    """
+    if timeout is None:
+        yield
+        return
+
+    end_time = _now() + max(0, timeout)
+    current = _deadline.get()
+    token = _deadline.set(end_time if current is None else min(current, end_time))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(timeout: float) -> float:
+    """
+    Returns what is left of the current deadline, but no more than the timeout.
+    Raises `asyncio.TimeoutError` when there is nothing left.
+    """
+    # Lazy import to improve CLI performance
+    import asyncio
+
+    end_time = _deadline.get()
+    if end_time is None:
+        return timeout
+
+    left = end_time - _now()
+    if left <= 0:
+        raise asyncio.TimeoutError()
+    return min(timeout, left)
@@ -1,5 +1,12 @@
-from typing import TypedDict
+from typing import TYPE_CHECKING, Optional, TypedDict
+from .addressbook import learn_addresses, url_host
+from .circuitbreaker import close_circuits, get_circuit_breaker, is_offline_error
 from .logger import logger
+from .utils import SingleFlight
+
+if TYPE_CHECKING:
+    import aiohttp
+    import asyncio
 
 
 class GameStreamHost(TypedDict):
@@ -9,147 +16,509 @@ class GameStreamHost(TypedDict):
     uniqueId: str
 
 
-def getGameSteamListener():
+class ServerInfo(TypedDict):
+    address: str
+    port: int
+    hostName: str
+    uniqueId: str
+    state: Optional[str]
+    currentGame: Optional[int]
+    mac: Optional[str]
+    httpsPort: Optional[int]
+    codecModeSupport: Optional[int]
+
+
+# Tag in the /serverinfo body and the field it is stored to
+SERVER_INFO_FIELDS = {
+    "hostname": ("hostName", str),
+    "uniqueid": ("uniqueId", str),
+    "state": ("state", str),
+    "currentgame": ("currentGame", int),
+    "mac": ("mac", str),
+    "HttpsPort": ("httpsPort", int),
+    "ServerCodecModeSupport": ("codecModeSupport", int),
+}
+# Status checks come in bursts (host monitor, frontend, runner), so they can share a recent answer
+SERVER_INFO_TTL = 2
+
+
+_server_info_single_flight = SingleFlight()
+_server_info_cache: dict[tuple[str, int], tuple[float, ServerInfo]] = {}
+_server_info_pattern = None
+
+# The hosts are probed every few seconds, so the connections are kept alive in between
+SERVER_INFO_KEEPALIVE_TIMEOUT = 30
+SERVER_INFO_CONNECTIONS_PER_HOST = 2
+_server_info_session: Optional[tuple["asyncio.AbstractEventLoop", "aiohttp.ClientSession"]] = None
+
+
+async def _get_server_info_session():
     # Lazy import to improve CLI performance
-    from zeroconf import IPVersion, Zeroconf, ServiceListener
-    from zeroconf.asyncio import AsyncServiceInfo
-
-    class GameStreamListener(ServiceListener):
-        def __init__(self, timeout: float, unique_id: str | None = None):
-            # Lazy import to improve CLI performance
-            import asyncio
-
-            self.timeout = timeout
-            self.unique_id = unique_id
-            self.__hosts: list[GameStreamHost] = []
-            self.__tasks: set[asyncio.Task] = set()
-            self.__cancel_condition = asyncio.Condition()
-
-        def add_service(self, zc: Zeroconf, type_: str, name: str):
-            # Lazy import to improve CLI performance
-            import asyncio
-
-            task = asyncio.create_task(self.parse_info(zc, AsyncServiceInfo(type_, name)))
-            self.__tasks.add(task)
-            task.add_done_callback(self.__tasks.discard)
-
-        def remove_service(self, zc: Zeroconf, type_: str, name: str):
-            pass
-
-        def update_service(self, zc: Zeroconf, type_: str, name: str):
-            pass
-
-        async def parse_info(self, zc: Zeroconf, info: AsyncServiceInfo):
-            if not await info.async_request(zc, self.timeout * 1000):
-                return
-
-            if info.port is None:
-                return
-
-            for ip in info.parsed_scoped_addresses(version=IPVersion.V4Only):
-                server_info = await get_server_info(ip, info.port, self.timeout)
-                if server_info:
-                    if self.unique_id is None:
-                        self.__hosts.append(server_info)
-                    elif self.unique_id == server_info["uniqueId"] and len(self.__hosts) == 0:
-                        self.__hosts.append(server_info)
-                        async with self.__cancel_condition:
-                            self.__cancel_condition.notify_all()
-
-        async def wait(self):
-            # Lazy import to improve CLI performance
-            import asyncio
-
-            async with self.__cancel_condition:
-                try:
-                    await asyncio.wait_for(self.__cancel_condition.wait(), timeout=self.timeout)
-                except asyncio.TimeoutError:
-                    pass
+    import aiohttp
+    import asyncio
 
-            return self.__hosts
+    global _server_info_session
+    loop = asyncio.get_running_loop()
+    if _server_info_session is not None and _server_info_session[0] is not loop:
+        # The session cannot be closed from another loop, but its connections can still be dropped
+        # (unless the old loop is closed already, which has taken them down with it)
+        _, session = _server_info_session
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            await connector.close()
+        _server_info_session = None
+
+    if _server_info_session is None or _server_info_session[1].closed:
+        connector = aiohttp.TCPConnector(limit_per_host=SERVER_INFO_CONNECTIONS_PER_HOST,
+                                         keepalive_timeout=SERVER_INFO_KEEPALIVE_TIMEOUT)
+        # No TLS tracing, the plain HTTP connections must not count towards the Buddy connection stats
+        _server_info_session = (loop, aiohttp.ClientSession(connector=connector))
+    return _server_info_session[1]
+
+
+async def close_server_info_session():
+    global _server_info_session
+    if _server_info_session is not None:
+        _, session = _server_info_session
+        _server_info_session = None
+        await session.close()
+
+
+GAMESTREAM_SERVICE_TYPE = "_nvstream._tcp.local."
+
+
+async def _first_match(coros, is_match=lambda result: result is not None):
+    """
+    Runs the coroutines concurrently and returns the first matching result as soon as
+    it is there. The ones that are still running are cancelled.
+    """
+    # Lazy import to improve CLI performance
+    import asyncio
 
-        async def __aenter__(self):
+    pending = {asyncio.ensure_future(coro) for coro in coros}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if is_match(result):
+                    return result
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+class BrowsedService:
+    def __init__(self, name: str):
+        self.name = name
+        self.port: Optional[int] = None
+        self.addresses: list[str] = []
+        self.host: Optional[GameStreamHost] = None
+        self.verified_at: Optional[float] = None
+
+
+class HostBrowser:
+    """
+    Browses for the GameStream hosts in the background and keeps the `serverinfo` of every announced
+    host. The hosts come and go with their announcements and goodbyes, while their `serverinfo`
+    is only trusted for `VERIFY_TTL` seconds. Afterwards it is still served when asked for, but is
+    verified again in the background.
+    """
+
+    VERIFY_TTL = 2
+    # Hosts have several addresses and there might be several hosts, but there is no need to flood the network
+    MAX_CONCURRENT_PROBES = 8
+
+    def __init__(self, probe_timeout: float = 1):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        self.probe_timeout = probe_timeout
+        self.__probes = asyncio.Semaphore(self.MAX_CONCURRENT_PROBES)
+        self.__services: dict[str, BrowsedService] = {}
+        self.__tasks: set[asyncio.Task] = set()
+        self.__verifying: Optional[asyncio.Task] = None
+        self.__changed = asyncio.Condition()
+        self.__aiozeroconf = None
+        self.__browser = None
+        self.__started_at: Optional[float] = None
+
+    @property
+    def running(self):
+        return self.__browser is not None
+
+    @staticmethod
+    def __now():
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        return asyncio.get_running_loop().time()
+
+    def __create_browser(self):
+        # Lazy import to improve CLI performance
+        from zeroconf.asyncio import AsyncServiceBrowser
+
+        assert self.__aiozeroconf is not None
+        return AsyncServiceBrowser(self.__aiozeroconf.zeroconf, type_=[GAMESTREAM_SERVICE_TYPE],
+                                   handlers=[self.__on_service_state_change])
+
+    async def start(self):
+        # Lazy import to improve CLI performance
+        from zeroconf import IPVersion
+        from zeroconf.asyncio import AsyncZeroconf
+
+        if self.running:
             return self
 
-        async def __aexit__(self, *args, **kwargs):
-            # Lazy import to improve CLI performance
-            import asyncio
+        # IPv6 addresses are browsed as well, so that they can be raced against the IPv4 ones later on
+        self.__aiozeroconf = AsyncZeroconf(ip_version=IPVersion.All)
+        self.__browser = self.__create_browser()
+        self.__started_at = self.__now()
+        return self
+
+    async def stop(self):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        tasks = list(self.__tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.__browser is not None:
+            await self.__browser.async_cancel()
+            self.__browser = None
+        if self.__aiozeroconf is not None:
+            await self.__aiozeroconf.async_close()
+            self.__aiozeroconf = None
+
+        self.__services.clear()
+        self.__verifying = None
+        self.__started_at = None
+
+    def __spawn(self, coro):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        task = asyncio.create_task(coro)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__on_task_done)
+        return task
+
+    def __on_task_done(self, task: "asyncio.Task"):
+        self.__tasks.discard(task)
+        error = None if task.cancelled() else task.exception()
+        if error is not None:
+            logger.error("GameStream host browser task failed", exc_info=error)
+
+    def __on_service_state_change(self, zeroconf, service_type: str, name: str, state_change):
+        # Lazy import to improve CLI performance
+        from zeroconf import ServiceStateChange
+
+        if state_change == ServiceStateChange.Removed:
+            logger.debug(f"GameStream host {name} is gone")
+            self.__services.pop(name, None)
+            self.__spawn(self.__notify())
+            return
+
+        service = self.__services.get(name)
+        if state_change == ServiceStateChange.Added and service is not None and service.host is not None:
+            # Seen again by a restarted browser, the known hosts are only verified when asked for
+            return
+
+        # Added or updated, either way the addresses might have changed
+        service = self.__services.setdefault(name, BrowsedService(name))
+        self.__spawn(self.__resolve(service, announced=True))
+
+    async def __notify(self):
+        async with self.__changed:
+            self.__changed.notify_all()
+
+    async def __resolve(self, service: BrowsedService, announced: bool):
+        # Lazy import to improve CLI performance
+        from zeroconf import IPVersion
+        from zeroconf.asyncio import AsyncServiceInfo
+
+        if self.__aiozeroconf is None:
+            return
+
+        info = AsyncServiceInfo(GAMESTREAM_SERVICE_TYPE, service.name)
+        if await info.async_request(self.__aiozeroconf.zeroconf, self.probe_timeout * 1000) and info.port is not None:
+            # The scoped (link-local) addresses are only valid on the interface they were seen at
+            all_addresses = [ip for ip in info.parsed_scoped_addresses(version=IPVersion.All) if "%" not in ip]
+            service.port = info.port
+            # The IPv4 addresses are preferred for the address shown and passed on, while any of the other
+            # addresses (VPN, IPv6) are learned as they might turn out to be faster later on
+            service.addresses = [ip for ip in all_addresses if ":" not in ip] or all_addresses
+            if announced:
+                # The host has just announced itself, so there is no point in failing fast anymore
+                for ip in all_addresses:
+                    close_circuits(ip)
+
+            await self.__verify(service, all_addresses)
+
+        await self.__notify()
+
+    async def __probe(self, address: str, port: int):
+        async with self.__probes:
+            return await get_server_info(address, port, self.probe_timeout)
+
+    async def __verify(self, service: BrowsedService, all_addresses: Optional[list[str]] = None):
+        if service.port is None:
+            return None
+
+        # A dead interface must not hold up the others, so whichever address answers first is used
+        last_address = [service.host["address"]] if service.host else []
+        host = await _first_match(self.__probe(ip, service.port) for ip in dict.fromkeys(last_address + service.addresses))
+
+        if host is not None:
+            if all_addresses is not None:
+                learn_addresses(host["uniqueId"], all_addresses)
+        elif service.host is not None:
+            logger.debug(f"GameStream host {service.name} is not answering anymore")
+
+        service.host = host
+        service.verified_at = self.__now()
+        return host
+
+    async def __verify_stale(self, unique_id: Optional[str]):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        now = self.__now()
+        stale = [service for service in self.__services.values()
+                 if service.verified_at is not None and now - service.verified_at >= self.VERIFY_TTL]
+        if not stale:
+            return
+
+        if unique_id is None:
+            await asyncio.gather(*(self.__verify(service) for service in stale))
+            return
+
+        fresh = [service for service in self.__services.values() if service not in stale]
+        if any(service.host is not None and service.host["uniqueId"] == unique_id for service in fresh):
+            return
+
+        # The probes are bounded, so the service that used to be the host gets to go first. The rest
+        # are left stale and will be verified once they are asked for again
+        stale.sort(key=lambda service: service.host is None or service.host["uniqueId"] != unique_id)
+        await _first_match((self.__verify(service) for service in stale),
+                           lambda host: host is not None and host["uniqueId"] == unique_id)
+
+    async def __revalidate(self, unique_id: Optional[str]):
+        await self.__verify_stale(unique_id)
+        await self.__notify()
+
+    def __matching_hosts(self, unique_id: Optional[str]):
+        return [service.host for service in list(self.__services.values())
+                if service.host is not None and (unique_id is None or service.host["uniqueId"] == unique_id)]
+
+    async def refresh(self):
+        """
+        Asks the hosts to announce themselves again by browsing anew. The known ones are not resolved again.
+        """
+        if self.__browser is None:
+            return
+
+        await self.__browser.async_cancel()
+        self.__browser = self.__create_browser()
+
+    async def get_hosts(self, timeout: float, unique_id: Optional[str] = None, refresh: bool = False) -> list[GameStreamHost]:
+        """
+        Returns the known hosts right away, unless the browser has just been started (or is asked to
+        refresh), in which case the announcements are waited for until the timeout. When looking
+        for a specific host, it is returned as soon as it is found. The stale hosts are verified
+        again in the background, the next call gets the outcome.
+        """
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        if self.__started_at is None:
+            return []
+
+        timeout = 0.1 if timeout <= 0 else timeout
+        wait_until = self.__now() + timeout if refresh else self.__started_at + timeout
+        if refresh:
+            await self.refresh()
+
+        # The stale hosts are served as they are, a single verification at a time catches up with them
+        if self.__verifying is None or self.__verifying.done():
+            self.__verifying = self.__spawn(self.__revalidate(unique_id))
 
-            for task in list(self.__tasks):
-                task.cancel()
+        async with self.__changed:
+            while True:
+                hosts = self.__matching_hosts(unique_id)
+                remaining = wait_until - self.__now()
+                if (unique_id is not None and hosts) or remaining <= 0:
+                    return hosts[:1] if unique_id is not None else hosts
 
-            for task in list(self.__tasks):
                 try:
-                    await task
-                except asyncio.CancelledError:
+                    await asyncio.wait_for(self.__changed.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
                     pass
 
-    return GameStreamListener
+    async def __aenter__(self):
+        return await self.start()
 
+    async def __aexit__(self, *args, **kwargs):
+        await self.stop()
 
-async def _scan_for_hosts(timeout: float, unique_id: str | None = None):
-    # Lazy import to improve CLI performance
-    from zeroconf import IPVersion
-    from zeroconf.asyncio import AsyncServiceBrowser, AsyncZeroconf
 
-    timeout = 0.1 if timeout <= 0 else timeout
-    async with getGameSteamListener()(timeout, unique_id=unique_id) as listener:
-        async with AsyncZeroconf(ip_version=IPVersion.V4Only) as aiozeroconf:
-            async with AsyncServiceBrowser(aiozeroconf.zeroconf,
-                                           type_=["_nvstream._tcp.local."],
-                                           handlers=listener):
-                return await listener.wait()
+async def _scan_for_hosts(timeout: float, unique_id: Optional[str] = None, browser: Optional[HostBrowser] = None, refresh: bool = False):
+    if browser is not None and browser.running:
+        return await browser.get_hosts(timeout, unique_id, refresh)
+
+    # Without a long-lived browser all of the announcements have to be waited for
+    async with HostBrowser(probe_timeout=timeout) as temporary_browser:
+        return await temporary_browser.get_hosts(timeout, unique_id)
 
 
-async def get_server_info(address: str, port: int, timeout: float):
+def parse_server_info(address: str, port: int, data: str):
+    """
+    Picks all of the known fields from the /serverinfo body in a single pass. The body is a
+    few KB at most and arrives in one read, so it is scanned once it is complete rather than
+    while it is being streamed.
+    """
     # Lazy import to improve CLI performance
-    import aiohttp
-    import asyncio
     import html
     import re
 
+    global _server_info_pattern
+    if _server_info_pattern is None:
+        _server_info_pattern = re.compile(f"<({'|'.join(SERVER_INFO_FIELDS)})>(.*?)</\\1>")
+
+    values: dict[str, object] = {}
+    for match in _server_info_pattern.finditer(data):
+        field, field_type = SERVER_INFO_FIELDS[match.group(1)]
+        if field in values:
+            continue
+
+        value = html.unescape(match.group(2))
+        if field_type is int:
+            try:
+                values[field] = int(value)
+            except ValueError:
+                values[field] = None
+        else:
+            values[field] = value
+
+    if values.get("hostName") is None or values.get("uniqueId") is None:
+        return None
+
+    return ServerInfo({
+        "address": address,
+        "port": port,
+        "hostName": str(values["hostName"]),
+        "uniqueId": str(values["uniqueId"]),
+        "state": values.get("state"),  # type: ignore
+        "currentGame": values.get("currentGame"),  # type: ignore
+        "mac": values.get("mac"),  # type: ignore
+        "httpsPort": values.get("httpsPort"),  # type: ignore
+        "codecModeSupport": values.get("codecModeSupport")  # type: ignore
+    })
+
+
+async def get_server_details(address: str, port: int, timeout: float, max_age: float = SERVER_INFO_TTL):
+    """
+    Returns everything that is known about the host from its /serverinfo. Answers that are
+    younger than `max_age` seconds are reused, so the result must never be modified.
+    """
+    # Lazy import to improve CLI performance
+    import asyncio
+    import time
+
+    cached = _server_info_cache.get((address, port))
+    if cached is not None and 0 <= time.monotonic() - cached[0] < max_age:
+        return cached[1]
+
+    if not get_circuit_breaker(address, port).allow():
+        logger.debug(f"{address}:{port} is known to be offline")
+        return None
+
     try:
-        timeout = 0.1 if timeout <= 0 else timeout
+        # The shared request is bound to the first caller's timeout, so every caller waits with its own
+        async with asyncio.timeout(0.1 if timeout <= 0 else timeout):
+            return await _server_info_single_flight.run((address, port), lambda: _get_server_info(address, port, timeout))
+    except asyncio.TimeoutError:
+        logger.debug("Timeout")
+        return None
+
 
-        def get_host_id(data: str):
-            if data:
-                result = re.search("<uniqueid>(.*?)</uniqueid>", data)
-                return html.unescape(str(result.group(1))) if result else None
+async def get_server_info(address: str, port: int, timeout: float, max_age: float = SERVER_INFO_TTL):
+    info = await get_server_details(address, port, timeout, max_age)
+    if info is None:
+        return None
 
-        def get_host_name(data: str):
-            if data:
-                result = re.search("<hostname>(.*?)</hostname>", data)
-                return html.unescape(str(result.group(1))) if result else None
+    return GameStreamHost({
+        "address": info["address"],
+        "port": info["port"],
+        "hostName": info["hostName"],
+        "uniqueId": info["uniqueId"]
+    })
 
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
-            async with session.get(f"http://{address}:{port}/serverinfo") as resp:
-                data = await resp.text(encoding="utf-8")
-                hostname = get_host_name(data)
-                unique_id = get_host_id(data)
 
-                if hostname is None or unique_id is None:
-                    return None
+def get_server_info_single_flight_stats():
+    return _server_info_single_flight.stats
 
-                return GameStreamHost({
-                    "address": address,
-                    "port": port,
-                    "hostName": hostname,
-                    "uniqueId": unique_id
-                })
+
+async def _get_server_info(address: str, port: int, timeout: float):
+    # Lazy import to improve CLI performance
+    import aiohttp
+    import asyncio
+    import time
+
+    breaker = get_circuit_breaker(address, port)
+    # Whatever happens, the previous answer is outdated now
+    _server_info_cache.pop((address, port), None)
+    try:
+        timeout = 0.1 if timeout <= 0 else timeout
+
+        session = await _get_server_info_session()
+        async with session.get(f"http://{url_host(address)}:{port}/serverinfo", timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            data = await resp.text(encoding="utf-8")
+            breaker.record_success()
+
+            info = parse_server_info(address, port, data)
+            if info is not None:
+                _server_info_cache[(address, port)] = (time.monotonic(), info)
+            return info
 
     except asyncio.TimeoutError:
         logger.debug("Timeout")
+        breaker.record_failure()
         return None
 
     except aiohttp.ClientError as e:
         logger.debug(f"Error while executing get_server_info request: {e}")
+        if is_offline_error(e):
+            breaker.record_failure()
         return None
 
 
-async def scan_for_hosts(timeout: float):
-    return await _scan_for_hosts(timeout=timeout)
+async def scan_for_hosts(timeout: float, browser: Optional[HostBrowser] = None, refresh: bool = False):
+    return await _scan_for_hosts(timeout=timeout, browser=browser, refresh=refresh)
+
+
+async def find_host(host_id: str, timeout: float, browser: Optional[HostBrowser] = None,
+                    address: Optional[str] = None, port: Optional[int] = None):
+    """
+    Looks for the host via mDNS and, if given, at its last known address at the same time.
+    Whichever confirms the host first wins and the other one is cancelled.
+    """
+    async def via_mdns():
+        hosts = await _scan_for_hosts(timeout=timeout, unique_id=host_id, browser=browser)
+        return hosts[0] if hosts else None
+
+    if not address or not port:
+        return await via_mdns()
 
+    async def at_last_address():
+        assert address and port
+        host = await get_server_info(address, port, timeout)
+        # Someone else might have gotten the address in the meantime
+        return host if host is not None and host["uniqueId"] == host_id else None
 
-async def find_host(host_id: str, timeout: float):
-    hosts = await _scan_for_hosts(timeout=timeout, unique_id=host_id)
-    return hosts[0] if hosts else None
+    return await _first_match([at_last_address(), via_mdns()])
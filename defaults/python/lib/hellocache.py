@@ -0,0 +1,138 @@
+import contextlib
+
+from typing import Optional
+from .logger import logger
+
+
+class HelloCache:
+    """
+    Remembers when the hello handshake with a Buddy host last succeeded. With a state
+    file the verification is shared between the plugin, runner and CLI processes.
+    """
+
+    MAX_ENTRY_AGE = 3600
+
+    def __init__(self, ttl: float, state_file: Optional[str] = None):
+        self.ttl = ttl
+        self.state_file = state_file
+        self.__entries: dict[str, float] = {}
+        # Invalidations of this process, which no older verification (e.g. from the file) can undo
+        self.__invalidated: dict[str, float] = {}
+
+    @staticmethod
+    def make_key(address: str, port: int, client_id: str):
+        # Lazy import to improve CLI performance
+        import hashlib
+
+        # The client id is a secret, so don't store it as is
+        return hashlib.sha256(f"{address}:{port}:{client_id}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def now():
+        # Lazy import to improve CLI performance
+        import time
+
+        # Wall clock is needed as the timestamps are shared between processes
+        return time.time()
+
+    def __read_state_file(self):
+        # Lazy import to improve CLI performance
+        import json
+
+        if self.state_file is None:
+            return {}
+
+        try:
+            with open(self.state_file, "r") as file:
+                data = json.load(file)
+                if isinstance(data, dict):
+                    return {k: v for k, v in data.items() if isinstance(k, str) and isinstance(v, (int, float))}
+        except FileNotFoundError:
+            pass
+        except Exception as err:
+            logger.debug(f"Failed to read hello cache: {err}")
+
+        return {}
+
+    @contextlib.contextmanager
+    def __locked(self):
+        # Lazy import to improve CLI performance
+        import fcntl
+
+        # The state file itself is replaced on every update, so it cannot hold the lock
+        with open(f"{self.state_file}.lock", "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def __update_state_file(self, key: str, verified_at: Optional[float]):
+        # Lazy import to improve CLI performance
+        import json
+        import os
+
+        if self.state_file is None:
+            return
+
+        try:
+            # Other processes must not write back what they have read before this update
+            with self.__locked():
+                now = self.now()
+                data = {k: v for k, v in self.__read_state_file().items() if now - v < self.MAX_ENTRY_AGE}
+                if verified_at is None:
+                    if key not in data:
+                        return
+                    del data[key]
+                else:
+                    data[key] = verified_at
+
+                tmp_file = f"{self.state_file}.{os.getpid()}"
+                with open(tmp_file, "w") as file:
+                    json.dump(data, file)
+                os.replace(tmp_file, self.state_file)
+        except Exception as err:
+            logger.warning(f"Failed to update hello cache: {err}")
+
+    def __is_fresh(self, verified_at: Optional[float]):
+        if verified_at is None:
+            return False
+
+        age = self.now() - verified_at
+        return 0 <= age < self.ttl
+
+    def is_valid(self, key: str):
+        if self.ttl <= 0:
+            return False
+
+        if self.__is_fresh(self.__entries.get(key)):
+            return True
+
+        verified_at = self.__read_state_file().get(key)
+        if not self.__is_fresh(verified_at):
+            return False
+
+        assert verified_at is not None
+        invalidated_at = self.__invalidated.get(key)
+        if invalidated_at is not None:
+            if verified_at <= invalidated_at:
+                # The file could not be updated or someone has written the old entry back
+                return False
+            del self.__invalidated[key]
+
+        self.__entries[key] = verified_at
+        return True
+
+    def mark_ok(self, key: str):
+        if self.ttl <= 0:
+            return
+
+        verified_at = self.now()
+        self.__entries[key] = verified_at
+        self.__invalidated.pop(key, None)
+        self.__update_state_file(key, verified_at)
+
+    def invalidate(self, key: str):
+        now = self.now()
+        self.__entries.pop(key, None)
+        # Nothing older than the TTL would be used anyway
+        self.__invalidated = {k: v for k, v in self.__invalidated.items() if now - v < self.ttl}
+        self.__invalidated[key] = now
+        self.__update_state_file(key, None)
@@ -0,0 +1,363 @@
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Awaitable, Optional, Sequence, Type, TypedDict
+from . import constants, utils
+from .utils import T
+from .circuitbreaker import CircuitOpenError, get_circuit_breaker, is_offline_error
+from .deadline import remaining
+from .buddyrequests import BuddyException, CurrentUserResponse, NotifyOnChangesResult, ResultLikeResponse, SteamUiModeResponse, StreamedAppDataResponse, StreamStateResponse
+from .logger import logger
+
+if TYPE_CHECKING:
+    import aiohttp
+    import asyncio
+    from .buddytraffic import TrafficRecorder
+
+
+TOPIC_MAPPING: dict[Any, str] = {
+    StreamedAppDataResponse: "StreamedAppData",
+    SteamUiModeResponse: "SteamUiMode",
+    CurrentUserResponse: "CurrentUser",
+    StreamStateResponse: "StreamState",
+}
+TOPIC_TYPES: dict[str, Any] = {topic: topic_type for topic_type, topic in TOPIC_MAPPING.items()}
+
+
+class NotificationStats(TypedDict):
+    framesReceived: int
+    # Frames that were identical to the previous one and were not even parsed
+    framesDuplicate: int
+    # Per consumer, whether the frame was passed on or not (none of its topics have changed)
+    framesDelivered: int
+    framesDropped: int
+    topicsDecoded: int
+    topicsUnchanged: int
+
+
+_stats = NotificationStats({
+    "framesReceived": 0,
+    "framesDuplicate": 0,
+    "framesDelivered": 0,
+    "framesDropped": 0,
+    "topicsDecoded": 0,
+    "topicsUnchanged": 0
+})
+
+
+def get_notification_stats():
+    return NotificationStats(_stats)
+
+
+class NotificationConsumer:
+    def __init__(self, topics: list[str], changes_only: bool = False):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        self.topics = topics
+        self.changes_only = changes_only
+        self.queue: asyncio.Queue[tuple[Any, ...] | BaseException] = asyncio.Queue()
+        self.last_items: Optional[tuple[Any, ...]] = None
+
+
+class NotificationHub:
+    """
+    Keeps a single notifyOnChanges WebSocket per host, subscribed to the union of the topics
+    requested by its consumers. Every consumer gets the current snapshot when it subscribes (unless
+    it only wants the changes) and afterwards only the frames in which any of its own topics have changed.
+    Only the topics that have changed are decoded, once for all of the consumers.
+
+    A lost connection is detected with heartbeats and is reestablished within the reconnect timeout,
+    after which the consumers get a fresh snapshot (or whatever has changed in the meantime, if they
+    only want the changes).
+    """
+
+    RECONNECT_TIMEOUT = 10
+    RECONNECT_DELAY = 0.25
+    MAX_RECONNECT_DELAY = 2
+
+    def __init__(self, session: "aiohttp.ClientSession", base_url: str, linger_timeout: float = 10, recorder: Optional["TrafficRecorder"] = None,
+                 heartbeat: Optional[float] = constants.NOTIFICATION_HEARTBEAT, reconnect_timeout: float = RECONNECT_TIMEOUT,
+                 breaker_key: Optional[tuple[str, int]] = None):
+        self.linger_timeout = linger_timeout
+        self.heartbeat = heartbeat
+        self.reconnect_timeout = reconnect_timeout
+        self.__session = session
+        self.__base_url = base_url
+        self.__topics: set[str] = set()
+        self.__values: dict[str, Any] = {}
+        self.__decoded: dict[str, Any] = {}
+        self.__consumers: set[NotificationConsumer] = set()
+        self.__task: Optional["asyncio.Task"] = None
+        self.__task_started_at = 0.0
+        self.__linger_handle: Optional["asyncio.TimerHandle"] = None
+        self.__recorder = recorder
+        # The (address, port) whose circuit breaker gates the connects
+        self.__breaker_key = breaker_key
+
+    def __deliver(self, consumer: NotificationConsumer):
+        if not all(topic in self.__values for topic in consumer.topics):
+            return False
+
+        items = tuple(self.__values[topic] for topic in consumer.topics)
+        if items == consumer.last_items:
+            return False
+
+        is_snapshot = consumer.last_items is None
+        consumer.last_items = items
+        if is_snapshot and consumer.changes_only:
+            return False
+
+        consumer.queue.put_nowait(tuple(self.__decoded[topic] for topic in consumer.topics))
+        return True
+
+    def __publish(self, values: dict[str, Any]):
+        changed = False
+        for topic, value in values.items():
+            if topic in self.__values and self.__values[topic] == value:
+                _stats["topicsUnchanged"] += 1
+                continue
+
+            # Notifications are only ever read, so the consumers can share the unconverted parts
+            self.__decoded[topic] = utils.from_dict(TOPIC_TYPES[topic], value, copy=False)
+            self.__values[topic] = value
+            _stats["topicsDecoded"] += 1
+            changed = True
+
+        for consumer in self.__consumers:
+            # The consumers that have just subscribed are still waiting for their snapshot
+            if (changed or consumer.last_items is None) and self.__deliver(consumer):
+                _stats["framesDelivered"] += 1
+            else:
+                _stats["framesDropped"] += 1
+
+    async def __listen_once(self, topics: list[str], timeout: float):
+        # Lazy import to improve CLI performance
+        import aiohttp
+        import asyncio
+        import json
+        import time
+        from .requeststats import record
+
+        # Connecting and waiting for the ack share one budget
+        budget_end = asyncio.get_running_loop().time() + timeout
+
+        async def timed(endpoint: str, request: Awaitable[T], bytes_sent: int = 0) -> T:
+            started_at = time.perf_counter()
+            try:
+                async with asyncio.timeout_at(budget_end):
+                    result = await request
+            except Exception as err:
+                record(endpoint, time.perf_counter() - started_at, bytes_sent, error=err)
+                raise
+
+            bytes_received = len(result) if isinstance(result, str) else 0
+            record(endpoint, time.perf_counter() - started_at, bytes_sent, bytes_received)
+            return result
+
+        breaker = get_circuit_breaker(*self.__breaker_key) if self.__breaker_key is not None else None
+        if breaker is not None and not breaker.allow():
+            error = CircuitOpenError(*self.__breaker_key)
+            record("WS /notifyOnChanges", None, error=error)
+            raise error
+
+        connect_started_at = time.perf_counter()
+        try:
+            # Without the heartbeat a half-open connection would go unnoticed for as long as nothing changes
+            ws = await timed("WS /notifyOnChanges", self.__session.ws_connect(f"{self.__base_url}/notifyOnChanges", heartbeat=self.heartbeat))
+        except Exception as err:
+            if breaker is not None:
+                if not is_offline_error(err):
+                    # Something has answered
+                    breaker.record_success()
+                elif not isinstance(err, asyncio.TimeoutError):
+                    # The budget might have been cut short by the deadline, so only the refused connects count
+                    breaker.record_failure()
+            if self.__recorder is not None:
+                self.__recorder.record_subscription(topics, time.perf_counter() - connect_started_at, error=err)
+            raise
+
+        if breaker is not None:
+            breaker.record_success()
+
+        async with ws:
+            request = json.dumps(topics)
+
+            async def subscribe():
+                await ws.send_str(request)
+                return await ws.receive_str()
+
+            try:
+                ack = await timed("WS ack", subscribe(), bytes_sent=len(request))
+                ack_data = json.loads(ack)
+            except Exception as err:
+                if self.__recorder is not None:
+                    self.__recorder.record_subscription(topics, time.perf_counter() - connect_started_at, error=err)
+                raise
+
+            stream = None
+            if self.__recorder is not None:
+                stream = self.__recorder.record_subscription(topics, time.perf_counter() - connect_started_at, ack=ack_data)
+
+            response = utils.from_dict(ResultLikeResponse, ack_data, copy=False)
+
+            if not response["result"]:
+                raise BuddyException(NotifyOnChangesResult.BuddyRefused)
+
+            last_frame = None
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    record("WS message", None, bytes_received=len(msg.data))
+                    _stats["framesReceived"] += 1
+                    if self.__recorder is not None and stream is not None:
+                        self.__recorder.record_message(stream, json.loads(msg.data))
+
+                    # Buddy sends all of the topics on every change, so often nothing has changed for the consumers
+                    if msg.data == last_frame:
+                        _stats["framesDuplicate"] += 1
+                        continue
+
+                    last_frame = msg.data
+                    self.__publish(dict(zip(topics, msg.json())))
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    # Missed heartbeat or a broken connection
+                    logger.debug(f"Buddy notifications connection failed: {msg.data}")
+                    break
+                else:
+                    logger.error(f"Unexpected WebSocket message: {msg}")
+                    raise BuddyException(NotifyOnChangesResult.UnexpectedMessageType)
+
+            if self.__recorder is not None and stream is not None:
+                self.__recorder.record_end(stream)
+
+    async def __listen(self, topics: list[str], timeout: float):
+        # Lazy import to improve CLI performance
+        import aiohttp
+        import asyncio
+        import time
+
+        # The first subscription fails right away, the consumers might want to know why
+        await self.__listen_once(topics, timeout)
+
+        loop = asyncio.get_running_loop()
+        while self.reconnect_timeout > 0 and self.__consumers:
+            logger.info(f"Lost connection to Buddy notifications, resubscribing to {topics}")
+
+            # The values are stale until Buddy sends a fresh snapshot, which is passed on in full
+            self.__values.clear()
+            self.__decoded.clear()
+            self.__task_started_at = time.monotonic()
+            for consumer in self.__consumers:
+                if not consumer.changes_only:
+                    consumer.last_items = None
+
+            give_up_at = loop.time() + self.reconnect_timeout
+            delay = self.RECONNECT_DELAY
+            while True:
+                # A connection that has just failed is unlikely to be back right away
+                await asyncio.sleep(min(delay, max(0, give_up_at - loop.time())))
+                try:
+                    # A dead keep-alive connection could otherwise take the whole budget
+                    await self.__listen_once(topics, min(timeout, give_up_at - loop.time()))
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as err:
+                    if loop.time() >= give_up_at:
+                        # Same as if the connection was never reestablished
+                        raise BuddyException(NotifyOnChangesResult.WebSocketClosed) from err
+                    logger.debug(f"Failed to resubscribe to Buddy notifications: {err}")
+                    delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+
+        raise BuddyException(NotifyOnChangesResult.WebSocketClosed)
+
+    def __on_listen_done(self, task: "asyncio.Task"):
+        error = None if task.cancelled() else task.exception()
+        if task is not self.__task:
+            # Replaced by a subscription with more topics
+            return
+
+        self.__task = None
+        self.__topics.clear()
+        self.__values.clear()
+        self.__decoded.clear()
+
+        # Consumers are done for as they would be with their own WebSocket
+        for consumer in self.__consumers:
+            consumer.queue.put_nowait(error or BuddyException(NotifyOnChangesResult.WebSocketClosed))
+        self.__consumers.clear()
+
+    def __subscribe(self, consumer: NotificationConsumer, timeout: float, changed_at: Optional[float]):
+        # Lazy import to improve CLI performance
+        import asyncio
+        import time
+
+        if self.__linger_handle is not None:
+            self.__linger_handle.cancel()
+            self.__linger_handle = None
+
+        # The values can only be trusted if the WebSocket was set up after the consumer's last change,
+        # otherwise they might not reflect it yet
+        up_to_date = changed_at is None or changed_at <= self.__task_started_at
+
+        self.__consumers.add(consumer)
+        if self.__task is not None and self.__topics.issuperset(consumer.topics) and up_to_date:
+            self.__deliver(consumer)
+            return
+
+        if self.__task is not None:
+            logger.debug(f"Resubscribing to Buddy notifications with topics {consumer.topics}")
+            self.__task.cancel()
+
+            # The values are stale until the new WebSocket sends a fresh snapshot
+            self.__values.clear()
+            self.__decoded.clear()
+
+        self.__topics.update(consumer.topics)
+        self.__task_started_at = time.monotonic()
+        self.__task = asyncio.create_task(self.__listen(sorted(self.__topics), timeout))
+        self.__task.add_done_callback(self.__on_listen_done)
+
+    def __unsubscribe(self, consumer: NotificationConsumer):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        self.__consumers.discard(consumer)
+        if self.__consumers or self.__task is None:
+            return
+
+        # Consumers usually come one after another, so keep the WebSocket around for a bit
+        if self.__linger_handle is not None:
+            self.__linger_handle.cancel()
+        self.__linger_handle = asyncio.get_running_loop().call_later(self.linger_timeout, self.__stop)
+
+    def __stop(self):
+        self.__linger_handle = None
+        if self.__task is not None and not self.__consumers:
+            self.__task.cancel()
+
+    async def subscribe(self, topic_types: Sequence[Type[Any]], timeout: float, changed_at: Optional[float] = None, changes_only: bool = False) -> AsyncGenerator[tuple[Any, ...], None]:
+        """
+        Yields the current values of the topics (unless `changes_only` is set) and then every change. `changed_at`
+        is the (monotonic) time of the caller's last state changing request, which the current values must already reflect.
+        """
+        consumer = NotificationConsumer([TOPIC_MAPPING[topic_type] for topic_type in topic_types], changes_only)
+        # The WebSocket is set up by another task, so the caller's budget must be passed along
+        self.__subscribe(consumer, remaining(timeout), changed_at)
+        try:
+            while True:
+                items = await consumer.queue.get()
+                if isinstance(items, BaseException):
+                    raise items
+
+                yield items
+        finally:
+            self.__unsubscribe(consumer)
+
+    async def close(self):
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        if self.__linger_handle is not None:
+            self.__linger_handle.cancel()
+            self.__linger_handle = None
+
+        task = self.__task
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,107 @@
+import asyncio
+import contextlib
+
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+from .. import constants
+from ..addressbook import resolve_address, url_host
+from ..buddyclient import BuddyClient
+from ..buddyrequests import BuddyRequests
+from ..deadline import deadline
+from ..hellocache import HelloCache
+from ..logger import logger
+from ..notificationhub import NotificationHub
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+PoolKey = tuple[str, int, str]
+
+
+class PoolEntry:
+    def __init__(self, session: "aiohttp.ClientSession", notification_hub: NotificationHub, now: float):
+        self.session = session
+        self.notification_hub = notification_hub
+        self.borrowers = 0
+        self.last_used = now
+
+
+class BuddyClientPool:
+    """
+    Keeps a long-lived Buddy session per (address, port, client_id) so that the
+    frequent plugin requests can reuse warm keep-alive connections instead of
+    doing a full TCP + TLS handshake every time.
+    """
+
+    def __init__(self, idle_timeout: float = 60, keepalive_timeout: float = 30, hello_cache: Optional[HelloCache] = None,
+                 heartbeat: Optional[float] = constants.NOTIFICATION_HEARTBEAT, reconnect_timeout: float = NotificationHub.RECONNECT_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.hello_cache = hello_cache
+        self.heartbeat = heartbeat
+        self.reconnect_timeout = reconnect_timeout
+        self.__entries: dict[PoolKey, PoolEntry] = {}
+        self.__eviction_task: asyncio.Task | None = None
+
+    @property
+    def now(self):
+        return asyncio.get_running_loop().time()
+
+    def __get_entry(self, key: PoolKey):
+        entry = self.__entries.get(key)
+        if entry is None or entry.session.closed:
+            address, port, client_id = key
+            session = BuddyRequests.create_session(client_id, keepalive_timeout=self.keepalive_timeout)
+            notification_hub = NotificationHub(session, f"https://{url_host(address)}:{port}",
+                                               heartbeat=self.heartbeat, reconnect_timeout=self.reconnect_timeout,
+                                               breaker_key=(address, port))
+            entry = PoolEntry(session, notification_hub, self.now)
+            self.__entries[key] = entry
+
+        if self.__eviction_task is None or self.__eviction_task.done():
+            self.__eviction_task = asyncio.create_task(self.__eviction_loop())
+
+        return entry
+
+    async def __evict(self, force: bool):
+        now = self.now
+        for key, entry in list(self.__entries.items()):
+            if force or (entry.borrowers == 0 and now - entry.last_used >= self.idle_timeout):
+                del self.__entries[key]
+                logger.debug(f"Closing pooled Buddy session for {key[0]}:{key[1]}")
+                await entry.notification_hub.close()
+                await entry.session.close()
+
+    async def __eviction_loop(self):
+        while self.__entries:
+            await asyncio.sleep(self.idle_timeout / 2)
+            await self.__evict(force=False)
+
+    @contextlib.asynccontextmanager
+    async def borrow(self, address: str, port: int, client_id: str, timeout: float, share_deadline: bool = True) -> AsyncIterator[BuddyClient]:
+        """
+        With `share_deadline` the client is meant for a single operation, which shares the `timeout` budget
+        with resolving the address. Borrowers that keep the client for many operations must opt out.
+        """
+        with deadline(timeout if share_deadline else None):
+            # The host might be reachable at a faster address than the configured one
+            address = await resolve_address(address, port, timeout)
+            entry = self.__get_entry((address, port, client_id))
+            entry.borrowers += 1
+            try:
+                async with BuddyClient(address, port, client_id, timeout,
+                                       session=entry.session, hello_cache=self.hello_cache,
+                                       notification_hub=entry.notification_hub) as client:
+                    yield client
+            finally:
+                entry.borrowers -= 1
+                entry.last_used = self.now
+
+    async def close(self):
+        if self.__eviction_task is not None:
+            self.__eviction_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.__eviction_task
+            self.__eviction_task = None
+
+        await self.__evict(force=True)
@@ -0,0 +1,270 @@
+import asyncio
+import contextlib
+
+from typing import Any, Awaitable, Callable, Literal, Optional, TypedDict
+from .buddyclientpool import BuddyClientPool
+from .settings import UserSettings
+from ..buddyrequests import BuddyException, HostInfoResponse, StreamStateResponse
+from ..gamestreaminfo import GameStreamHost, HostBrowser, find_host, get_server_info
+from ..logger import logger
+
+
+class BuddyStatus(TypedDict):
+    status: str
+    info: Optional[HostInfoResponse]
+
+
+class HostStatus(TypedDict):
+    hostId: Optional[str]
+    buddy: BuddyStatus
+    server: Optional[GameStreamHost]
+
+
+class BuddyTarget(TypedDict):
+    address: str
+    port: int
+    client_id: str
+    timeout: float
+
+
+class ServerTarget(TypedDict):
+    host_id: str
+    address: str
+    port: int
+    static_address: bool
+
+
+class HostMonitor:
+    """
+    Keeps the status of the currently selected host up to date in the background and pushes
+    every change to the frontend. Buddy is watched through a pooled connection and a change
+    subscription, which breaks once the host is gone for longer than the pool's reconnect budget.
+    The PC state and pairing are not notified, so they are rechecked with the hello whenever the
+    shared hello cache expires.
+    Nothing is watched while the frontend is not observing the status.
+    """
+
+    def __init__(self, buddy_client_pool: BuddyClientPool, emit: Callable[[HostStatus], Awaitable[Any]],
+                 host_browser: Optional[HostBrowser] = None, interval: float = 5, sanity_interval: float = 30):
+        self.interval = interval
+        self.sanity_interval = sanity_interval
+        self.__pool = buddy_client_pool
+        self.__host_browser = host_browser
+        self.__emit = emit
+        self.__settings: Optional[UserSettings] = None
+        self.__status = HostStatus({"hostId": None, "buddy": {"status": "Offline", "info": None}, "server": None})
+        self.__buddy_changed = asyncio.Event()
+        self.__server_changed = asyncio.Event()
+        self.__observed = asyncio.Event()
+        self.__pending: dict[str, list[asyncio.Future]] = {"buddy": [], "server": []}
+        self.__tasks: list[asyncio.Task] = []
+
+    @property
+    def status(self):
+        return self.__status
+
+    def __get_buddy_target(self):
+        settings = self.__settings
+        host_id = settings["currentHostId"] if settings else None
+        host = settings["hostSettings"].get(host_id) if settings and host_id else None
+        if settings is None or host is None:
+            return None
+
+        return BuddyTarget({
+            "address": host["address"],
+            "port": host["buddy"]["port"],
+            "client_id": settings["clientId"],
+            "timeout": host["runnerTimeouts"]["buddyRequests"]
+        })
+
+    def __get_server_target(self):
+        settings = self.__settings
+        host_id = settings["currentHostId"] if settings else None
+        host = settings["hostSettings"].get(host_id) if settings and host_id else None
+        if host_id is None:
+            return None
+
+        return ServerTarget({
+            "host_id": host_id,
+            "address": host["address"] if host else "",
+            "port": host["hostInfoPort"] if host else 0,
+            "static_address": host["staticAddress"] if host else False
+        })
+
+    async def __update(self, host_id: Optional[str], key: Literal["buddy", "server"], value: Any):
+        if host_id != self.__status["hostId"]:
+            # Settings have changed while the request was running
+            return
+
+        status = HostStatus({**self.__status, key: value})  # type: ignore
+        if status != self.__status:
+            self.__status = status
+            try:
+                await self.__emit(status)
+            except Exception:
+                logger.exception("Failed to emit host status")
+
+    def __take_pending(self, key: Literal["buddy", "server"]):
+        pending, self.__pending[key] = self.__pending[key], []
+        return pending
+
+    @staticmethod
+    def __resolve(pending: list[asyncio.Future]):
+        for future in pending:
+            if not future.done():
+                future.set_result(None)
+        pending.clear()
+
+    @staticmethod
+    async def __wait(event: asyncio.Event, timeout: float):
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        event.clear()
+
+    async def __watch_buddy(self):
+        while True:
+            await self.__observed.wait()
+            self.__buddy_changed.clear()
+            pending = self.__take_pending("buddy")
+            host_id = self.__status["hostId"]
+            target = self.__get_buddy_target()
+            if target is None:
+                await self.__update(host_id, "buddy", {"status": "Offline", "info": None})
+                self.__resolve(pending)
+                await self.__wait(self.__buddy_changed, self.sanity_interval)
+                continue
+
+            try:
+                async with self.__pool.borrow(target["address"], target["port"], target["client_id"], target["timeout"],
+                                              share_deadline=False) as client:
+                    info = await client.get_host_info()
+                    await self.__update(host_id, "buddy", {"status": "Online", "info": info})
+                    self.__resolve(pending)
+
+                    # The subscription breaks once the host is gone for longer than the reconnect budget
+                    async def watch():
+                        async for _ in await client.notify_on_changes(StreamStateResponse, changes_only=True):
+                            pass
+
+                    watch_task = asyncio.create_task(watch())
+                    changed_task = asyncio.create_task(self.__buddy_changed.wait())
+                    try:
+                        while True:
+                            done, _ = await asyncio.wait([watch_task, changed_task], timeout=self.interval,
+                                                         return_when=asyncio.FIRST_COMPLETED)
+                            if done:
+                                break
+
+                            # PC state and pairing changes are not notified, so they are rechecked with
+                            # the hello once it is no longer cached. The host info does not change meanwhile.
+                            await client.refresh_hello()
+
+                        if watch_task in done and changed_task not in done:
+                            # Avoid spinning if Buddy keeps dropping the subscription
+                            await self.__wait(self.__buddy_changed, self.interval)
+                    finally:
+                        for task in [watch_task, changed_task]:
+                            task.cancel()
+                        await asyncio.gather(watch_task, changed_task, return_exceptions=True)
+
+            except asyncio.CancelledError:
+                raise
+
+            except BuddyException as err:
+                await self.__update(host_id, "buddy", {"status": err.result.name, "info": None})
+                self.__resolve(pending)
+                await self.__wait(self.__buddy_changed, self.interval)
+
+            except Exception:
+                logger.exception("Unhandled exception while monitoring Buddy")
+                await self.__update(host_id, "buddy", {"status": "Exception", "info": None})
+                self.__resolve(pending)
+                await self.__wait(self.__buddy_changed, self.interval)
+
+    async def __watch_server(self):
+        while True:
+            await self.__observed.wait()
+            self.__server_changed.clear()
+            pending = self.__take_pending("server")
+            target = self.__get_server_target()
+            try:
+                if target is None:
+                    await self.__update(None, "server", None)
+                else:
+                    if target["static_address"]:
+                        host = await get_server_info(target["address"], target["port"], timeout=1)
+                    else:
+                        host = await find_host(target["host_id"], timeout=1, browser=self.__host_browser,
+                                               address=target["address"], port=target["port"])
+
+                    await self.__update(target["host_id"], "server", host if host and host["uniqueId"] == target["host_id"] else None)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                logger.exception("Unhandled exception while monitoring server")
+
+            self.__resolve(pending)
+            await self.__wait(self.__server_changed, self.interval if target else self.sanity_interval)
+
+    def __reset_status(self):
+        host_id = self.__settings["currentHostId"] if self.__settings else None
+        if host_id != self.__status["hostId"]:
+            self.__status = HostStatus({"hostId": host_id, "buddy": {"status": "Offline", "info": None}, "server": None})
+
+    def update_settings(self, settings: UserSettings):
+        previous = (self.__get_buddy_target(), self.__get_server_target())
+        self.__settings = settings
+        self.__reset_status()
+        if previous[0] != self.__get_buddy_target():
+            self.__buddy_changed.set()
+        if previous[1] != self.__get_server_target():
+            self.__server_changed.set()
+
+    def refresh(self):
+        self.__buddy_changed.set()
+        self.__server_changed.set()
+
+    async def check(self, timeout: float):
+        """
+        Makes the watchers recheck the host right away and waits until both of them are done.
+        """
+        if not self.__tasks or not self.__observed.is_set():
+            # Nothing would be checked while the host is not watched
+            return
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for pending in self.__pending.values():
+            futures.append(loop.create_future())
+            pending.append(futures[-1])
+
+        self.refresh()
+        await asyncio.wait(futures, timeout=timeout)
+
+    def set_observed(self, observed: bool):
+        if observed == self.__observed.is_set():
+            return
+
+        if observed:
+            self.__observed.set()
+        else:
+            self.__observed.clear()
+
+        # Either way the watchers must stop waiting, to check right away or to pause
+        self.refresh()
+
+    def start(self, settings: Optional[UserSettings]):
+        if self.__tasks:
+            return
+
+        self.__settings = settings
+        self.__reset_status()
+        self.__tasks = [asyncio.create_task(self.__watch_buddy()), asyncio.create_task(self.__watch_server())]
+
+    async def stop(self):
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__tasks = []
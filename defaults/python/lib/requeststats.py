@@ -0,0 +1,134 @@
+from typing import Dict, List, Literal, Optional, TypedDict
+
+
+# Upper bounds of the latency buckets in milliseconds, the last bucket catches everything above
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+MAX_ENDPOINTS = 64
+OVERFLOW_ENDPOINT = "other"
+
+ErrorKind = Literal["timeout", "ssl", "connection", "http", "other"]
+
+
+class LatencyHistogram(TypedDict):
+    bucketsMs: List[int]
+    counts: List[int]
+    sumMs: float
+    maxMs: float
+
+
+class ErrorCounts(TypedDict):
+    timeout: int
+    ssl: int
+    connection: int
+    http: int
+    other: int
+
+
+class EndpointStats(TypedDict):
+    count: int
+    errors: ErrorCounts
+    bytesSent: int
+    bytesReceived: int
+    latency: LatencyHistogram
+    p50Ms: Optional[float]
+    p95Ms: Optional[float]
+    p99Ms: Optional[float]
+
+
+_endpoints: Dict[str, EndpointStats] = {}
+
+
+def _get_endpoint(endpoint: str):
+    stats = _endpoints.get(endpoint)
+    if stats is None:
+        if len(_endpoints) >= MAX_ENDPOINTS:
+            # Keep the memory bounded no matter how many distinct endpoints are seen
+            endpoint = OVERFLOW_ENDPOINT
+            stats = _endpoints.get(endpoint)
+
+        if stats is None:
+            stats = EndpointStats({
+                "count": 0,
+                "errors": {"timeout": 0, "ssl": 0, "connection": 0, "http": 0, "other": 0},
+                "bytesSent": 0,
+                "bytesReceived": 0,
+                "latency": {"bucketsMs": LATENCY_BUCKETS_MS, "counts": [0] * (len(LATENCY_BUCKETS_MS) + 1), "sumMs": 0, "maxMs": 0},
+                "p50Ms": None,
+                "p95Ms": None,
+                "p99Ms": None
+            })
+            _endpoints[endpoint] = stats
+    return stats
+
+
+def _percentile(histogram: LatencyHistogram, percentile: float):
+    total = sum(histogram["counts"])
+    if total == 0:
+        return None
+
+    threshold = total * percentile
+    accumulated = 0
+    for index, count in enumerate(histogram["counts"]):
+        accumulated += count
+        if accumulated >= threshold:
+            # Bucket upper bound, which is as precise as the histogram can get
+            return float(histogram["bucketsMs"][index]) if index < len(histogram["bucketsMs"]) else histogram["maxMs"]
+    return histogram["maxMs"]
+
+
+def classify_error(error: BaseException) -> ErrorKind:
+    # Lazy import to improve CLI performance
+    import asyncio
+    import aiohttp
+
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, aiohttp.ClientSSLError):
+        return "ssl"
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return "connection"
+    if isinstance(error, aiohttp.ClientResponseError):
+        return "http"
+    return "other"
+
+
+def record(endpoint: str, latency: Optional[float], bytes_sent: int = 0, bytes_received: int = 0, error: Optional[BaseException] = None):
+    """
+    Records a single request or message for the endpoint. The latency is in seconds and
+    can be omitted for messages that are not a response to anything.
+    """
+    # Lazy import to improve CLI performance
+    import bisect
+
+    stats = _get_endpoint(endpoint)
+    stats["count"] += 1
+    stats["bytesSent"] += bytes_sent
+    stats["bytesReceived"] += bytes_received
+
+    if error is not None:
+        stats["errors"][classify_error(error)] += 1
+
+    if latency is not None:
+        latency_ms = latency * 1000
+        histogram = stats["latency"]
+        histogram["counts"][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        histogram["sumMs"] += latency_ms
+        histogram["maxMs"] = max(histogram["maxMs"], latency_ms)
+
+
+def get_request_stats():
+    # Lazy import to improve CLI performance
+    import copy
+
+    result: Dict[str, EndpointStats] = {}
+    for endpoint, stats in _endpoints.items():
+        endpoint_stats = copy.deepcopy(stats)
+        endpoint_stats["p50Ms"] = _percentile(stats["latency"], 0.50)
+        endpoint_stats["p95Ms"] = _percentile(stats["latency"], 0.95)
+        endpoint_stats["p99Ms"] = _percentile(stats["latency"], 0.99)
+        result[endpoint] = endpoint_stats
+    return result
+
+
+def clear_request_stats():
+    _endpoints.clear()
@@ -0,0 +1,76 @@
+from typing import Dict, Optional, TypedDict
+
+
+class RttEstimatorState(TypedDict):
+    srttMs: Optional[float]
+    rttvarMs: Optional[float]
+    backoff: int
+    samples: int
+
+
+class RttEstimator:
+    """
+    Estimates the request timeout for a host from the observed round-trip times,
+    the same way TCP calculates its retransmission timeout (RFC 6298).
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+    MIN_TIMEOUT = 1.0
+    MAX_BACKOFF = 6
+
+    def __init__(self):
+        self.__srtt: Optional[float] = None
+        self.__rttvar: Optional[float] = None
+        self.__backoff = 0
+        self.__samples = 0
+
+    @property
+    def state(self):
+        return RttEstimatorState({
+            "srttMs": None if self.__srtt is None else self.__srtt * 1000,
+            "rttvarMs": None if self.__rttvar is None else self.__rttvar * 1000,
+            "backoff": self.__backoff,
+            "samples": self.__samples
+        })
+
+    def add_sample(self, rtt: float):
+        if self.__srtt is None or self.__rttvar is None:
+            self.__srtt = rtt
+            self.__rttvar = rtt / 2
+        else:
+            self.__rttvar = (1 - self.BETA) * self.__rttvar + self.BETA * abs(self.__srtt - rtt)
+            self.__srtt = (1 - self.ALPHA) * self.__srtt + self.ALPHA * rtt
+
+        self.__samples += 1
+        self.__backoff = 0
+
+    def on_timeout(self):
+        self.__backoff = min(self.__backoff + 1, self.MAX_BACKOFF)
+
+    def timeout(self, ceiling: float):
+        """
+        Returns the timeout for the next request. The configured timeout is only used as the
+        ceiling (and until there are any samples), so a slow link still gets all of it.
+        """
+        if self.__srtt is None or self.__rttvar is None:
+            return ceiling
+
+        rto = max(self.MIN_TIMEOUT, self.__srtt + self.K * self.__rttvar) * (2 ** self.__backoff)
+        return min(rto, ceiling)
+
+
+_estimators: Dict[tuple[str, int], RttEstimator] = {}
+
+
+def get_rtt_estimator(address: str, port: int):
+    estimator = _estimators.get((address, port))
+    if estimator is None:
+        estimator = RttEstimator()
+        _estimators[(address, port)] = estimator
+    return estimator
+
+
+def get_rtt_estimator_states():
+    return {f"{address}:{port}": estimator.state for (address, port), estimator in _estimators.items()}
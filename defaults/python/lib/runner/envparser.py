@@ -24,6 +24,8 @@ class EnvSettings(TypedDict):
     user_id: Optional[str]
     username: Optional[str]
     runner_type: Optional[RunnerType]
+    capture_file: Optional[str]
+    notification_heartbeat: Optional[float]
 
 
 def get_auto_resolution() -> Optional[MoonDeckResolution]:
@@ -94,6 +96,22 @@ def get_runner_type() -> Optional[RunnerType]:
         return None
 
 
+def get_capture_file() -> Optional[str]:
+    return os.environ.get("MOONDECK_CAPTURE_FILE") or None
+
+
+def get_notification_heartbeat() -> Optional[float]:
+    value = os.environ.get("MOONDECK_NOTIFICATION_HEARTBEAT")
+    try:
+        if value is None:
+            return None
+
+        return float(value)
+    except:
+        logger.exception("While getting notification heartbeat")
+        return None
+
+
 def parse_env_settings() -> EnvSettings:
     return {
         "auto_resolution": get_auto_resolution(),
@@ -103,5 +121,7 @@ def parse_env_settings() -> EnvSettings:
         "app_name": get_app_name(),
         "user_id": get_user_id(),
         "username": get_username(),
-        "runner_type": get_runner_type()
+        "runner_type": get_runner_type(),
+        "capture_file": get_capture_file(),
+        "notification_heartbeat": get_notification_heartbeat()
     }
@@ -2,12 +2,18 @@ from typing import Optional
 
 from .settingsparser import MoonDeckAppRunnerSettings, CloseSteam, SteamUser
 from ..buddyrequests import AppState, CurrentUserResponse, SteamUiMode, StreamState, StreamStateResponse, SteamUiModeResponse, StreamedAppDataResponse
+from .. import constants
+from ..addressbook import resolve_address
 from ..runnerresult import Result, RunnerError
+from ..circuitbreaker import wait_for_probe
+from ..deadline import deadline
 from ..gamestreaminfo import get_server_info
 from ..logger import logger
 from ..moonlightproxy import CommandLineOptions, MoonlightProxy
 from ..buddyclient import BuddyClient, HelloResult
+from ..hellocache import HelloCache
 from ..buddyrequests import BuddyException
+from ..buddytraffic import TrafficRecorder
 from ..utils import TimedPooler
 from ..splashscreen.overlay import OverlayStack
 
@@ -46,7 +52,8 @@ class MoonDeckAppLauncher:
                     break
 
                 if not steam_close_request_sent:
-                    await client.close_steam(keep_stream_alive=True)
+                    with deadline(notifications.remaining):
+                        await client.close_steam(keep_stream_alive=True)
                     steam_close_request_sent = True
 
     @staticmethod
@@ -155,7 +162,6 @@ class MoonDeckAppLauncher:
     async def launch(cls, client: BuddyClient, big_picture_mode: bool, app_id: str, user: SteamUser | None, stream_rdy_timeout: int, steam_rdy_timeout: int, stability_timeout: int, launch_timeout: int, user_switch_timeout: int, cleanup_on_error: bool, manage_stream: bool):
         # Lazy import to improve CLI performance
         import asyncio
-        from .. import constants
 
         try:
             if manage_stream:
@@ -248,6 +254,9 @@ class MoonDeckAppRunner:
                         raise RunnerError(Result.GameStreamDead)
                     return
 
+                # Requests to an offline host fail right away, so the loop must not spin
+                await wait_for_probe(client.address, [client.port, host_port], max_delay=1)
+
     @staticmethod
     async def wait_for_initial_conditions(client: BuddyClient, app_id: str, user_id: str | None, timeout: int):
         logger.info("Waiting for a initial stream conditions to be satisfied")
@@ -323,16 +332,21 @@ class MoonDeckAppRunner:
                                           timeout=timeout)
 
     @classmethod
-    async def run(cls, settings: MoonDeckAppRunnerSettings, overlay_stack: OverlayStack):
+    async def run(cls, settings: MoonDeckAppRunnerSettings, overlay_stack: OverlayStack, recorder: Optional[TrafficRecorder] = None):
         # Lazy import to improve CLI performance
         import asyncio
         import contextlib
 
+        # The host might be reachable at a faster address than the configured one
+        address = await resolve_address(settings["address"], settings["buddy_port"], settings["timeouts"]["buddyRequests"])
         buddy_client = BuddyClient(
-            settings["address"],
+            address,
             settings["buddy_port"],
             settings["client_id"],
-            settings["timeouts"]["buddyRequests"])
+            settings["timeouts"]["buddyRequests"],
+            hello_cache=HelloCache(constants.HELLO_CACHE_TTL, constants.HELLO_CACHE_FILE),
+            recorder=recorder,
+            notification_heartbeat=settings["notification_heartbeat"])
         moonlight_proxy = MoonlightProxy(
             settings["moonlight_exec_path"])
 
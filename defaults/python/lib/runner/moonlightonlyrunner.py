@@ -1,12 +1,17 @@
 from typing import Optional
 
 from .settingsparser import MoonlightOnlyRunnerSettings
+from .. import constants
+from ..addressbook import resolve_address
 from ..runnerresult import Result, RunnerError
+from ..circuitbreaker import wait_for_probe
 from ..gamestreaminfo import get_server_info
 from ..logger import logger
 from ..moonlightproxy import CommandLineOptions, MoonlightProxy
 from ..buddyclient import BuddyClient
+from ..hellocache import HelloCache
 from ..buddyrequests import BuddyException
+from ..buddytraffic import TrafficRecorder
 from ..splashscreen.overlay import OverlayStack
 
 
@@ -41,6 +46,9 @@ class MoonlightOnlyRunner:
                         raise RunnerError(Result.GameStreamDead)
                     return
 
+                # Requests to an offline host fail right away, so the loop must not spin
+                await wait_for_probe(address, [client.port, host_port], max_delay=1)
+
     @staticmethod
     async def start_moonlight(proxy: MoonlightProxy, hostname: str, host_app: str, cmd_options: CommandLineOptions):
         logger.info("Checking if Moonlight flatpak is installed or custom binary exists")
@@ -54,19 +62,24 @@ class MoonlightOnlyRunner:
         await proxy.start(hostname, host_app, cmd_options)
 
     @classmethod
-    async def run(cls, settings: MoonlightOnlyRunnerSettings, overlay_stack: OverlayStack):
+    async def run(cls, settings: MoonlightOnlyRunnerSettings, overlay_stack: OverlayStack, recorder: Optional[TrafficRecorder] = None):
+        # The host might be reachable at a faster address than the configured one
+        address = await resolve_address(settings["address"], settings["buddy_port"], settings["timeouts"]["buddyRequests"])
         buddy_client = BuddyClient(
-            settings["address"],
+            address,
             settings["buddy_port"],
             settings["client_id"],
-            settings["timeouts"]["buddyRequests"])
+            settings["timeouts"]["buddyRequests"],
+            hello_cache=HelloCache(constants.HELLO_CACHE_TTL, constants.HELLO_CACHE_FILE),
+            recorder=recorder,
+            notification_heartbeat=settings["notification_heartbeat"])
         moonlight_proxy = MoonlightProxy(
             settings["moonlight_exec_path"])
 
         async with buddy_client as client, moonlight_proxy as proxy:
             await cls.check_connectivity(client=client,
                                          overlay_stack=overlay_stack,
-                                         address=settings["address"], 
+                                         address=address, 
                                          mac=settings["mac"],
                                          host_id=settings["host_id"],
                                          hostname=settings["hostname"],
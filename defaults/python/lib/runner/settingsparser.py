@@ -38,6 +38,9 @@ class MoonDeckAppRunnerSettings(TypedDict):
     app_id: str
     steam_user: Optional[SteamUser]
     debug_logs: bool
+    capture_file: Optional[str]
+    # None disables the heartbeat
+    notification_heartbeat: Optional[float]
     runner_type: Literal[RunnerType.MoonDeck]
 
 
@@ -56,6 +59,9 @@ class MoonlightOnlyRunnerSettings(TypedDict):
     custom_wol_exec_path: Optional[str]
     wol_port: int
     debug_logs: bool
+    capture_file: Optional[str]
+    # None disables the heartbeat
+    notification_heartbeat: Optional[float]
     runner_type: Literal[RunnerType.MoonlightOnly]
 
 
@@ -73,6 +79,14 @@ def parse_audio_settings(host_settings: HostSettings, env_settings: EnvSettings)
     logger.info(f"Parsed audio option: {audio_option}")
     return audio_option
 
+def parse_notification_heartbeat(env_settings: EnvSettings) -> Optional[float]:
+    heartbeat = env_settings["notification_heartbeat"]
+    if heartbeat is None:
+        return constants.NOTIFICATION_HEARTBEAT
+
+    logger.info(f"Parsed notification heartbeat: {heartbeat}")
+    return heartbeat if heartbeat > 0 else None
+
 def parse_resolution_settings(host_settings: HostSettings, env_settings: EnvSettings) -> ResolutionDimensions:
     dimensions: ResolutionDimensions = { 
         "size": None,
@@ -202,6 +216,8 @@ async def parse_settings() -> MoonDeckAppRunnerSettings | MoonlightOnlyRunnerSet
             "app_id": env_settings["app_id"],
             "steam_user": SteamUser(id=env_settings["user_id"], name=env_settings["username"]),
             "debug_logs": user_settings["runnerDebugLogs"],
+            "capture_file": env_settings["capture_file"],
+            "notification_heartbeat": parse_notification_heartbeat(env_settings=env_settings),
             "runner_type": RunnerType.MoonDeck
         })
     else:
@@ -223,5 +239,7 @@ async def parse_settings() -> MoonDeckAppRunnerSettings | MoonlightOnlyRunnerSet
             "custom_wol_exec_path": host_settings["wolSettings"]["customWolExecPath"] if host_settings["wolSettings"]["useCustomWolExec"] else None,
             "wol_port": host_settings["wolSettings"]["port"],
             "debug_logs": user_settings["runnerDebugLogs"],
+            "capture_file": env_settings["capture_file"],
+            "notification_heartbeat": parse_notification_heartbeat(env_settings=env_settings),
             "runner_type": RunnerType.MoonlightOnly
         })
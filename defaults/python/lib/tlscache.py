@@ -0,0 +1,117 @@
+from typing import TYPE_CHECKING, Any, TypedDict
+
+if TYPE_CHECKING:
+    import ssl
+
+
+class ConnectionStats(TypedDict):
+    ssl_contexts_created: int
+    ssl_context_cache_hits: int
+    connections_created: int
+    connections_reused: int
+    tls_full_handshakes: int
+    tls_sessions_resumed: int
+    handshakes_avoided: int
+
+
+_stats = ConnectionStats({
+    "ssl_contexts_created": 0,
+    "ssl_context_cache_hits": 0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "tls_full_handshakes": 0,
+    "tls_sessions_resumed": 0,
+    "handshakes_avoided": 0
+})
+_ssl_contexts: dict[str, "ssl.SSLContext"] = {}
+
+
+def _increment(key: str):
+    _stats[key] += 1  # type: ignore
+    if key in ["connections_reused", "tls_sessions_resumed"]:
+        _stats["handshakes_avoided"] += 1
+
+
+def _create_ssl_context(cafile: str):
+    # Lazy import to improve CLI performance
+    import ssl
+
+    class ResumableSSLObject(ssl.SSLObject):
+        session_stored = False
+
+        def do_handshake(self):
+            super().do_handshake()
+            _increment("tls_sessions_resumed" if self.session_reused else "tls_full_handshakes")
+            self.store_session()
+
+        def read(self, len=1024, buffer=None):
+            result = super().read(len, buffer)
+            if not self.session_stored:
+                # TLS 1.3 tickets arrive after the handshake, together with the application data
+                self.store_session()
+            return result
+
+        def store_session(self):
+            session = self.session
+            if session is not None and (session.has_ticket or len(session.id) > 0):
+                context: ResumableSSLContext = self.context  # type: ignore
+                context.sessions[self.server_hostname] = session
+                self.session_stored = True
+
+    class ResumableSSLContext(ssl.SSLContext):
+        sslobject_class = ResumableSSLObject
+
+        def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+            if session is None and not server_side:
+                session = self.sessions.get(server_hostname)
+
+            if session is not None:
+                try:
+                    return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                            server_hostname=server_hostname, session=session)
+                except ValueError:
+                    self.sessions.pop(server_hostname, None)
+
+            return super().wrap_bio(incoming, outgoing, server_side=server_side, server_hostname=server_hostname)
+
+    context = ResumableSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.sessions = {}  # type: ignore
+    context.load_verify_locations(cafile=cafile)
+    context.check_hostname = False
+    return context
+
+
+def get_ssl_context(cafile: str) -> "ssl.SSLContext":
+    """
+    Returns a process-wide SSL context for the CA file. The context remembers the last TLS
+    session per server so that new connections can resume it instead of doing a full handshake.
+    """
+    context = _ssl_contexts.get(cafile)
+    if context is not None:
+        _increment("ssl_context_cache_hits")
+        return context
+
+    context = _create_ssl_context(cafile)
+    _ssl_contexts[cafile] = context
+    _increment("ssl_contexts_created")
+    return context
+
+
+def create_trace_config():
+    # Lazy import to improve CLI performance
+    import aiohttp
+
+    async def on_connection_create_end(*args: Any):
+        _increment("connections_created")
+
+    async def on_connection_reuseconn(*args: Any):
+        _increment("connections_reused")
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+def get_connection_stats():
+    return ConnectionStats(_stats)
@@ -1,9 +1,12 @@
 from enum import Enum
-from typing import Any, AsyncGenerator, Generic, List, Literal, Optional, Type, TypedDict, Union, TypeVar, get_args, get_origin, is_typeddict, cast
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Awaitable, Callable, Generic, Hashable, List, Literal, Optional, Type, TypedDict, Union, TypeVar, get_args, get_origin, is_typeddict, cast
 
 from .logger import logger
 from .constants import RUNNER_PID_FILE, RUNNER_READY_FILE, RUNNER_SUSPENDED_FILE
 
+if TYPE_CHECKING:
+    import asyncio
+
 
 class AnyTypedDict(TypedDict, total=False):
     pass
@@ -44,69 +47,242 @@ def is_literal_like(data_type):
     return get_origin(data_type) == Literal
 
 
-def from_list(item_type: Type[T], data: List[Any]) -> List[T]:
-    assert isinstance(data, list), f"Expected list (\"{item_type}\"), got {data}"
+Validator = Callable[[Any], Any]
+FieldValidator = Callable[[str, Any], Any]
 
-    verified_data = []
-    for item in data:
-        if is_list_like(item_type):
-            actual_type = get_args(item_type)
-            verified_item = from_list(actual_type[0], item)
-        elif is_dict_like(item_type):
-            verified_item = from_dict(item_type, item)
-        else:
-            assert isinstance(item, item_type)
-            verified_item = item
-            
-        verified_data.append(verified_item)
-    return verified_data
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+_list_validators: dict[tuple[Any, bool], Validator] = {}
+_dict_validators: dict[tuple[Any, bool], Validator] = {}
 
 
-def from_dict(output_type: Type[T], data: AnyTypedDict) -> T:
+def _copy_value(value):
     # Lazy import to improve CLI performance
     import copy
 
-    assert isinstance(data, dict), f"Expected dict (\"{output_type}\"), got {data}"
-    
-    def get_annotations(data_type, data):
-        if is_typed_dict(data_type):
-            for key, key_type in data_type.__annotations__.items():
-                yield (key, key_type)
-        else:
-            for key in data.keys():
-                yield (key, data_type[1])
-
-    verified_data = {}
-    for key, key_type in get_annotations(output_type, data):
-        if key not in data:
-            raise ValueError(f"Key \"{key}\" is not available in {data}.")
-
-        if is_optional_like(key_type):
-            if data[key] is None:
-                verified_data[key] = None
-                continue
-            else:
-                key_type = get_args(key_type)[0]
+    return value if type(value) in _IMMUTABLE_TYPES else copy.deepcopy(value)
+
+
+def _keep_value(value):
+    return value
+
+
+def _compile_field_validator(key_type, copy: bool) -> FieldValidator:
+    if is_optional_like(key_type):
+        validate_value = _compile_field_validator(get_args(key_type)[0], copy)
+
+        def validate_optional(key, value):
+            return None if value is None else validate_value(key, value)
+        return validate_optional
+
+    actual_type = get_args(key_type) or key_type
+    if is_enum_like(actual_type):
+        def validate_enum(key, value):
+            return actual_type[value]  # type: ignore
+        return validate_enum
+
+    elif is_dict_like(key_type):
+        validate_dict = _get_dict_validator(actual_type, copy)
+
+        def validate_dict_field(key, value):
+            return validate_dict(value)
+        return validate_dict_field
+
+    elif is_list_like(key_type):
+        validate_list = _get_list_validator(actual_type[0], copy)  # type: ignore
+
+        def validate_list_field(key, value):
+            return validate_list(value)
+        return validate_list_field
+
+    copy_value = _copy_value if copy else _keep_value
+    if is_literal_like(key_type):
+        def validate_literal(key, value):
+            if value not in actual_type:
+                raise TypeError(f"Value {value} of \"{key}\" does not match the valid literal value(s) {actual_type}")
+            return copy_value(value)
+        return validate_literal
+
+    def validate_instance(key, value):
+        if not isinstance(value, actual_type):  # type: ignore
+            raise TypeError(f"\"{key}\" value {value} is not of valid type(s) {actual_type}")
+        return copy_value(value)
+    return validate_instance
+
+
+def _needs_conversion(data_type) -> bool:
+    # Only enum values are converted, everything else is returned as it was decoded
+    if is_optional_like(data_type):
+        return _needs_conversion(get_args(data_type)[0])
+
+    actual_type = get_args(data_type) or data_type
+    if is_enum_like(actual_type):
+        return True
+    elif is_typed_dict(data_type):
+        return any(_needs_conversion(key_type) for key_type in data_type.__annotations__.values())
+    elif is_dict_like(data_type):
+        return _needs_conversion(actual_type[1])  # type: ignore
+    elif is_list_like(data_type):
+        return _needs_conversion(actual_type[0])  # type: ignore
+    return False
+
+
+def _compile_dict_validator(output_type, copy: bool) -> Validator:
+    if is_typed_dict(output_type):
+        fields = [(key, _compile_field_validator(key_type, copy)) for key, key_type in output_type.__annotations__.items()]
+
+        def validate_typed_dict(data):
+            assert isinstance(data, dict), f"Expected dict (\"{output_type}\"), got {data}"
+
+            verified_data = {}
+            for key, validate_field in fields:
+                if key not in data:
+                    raise ValueError(f"Key \"{key}\" is not available in {data}.")
+                verified_data[key] = validate_field(key, data[key])
+            return verified_data
+
+        def validate_owned_typed_dict(data):
+            assert isinstance(data, dict), f"Expected dict (\"{output_type}\"), got {data}"
+
+            replaced = None
+            for key, validate_field in fields:
+                if key not in data:
+                    raise ValueError(f"Key \"{key}\" is not available in {data}.")
+                value = data[key]
+                verified_value = validate_field(key, value)
+                if verified_value is not value:
+                    # Nested dicts without their unknown keys
+                    if replaced is None:
+                        replaced = {}
+                    replaced[key] = verified_value
+
+            # Unknown keys are not part of the output
+            if replaced is None:
+                return data if len(data) == len(fields) else {key: data[key] for key, _ in fields}
+            return {key: replaced[key] if key in replaced else data[key] for key, _ in fields}
+
+        return validate_typed_dict if copy or _needs_conversion(output_type) else validate_owned_typed_dict
+
+    # Dict-like types are passed as the (key, value) type arguments
+    validate_value = _compile_field_validator(output_type[1], copy)
+
+    def validate_dict(data):
+        assert isinstance(data, dict), f"Expected dict (\"{output_type}\"), got {data}"
+
+        return {key: validate_value(key, value) for key, value in data.items()}
+
+    def validate_owned_dict(data):
+        assert isinstance(data, dict), f"Expected dict (\"{output_type}\"), got {data}"
+
+        replaced = None
+        for key, value in data.items():
+            verified_value = validate_value(key, value)
+            if verified_value is not value:
+                if replaced is None:
+                    replaced = {}
+                replaced[key] = verified_value
+        return data if replaced is None else {**data, **replaced}
+
+    return validate_dict if copy or _needs_conversion(output_type[1]) else validate_owned_dict
+
+
+def _compile_list_validator(item_type, copy: bool) -> Validator:
+    if is_list_like(item_type):
+        validate_item = _get_list_validator(get_args(item_type)[0], copy)
+    elif is_dict_like(item_type):
+        validate_item = _get_dict_validator(item_type if is_typed_dict(item_type) else get_args(item_type), copy)
+    else:
+        def validate_item(item):
+            assert isinstance(item, item_type)
+            return item
+
+    def validate_list(data):
+        assert isinstance(data, list), f"Expected list (\"{item_type}\"), got {data}"
+
+        return [validate_item(item) for item in data]
+
+    def validate_owned_list(data):
+        assert isinstance(data, list), f"Expected list (\"{item_type}\"), got {data}"
+
+        replaced = None
+        for index, item in enumerate(data):
+            verified_item = validate_item(item)
+            if verified_item is not item:
+                if replaced is None:
+                    replaced = {}
+                replaced[index] = verified_item
+        return data if replaced is None else [replaced.get(index, item) for index, item in enumerate(data)]
+
+    return validate_list if copy or _needs_conversion(item_type) else validate_owned_list
+
+
+def _get_dict_validator(output_type, copy: bool) -> Validator:
+    validator = _dict_validators.get((output_type, copy))
+    if validator is None:
+        validator = _compile_dict_validator(output_type, copy)
+        _dict_validators[(output_type, copy)] = validator
+    return validator
+
+
+def _get_list_validator(item_type, copy: bool) -> Validator:
+    validator = _list_validators.get((item_type, copy))
+    if validator is None:
+        validator = _compile_list_validator(item_type, copy)
+        _list_validators[(item_type, copy)] = validator
+    return validator
+
+
+_JSON_CACHE_SIZE = 64
+_JSON_CACHE_MAX_BODY = 512
+_json_cache: dict[tuple[Any, bytes], Any] = {}
+
+
+def _copy_json(value):
+    # Decoded JSON only nests dicts and lists, everything else is immutable
+    if isinstance(value, dict):
+        return {k: _copy_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(v) for v in value]
+    return value
+
+
+def from_json(output_type: Type[T], body: bytes) -> T:
+    """
+    Decodes the JSON body and validates it against the type without copying. The small
+    bodies (like the states that are polled for) mostly repeat, so their validated results
+    are kept and every caller gets its own copy of them.
+    """
+    # Lazy import to improve CLI performance
+    import json
+
+    if len(body) > _JSON_CACHE_MAX_BODY:
+        return from_dict(output_type, json.loads(body), copy=False)
 
-        actual_type = get_args(key_type) or key_type
-        if is_enum_like(actual_type):
-            verified_data[key] = actual_type[data[key]] # type: ignore
-            continue
-        elif is_dict_like(key_type):
-            verified_data[key] = from_dict(actual_type, data[key]) # type: ignore
-            continue
-        elif is_list_like(key_type):
-            verified_data[key] = from_list(actual_type[0], data[key]) # type: ignore
-            continue
-        elif is_literal_like(key_type):
-            if data[key] not in actual_type:
-                raise TypeError(f"Value {data[key]} of \"{key}\" does not match the valid literal value(s) {actual_type}")
-        elif not isinstance(data[key], actual_type):
-            raise TypeError(f"\"{key}\" value {data[key]} is not of valid type(s) {actual_type}")
+    key = (output_type, body)
+    result = _json_cache.pop(key, None)
+    if result is None:
+        result = from_dict(output_type, json.loads(body), copy=False)
+        if len(_json_cache) >= _JSON_CACHE_SIZE:
+            del _json_cache[next(iter(_json_cache))]
 
-        verified_data[key] = copy.deepcopy(data[key])
+    # Most recently used ones are at the end
+    _json_cache[key] = result
+    return _copy_json(result)
 
-    return output_type(**verified_data) if is_typed_dict(output_type) else verified_data # type: ignore
+
+def from_list(item_type: Type[T], data: List[Any], copy: bool = True) -> List[T]:
+    return _get_list_validator(item_type, copy)(data)
+
+
+def from_dict(output_type: Type[T], data: AnyTypedDict, copy: bool = True) -> T:
+    """
+    Validates the data against the type and returns its copy. The validator for
+    the type is compiled on the first use and reused for all the later calls.
+
+    With `copy=False` the ownership of the data is transferred instead - the data is never
+    modified, but the result reuses every part of it that needs no conversion, so the caller
+    must not use or modify the data anymore. Meant for freshly decoded JSON.
+    """
+    return _get_dict_validator(output_type, copy)(data)
 
 
 # Decorator for loging the entry/exit and the result
@@ -244,6 +420,12 @@ async def wake_on_lan(hostname: str, address: str, mac: str, port: int = 9, cust
 
             try_send_magic_packet(address_info, family)
 
+    # Lazy import to improve CLI performance
+    from .circuitbreaker import reset_circuits
+
+    # The host should be coming up, so check on it as often as possible
+    reset_circuits(address)
+
 
 def is_moondeck_runner_ready():
     # Lazy import to improve CLI performance
@@ -448,6 +630,24 @@ class TimedPooler:
             assert self.__yield_time is not None
             return self.__yield_time
 
+        @property
+        def remaining(self) -> float | None:
+            """
+            Time left until the pooler times out, so that the requests made while pooling can be bound by it.
+            """
+            now = self.now
+            timeout_end_time = None
+            repeat_timeout_end_time = None
+
+            if self.__timeout is not None:
+                timeout_end_time = (now if self.__timeout_start is None else self.__timeout_start) + self.__timeout
+
+            if self.__repeat_timeout is not None:
+                repeat_timeout_end_time = (now if self.__repeat_timeout_start is None else self.__repeat_timeout_start) + self.__repeat_timeout
+
+            end_time = repeat_timeout_end_time or timeout_end_time
+            return None if end_time is None else max(0, end_time - now)
+
         def __calculate_remaining_time(self) -> tuple[float | None, bool]:
             remaining = None
             is_a_repeat = False
@@ -482,6 +682,7 @@ class TimedPooler:
             # Lazy import to improve CLI performance
             import asyncio
             import contextlib
+            from .deadline import deadline
 
             async with contextlib.aclosing(generator) as gen:
                 next_value_task = None
@@ -491,7 +692,9 @@ class TimedPooler:
                         remaining, is_a_repeat = self.__calculate_remaining_time()
 
                         if next_value_task is None:
-                            next_value_task = asyncio.create_task(gen.__anext__())
+                            # Requests made by the generator (like the WebSocket setup) draw from the pooler's budget
+                            with deadline(remaining):
+                                next_value_task = asyncio.create_task(gen.__anext__())
 
                         try:
                             last_yield_value = await asyncio.wait_for(asyncio.shield(next_value_task), timeout=remaining)
@@ -524,3 +727,54 @@ class TimedPooler:
 
     def __call__(self, generator: AsyncGenerator[T, None]):
         return self.ContextManager(self.__timeout, self.__exception_on_timeout, generator)
+
+
+class SingleFlightStats(TypedDict):
+    hits: int
+    misses: int
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests - while a request for the key is in flight,
+    every other caller awaits the same result instead of making its own request.
+
+    A request that gives up early (at `gives_up_at`, in loop time) is only joined by the callers
+    that would give up no later than that, the others make their own request.
+    """
+
+    def __init__(self):
+        self.__in_flight: dict[Hashable, tuple["asyncio.Future[Any]", Optional[float]]] = {}
+        self.__stats = SingleFlightStats({"hits": 0, "misses": 0})
+
+    @property
+    def stats(self):
+        return SingleFlightStats(self.__stats)
+
+    async def run(self, key: Hashable, request: Callable[[], Awaitable[T]], gives_up_at: Optional[float] = None) -> T:
+        # Lazy import to improve CLI performance
+        import asyncio
+
+        in_flight = self.__in_flight.get(key)
+        if in_flight is not None and in_flight[1] is not None and (gives_up_at is None or gives_up_at > in_flight[1]):
+            in_flight = None
+
+        if in_flight is None:
+            self.__stats["misses"] += 1
+            future = asyncio.ensure_future(request())
+            self.__in_flight[key] = (future, gives_up_at)
+
+            def on_done(done_future: asyncio.Future):
+                if key in self.__in_flight and self.__in_flight[key][0] is done_future:
+                    del self.__in_flight[key]
+                # Result might not be retrieved if all of the callers were cancelled
+                if not done_future.cancelled():
+                    done_future.exception()
+
+            future.add_done_callback(on_done)
+        else:
+            future = in_flight[0]
+            self.__stats["hits"] += 1
+
+        # One caller being cancelled must not cancel the request for the others
+        return await asyncio.shield(future)
@@ -18,7 +18,10 @@ import contextlib
 import signal
 import logging
 
+from typing import Optional
 from lib.buddyrequests import BuddyException
+from lib.buddytraffic import TrafficRecorder
+from lib.gamestreaminfo import close_server_info_session
 from lib.runner.moondeckapprunner import MoonDeckAppRunner
 from lib.runner.moonlightonlyrunner import MoonlightOnlyRunner
 from lib.logger import logger, set_logger_settings
@@ -35,14 +38,14 @@ import lib.runnerresult as runnerresult
 set_logger_settings(logger, constants.RUNNER_LOG_FILE, rotate=False)
 
 
-async def run_runner(settings: MoonDeckAppRunnerSettings | MoonlightOnlyRunnerSettings, overlay_stack: OverlayStack):
+async def run_runner(settings: MoonDeckAppRunnerSettings | MoonlightOnlyRunnerSettings, overlay_stack: OverlayStack, recorder: Optional[TrafficRecorder]):
     if settings["runner_type"] == RunnerType.MoonDeck:
-        await MoonDeckAppRunner.run(settings, overlay_stack)
+        await MoonDeckAppRunner.run(settings, overlay_stack, recorder)
     else:
-        await MoonlightOnlyRunner.run(settings, overlay_stack)
+        await MoonlightOnlyRunner.run(settings, overlay_stack, recorder)
 
 
-async def run_with_suspend_resume(settings: MoonDeckAppRunnerSettings | MoonlightOnlyRunnerSettings):
+async def run_with_suspend_resume(settings: MoonDeckAppRunnerSettings | MoonlightOnlyRunnerSettings, recorder: Optional[TrafficRecorder]):
     suspend_requested = asyncio.Event()
     resume_requested = asyncio.Event()
 
@@ -54,7 +57,7 @@ async def run_with_suspend_resume(settings: MoonDeckAppRunnerSettings | Moonligh
         async with MainScreenRunning(screen.canvas):
             while True:
                 suspend_requested.clear()
-                runner_task = asyncio.create_task(run_runner(settings, screen.canvas))
+                runner_task = asyncio.create_task(run_runner(settings, screen.canvas, recorder))
                 suspend_wait_task = asyncio.create_task(suspend_requested.wait())
 
                 try:
@@ -98,7 +101,17 @@ async def main():
             if settings["debug_logs"]:
                 logger.setLevel(logging.DEBUG)
 
-            await run_with_suspend_resume(settings)
+            # The capture spans the whole run, suspensions included
+            recorder = TrafficRecorder(settings["capture_file"]) if settings["capture_file"] else None
+            if recorder is not None:
+                logger.info(f"Capturing Buddy traffic to {recorder.path}")
+
+            try:
+                await run_with_suspend_resume(settings, recorder)
+            finally:
+                if recorder is not None:
+                    recorder.close()
+                await close_server_info_session()
             runnerresult.set_result(None)
 
     except runnerresult.RunnerError as err:
@@ -15,6 +15,7 @@ add_plugin_to_path()
 
 
 import asyncio
+import decky
 import logging
 import pathlib
 import lib.gamestreaminfo as gamestreaminfo
@@ -24,11 +25,20 @@ import lib.utils as utils
 from typing import Optional
 from lib.plugin.settings import UserSettings, UserSettingsManager
 from lib.logger import logger, set_logger_settings, get_logger
-from lib.buddyrequests import SteamUiMode, SteamUiModeResponse, CurrentUserResponse, BuddyException
-from lib.buddyclient import BuddyClient, AbortHostStateChangeResult
+from lib.buddyrequests import SteamUiMode, SteamUiModeResponse, CurrentUserResponse, BuddyException, get_single_flight_stats
+from lib.buddyclient import AbortHostStateChangeResult, StateEndpoint
 from lib.utils import wake_on_lan, change_moondeck_runner_ready_state, TimedPooler
 from lib.runnerresult import Result, set_result, get_result
 from lib.moonlightproxy import MoonlightProxy
+from lib.plugin.buddyclientpool import BuddyClientPool
+from lib.plugin.hostmonitor import HostMonitor, HostStatus
+from lib.hellocache import HelloCache
+from lib.tlscache import get_connection_stats
+from lib.requeststats import get_request_stats
+from lib.notificationhub import get_notification_stats
+from lib.rttestimator import get_rtt_estimator_states
+from lib.circuitbreaker import get_circuit_breaker_states, set_max_delay
+from lib.addressbook import get_address_book
 
 set_logger_settings(logger, constants.BACKEND_LOG_FILE, rotate=True, verbose=True)
 
@@ -36,6 +46,19 @@ frontend_logger = get_logger("frontend")
 set_logger_settings(frontend_logger, constants.FRONTEND_LOG_FILE, rotate=True, log_preamble="", verbose=True)
 
 settings_manager = UserSettingsManager(constants.get_config_file_path())
+# Short blips are bridged, while the host monitor still notices a host that is gone within about its interval
+buddy_client_pool = BuddyClientPool(hello_cache=HelloCache(constants.HELLO_CACHE_TTL, constants.HELLO_CACHE_FILE),
+                                    reconnect_timeout=5)
+host_browser = gamestreaminfo.HostBrowser()
+
+
+async def emit_host_status(status: HostStatus):
+    await decky.emit("host_status", status)
+
+
+host_monitor = HostMonitor(buddy_client_pool, emit_host_status, host_browser)
+# The host monitor must get to probe a host that has gone offline on every check
+set_max_delay(host_monitor.interval)
 
 
 class Plugin:
@@ -46,10 +69,25 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def _main(self):
         self.__cleanup_states()
+        try:
+            await host_browser.start()
+        except Exception:
+            logger.exception("Failed to start browsing for GameStream hosts")
+
+        try:
+            settings, _ = await settings_manager.read()
+        except Exception:
+            logger.exception("Failed to read user settings for host monitor")
+            settings = None
+        host_monitor.start(settings)
 
     @utils.async_scope_log(logger.info)
     async def _unload(self):
         self.__cleanup_states()
+        await host_monitor.stop()
+        await buddy_client_pool.close()
+        await host_browser.stop()
+        await gamestreaminfo.close_server_info_session()
 
     async def frontend_log_entry(self, level: str, message: str):
         try:
@@ -80,6 +118,7 @@ class Plugin:
         try:
             data = await settings_manager.read_or_update()
             self.set_log_levels(data)
+            host_monitor.update_settings(data)
             return data
         except Exception:
             logger.exception("Failed to get user settings")
@@ -90,21 +129,22 @@ class Plugin:
         try:
             await settings_manager.write(data)
             self.set_log_levels(data)
+            host_monitor.update_settings(data)
         except Exception:
             logger.exception("Failed to set user settings")
 
     @utils.async_scope_log(logger.info)
-    async def scan_for_hosts(self, timeout: float):
+    async def scan_for_hosts(self, timeout: float, refresh: bool = False):
         try:
-            return await gamestreaminfo.scan_for_hosts(timeout=timeout)
+            return await gamestreaminfo.scan_for_hosts(timeout=timeout, browser=host_browser, refresh=refresh)
         except Exception:
             logger.exception("Unhandled exception")
             return []
 
     @utils.async_scope_log(logger.info)
-    async def find_host(self, host_id: str, timeout: float):
+    async def find_host(self, host_id: str, timeout: float, address: Optional[str] = None, port: Optional[int] = None):
         try:
-            return await gamestreaminfo.find_host(host_id, timeout=timeout)
+            return await gamestreaminfo.find_host(host_id, timeout=timeout, browser=host_browser, address=address, port=port)
         except Exception:
             logger.exception("Unhandled exception")
             return None
@@ -117,12 +157,43 @@ class Plugin:
             logger.exception("Unhandled exception")
             return None
 
+    @utils.async_scope_log(logger.info)
+    async def get_server_details(self, address: str, port: int, timeout: float):
+        try:
+            return await gamestreaminfo.get_server_details(address, port, timeout=timeout)
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
+    @utils.async_scope_log(logger.info)
+    async def get_cached_host_status(self):
+        try:
+            return host_monitor.status
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
+    @utils.async_scope_log(logger.info)
+    async def refresh_host_status(self):
+        try:
+            await host_monitor.check(timeout=10)
+        except Exception:
+            logger.exception("Unhandled exception")
+
+    @utils.async_scope_log(logger.info)
+    async def set_host_status_observed(self, observed: bool):
+        try:
+            host_monitor.set_observed(observed)
+            await host_monitor.check(timeout=10)
+        except Exception:
+            logger.exception("Unhandled exception")
+
     @utils.async_scope_log(logger.info)
     async def get_buddy_info(self, address: str, buddy_port: int, client_id: str, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
-                info = await client.get_host_info()
-                return {"status": "Online", "info": info}
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
+                snapshot = await client.snapshot(StateEndpoint.HostInfo)
+                return {"status": "Online", "info": snapshot["host_info"]}
 
         except BuddyException as err:
             return {"status": err.result.name, "info": None}
@@ -134,7 +205,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def start_pairing(self, address: str, buddy_port: int, client_id: str, pin: int, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.start_pairing(pin)
                 return "PairingStarted"
 
@@ -149,7 +220,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def abort_pairing(self, address: str, buddy_port: int, client_id: str, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.abort_pairing()
 
         except BuddyException:
@@ -168,7 +239,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def restart_host(self, address: str, buddy_port: int, client_id: str, delay_s: int, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.restart_host(delay_s)
 
         except BuddyException:
@@ -180,7 +251,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def shutdown_host(self, address: str, buddy_port: int, client_id: str, delay_s: int, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.shutdown_host(delay_s)
 
         except BuddyException:
@@ -192,7 +263,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def suspend_host(self, address: str, buddy_port: int, client_id: str, delay_s: int, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.suspend_host(delay_s)
 
         except BuddyException:
@@ -204,7 +275,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def hibernate_host(self, address: str, buddy_port: int, client_id: str, delay_s: int, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.hibernate_host(delay_s)
 
         except BuddyException:
@@ -216,7 +287,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def abort_host_state_change(self, address: str, buddy_port: int, client_id: str, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.abort_host_state_change()
                 return True
 
@@ -229,6 +300,65 @@ class Plugin:
             logger.exception("Unhandled exception")
             return False
 
+    @utils.async_scope_log(logger.info)
+    async def get_connection_stats(self):
+        try:
+            return get_connection_stats()
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
+    @utils.async_scope_log(logger.info)
+    async def get_single_flight_stats(self):
+        try:
+            return {
+                "buddy": get_single_flight_stats(),
+                "serverInfo": gamestreaminfo.get_server_info_single_flight_stats()
+            }
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
+    @utils.async_scope_log(logger.info)
+    async def get_request_stats(self):
+        try:
+            return get_request_stats()
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
+    @utils.async_scope_log(logger.info)
+    async def get_notification_stats(self):
+        try:
+            return get_notification_stats()
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
+    @utils.async_scope_log(logger.info)
+    async def get_rtt_estimates(self):
+        try:
+            return get_rtt_estimator_states()
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
+    @utils.async_scope_log(logger.info)
+    async def get_address_book(self):
+        try:
+            return get_address_book().get_entries()
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
+    @utils.async_scope_log(logger.info)
+    async def get_circuit_breaker_states(self):
+        try:
+            return get_circuit_breaker_states()
+        except Exception:
+            logger.exception("Unhandled exception")
+            return None
+
     @utils.async_scope_log(logger.info)
     async def get_moondeckrun_path(self):
         try:
@@ -299,7 +429,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def close_steam(self, address: str, buddy_port: int, client_id: str, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.close_steam()
 
         except BuddyException:
@@ -311,7 +441,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def end_stream(self, address: str, buddy_port: int, client_id: str, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 await client.end_stream()
 
         except BuddyException:
@@ -323,7 +453,7 @@ class Plugin:
     @utils.async_scope_log(logger.info)
     async def get_game_stream_app_names(self, address: str, buddy_port: int, client_id: str, timeout: float):
         try:
-            async with BuddyClient(address, buddy_port, client_id, timeout) as client:
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, timeout) as client:
                 return await client.get_game_stream_app_names()
 
         except BuddyException:
@@ -338,7 +468,8 @@ class Plugin:
     async def get_non_steam_app_data(self, address: str, buddy_port: int, client_id: str, user_id: str,
                                      buddy_timeout: float, ready_timeout: int):
         try:
-            async with BuddyClient(address, buddy_port, client_id, buddy_timeout) as client:
+            # Waiting for Steam takes longer than a single request
+            async with buddy_client_pool.borrow(address, buddy_port, client_id, buddy_timeout, share_deadline=False) as client:
                 logger.info(f"Sending request to launch Steam if needed")
                 await client.launch_steam(big_picture_mode=False, username=None)
 
@@ -18,9 +18,10 @@ export function useBuddyStatus(observe?: boolean): [BuddyStatus, boolean] {
     sub.add(connectivityManager.buddyProxy.status.asObservable().subscribe((status) => setBuddyStatus(status)));
     sub.add(connectivityManager.buddyProxy.refreshing.asObservable().pipe(debounceTime(1000)).subscribe((refresh) => setRefreshStatus(refresh)));
 
-    connectivityManager.buddyAutoRefresh.start().catch((e) => logger.critical(e));
+    const unobserve = connectivityManager.observeHostStatus();
+    connectivityManager.refreshFromCache().catch((e) => logger.critical(e));
     return () => {
-      connectivityManager.buddyAutoRefresh.stop().catch((e) => logger.critical(e));
+      unobserve();
       sub.unsubscribe();
     };
   }, typeof observe === "boolean" ? [observe] : []);
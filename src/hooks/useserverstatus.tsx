@@ -18,9 +18,10 @@ export function useServerStatus(observe?: boolean): [ServerStatus, boolean] {
     sub.add(connectivityManager.serverProxy.status.asObservable().subscribe((status) => setServerStatus(status)));
     sub.add(connectivityManager.serverProxy.refreshing.asObservable().pipe(debounceTime(1000)).subscribe((refresh) => setRefreshStatus(refresh)));
 
-    connectivityManager.serverAutoRefresh.start().catch((e) => logger.critical(e));
+    const unobserve = connectivityManager.observeHostStatus();
+    connectivityManager.refreshFromCache().catch((e) => logger.critical(e));
     return () => {
-      connectivityManager.serverAutoRefresh.stop().catch((e) => logger.critical(e));
+      unobserve();
       sub.unsubscribe();
     };
   }, typeof observe === "boolean" ? [observe] : []);
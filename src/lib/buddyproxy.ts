@@ -18,7 +18,7 @@ interface ClientInfo {
   timeouts: RunnerTimeouts;
 }
 
-interface BuddyInfo {
+export interface BuddyInfo {
   status: BuddyStatus;
   info: {
     mac: string;
@@ -98,6 +98,18 @@ export class BuddyProxy {
     this.settingsManager = settingsManager;
   }
 
+  applyStatus(hostId: string | null, buddyInfo: BuddyInfo): void {
+    if (this.settingsManager.settings.value?.currentHostId === hostId) {
+      this.updateInfo(buddyInfo);
+    }
+  }
+
+  setRefreshing(refreshing: boolean): void {
+    if (this.refreshingSubject.value !== refreshing) {
+      this.refreshingSubject.next(refreshing);
+    }
+  }
+
   async refreshStatus(): Promise<void> {
     if (this.mutex.isLocked()) {
       await this.mutex.waitForUnlock();
@@ -114,7 +126,7 @@ export class BuddyProxy {
         return;
       }
 
-      const result = await getBuddyInfo(clientInfo, 1);
+      const result = await getBuddyInfo(clientInfo, clientInfo.timeouts.buddyRequests);
       if (this.settingsManager.settings.value?.currentHostId === clientInfo.hostId) {
         this.updateInfo(result);
       }
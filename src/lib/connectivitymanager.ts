@@ -1,22 +1,55 @@
-import { BuddyProxy } from "./buddyproxy";
+import { BuddyInfo, BuddyProxy } from "./buddyproxy";
+import { GameStreamHost, ServerProxy } from "./serverproxy";
+import { addEventListener, call, removeEventListener } from "@decky/api";
 import { CommandProxy } from "./commandproxy";
-import { IncrementalLoop } from "./incrementalloop";
-import { ServerProxy } from "./serverproxy";
 import { SettingsManager } from "./settingsmanager";
 import { Subscription } from "rxjs";
 import { logger } from "./logger";
 
+interface HostStatus {
+  hostId: string | null;
+  buddy: BuddyInfo;
+  server: GameStreamHost | null;
+}
+
+async function getCachedHostStatus(): Promise<HostStatus | null> {
+  try {
+    return await call<[], HostStatus | null>("get_cached_host_status");
+  } catch (message) {
+    logger.critical("Error while getting cached host status: ", message);
+  }
+  return null;
+}
+
+async function refreshHostStatus(): Promise<void> {
+  try {
+    await call<[], unknown>("refresh_host_status");
+  } catch (message) {
+    logger.critical("Error while refreshing host status: ", message);
+  }
+}
+
+async function setHostStatusObserved(observed: boolean): Promise<void> {
+  try {
+    await call<[boolean], unknown>("set_host_status_observed", observed);
+  } catch (message) {
+    logger.critical("Error while setting host status observation: ", message);
+  }
+}
+
 export class ConnectivityManager {
   private readonly settingsManager: SettingsManager;
   private subscription: Subscription | null = null;
+  private observers = 0;
+  private refreshes = 0;
+  private readonly hostStatusListener = (status: HostStatus): void => {
+    this.applyHostStatus(status).catch((e) => logger.critical(e));
+  };
 
   readonly buddyProxy: BuddyProxy;
   readonly serverProxy: ServerProxy;
   readonly commandProxy: CommandProxy;
 
-  readonly buddyAutoRefresh = new IncrementalLoop(async () => { await this.buddyProxy.refreshStatus(); }, 5000);
-  readonly serverAutoRefresh = new IncrementalLoop(async () => { await this.serverProxy.refreshStatus(); }, 5000);
-
   constructor(settingsManager: SettingsManager) {
     this.settingsManager = settingsManager;
 
@@ -25,7 +58,32 @@ export class ConnectivityManager {
     this.commandProxy = new CommandProxy(this.settingsManager, this.buddyProxy, this.serverProxy);
   }
 
+  private async applyHostStatus(status: HostStatus): Promise<void> {
+    this.buddyProxy.applyStatus(status.hostId, status.buddy);
+    await this.serverProxy.applyStatus(status.hostId, status.server);
+  }
+
+  private async withRefreshing(callback: () => Promise<void>): Promise<void> {
+    // The backend only returns once it has rechecked the host
+    if (this.refreshes++ === 0) {
+      this.buddyProxy.setRefreshing(true);
+      this.serverProxy.setRefreshing(true);
+    }
+
+    try {
+      await callback();
+    } finally {
+      if (--this.refreshes === 0) {
+        this.buddyProxy.setRefreshing(false);
+        this.serverProxy.setRefreshing(false);
+      }
+    }
+  }
+
   init(): void {
+    // Host status is monitored by the backend, which pushes every change to us
+    addEventListener<[HostStatus]>("host_status", this.hostStatusListener);
+
     this.subscription = new Subscription();
     this.subscription.add(this.settingsManager.settings.asObservable().subscribe(() => {
       this.refresh().catch((e) => logger.critical(e));
@@ -33,8 +91,7 @@ export class ConnectivityManager {
   }
 
   deinit(): void {
-    this.serverAutoRefresh.deinit().catch((e) => logger.critical(e));
-    this.buddyAutoRefresh.deinit().catch((e) => logger.critical(e));
+    removeEventListener("host_status", this.hostStatusListener);
     if (this.subscription !== null) {
       this.subscription.unsubscribe();
       this.subscription = null;
@@ -42,6 +99,31 @@ export class ConnectivityManager {
   }
 
   async refresh(): Promise<void> {
-    await Promise.all([this.buddyProxy.refreshStatus(), this.serverProxy.refreshStatus()]);
+    // The backend probes the host and pushes the result back
+    await this.withRefreshing(refreshHostStatus);
+  }
+
+  observeHostStatus(): () => void {
+    // The backend only monitors the host while someone is looking at the status
+    if (this.observers++ === 0) {
+      this.withRefreshing(async () => await setHostStatusObserved(true)).catch((e) => logger.critical(e));
+    }
+
+    let observing = true;
+    return () => {
+      if (observing) {
+        observing = false;
+        if (--this.observers === 0) {
+          setHostStatusObserved(false).catch((e) => logger.critical(e));
+        }
+      }
+    };
+  }
+
+  async refreshFromCache(): Promise<void> {
+    const status = await getCachedHostStatus();
+    if (status !== null) {
+      await this.applyHostStatus(status);
+    }
   }
 }
@@ -6,7 +6,6 @@ export * from "./commandproxy";
 export * from "./connectivitymanager";
 export * from "./executeasync";
 export * from "./envutils";
-export * from "./incrementalloop";
 export * from "./logger";
 export * from "./moondeckapp";
 export * from "./moondeckapplauncher";
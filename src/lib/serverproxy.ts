@@ -25,15 +25,6 @@ async function scanForHosts(timeout: number): Promise<GameStreamHost[]> {
   return [];
 }
 
-async function findHost(hostId: string, timeout: number): Promise<GameStreamHost | null> {
-  try {
-    return await call<[string, number], GameStreamHost | null>("find_host", hostId, timeout);
-  } catch (message) {
-    logger.critical("Error while finding host: ", message);
-  }
-  return null;
-}
-
 async function getServerInfo(address: string, port: number, timeout: number): Promise<GameStreamHost | null> {
   try {
     return await call<[string, number, number], GameStreamHost | null>("get_server_info", address, port, timeout);
@@ -155,44 +146,28 @@ export class ServerProxy {
     this.buddyProxy = buddyProxy;
   }
 
-  async refreshStatus(): Promise<void> {
-    if (this.mutex.isLocked()) {
-      await this.mutex.waitForUnlock();
-      return;
-    }
-
+  async applyStatus(hostId: string | null, result: GameStreamHost | null): Promise<void> {
     const release = await this.mutex.acquire();
     try {
-      this.refreshingSubject.next(true);
-
-      const hostId = this.settingsManager.settings.value?.currentHostId ?? null;
-      if (hostId === null) {
-        this.updateStatus("Offline");
+      if (hostId === null || this.settingsManager.settings.value?.currentHostId !== hostId) {
         return;
       }
 
-      let result: GameStreamHost | null = null;
-      const hostSettings = this.settingsManager.hostSettings;
-      if (hostSettings) {
-        result = hostSettings.staticAddress ? await getServerInfo(hostSettings.address, hostSettings.hostInfoPort, 1) : await findHost(hostId, 1);
-      } else {
-        result = await findHost(hostId, 1);
-      }
-
-      if (this.settingsManager.settings.value?.currentHostId === hostId) {
-        const newStatus = result?.uniqueId === hostId ? "Online" : "Offline";
-        this.updateStatus(newStatus);
-      }
-
+      this.updateStatus(result?.uniqueId === hostId ? "Online" : "Offline");
       if (result?.uniqueId === hostId) {
         this.updateHostSettingsUnlocked(result, false, null);
       }
     } finally {
-      this.refreshingSubject.next(false);
       release();
     }
   }
 
+  setRefreshing(refreshing: boolean): void {
+    if (this.refreshingSubject.value !== refreshing) {
+      this.refreshingSubject.next(refreshing);
+    }
+  }
+
   async getServerInfo(address: string, port: number): Promise<GameStreamHost | null> {
     return await getServerInfo(address, port, 2);
   }
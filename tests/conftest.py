@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "defaults" / "python"), str(ROOT / "defaults" / "python" / "externals")]
@@ -0,0 +1,20 @@
+import multiprocessing
+
+from lib.addressbook import AddressBook
+
+
+def learn_hosts(state_file: str, index: int):
+    book = AddressBook(state_file)
+    for i in range(10):
+        book.learn(f"HOST-{index}-{i}", [f"10.{index}.0.{i}"])
+
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    state_file = str(tmp_path / "address-book")
+    processes = [multiprocessing.Process(target=learn_hosts, args=(state_file, index)) for index in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert len(AddressBook(state_file).get_entries()) == 4 * 10
@@ -0,0 +1,28 @@
+from lib.hellocache import HelloCache
+
+
+def test_invalidated_hello_is_not_read_back_from_the_file(tmp_path):
+    state_file = tmp_path / "hello-cache"
+    cache = HelloCache(15, str(state_file))
+    key = HelloCache.make_key("127.0.0.1", 59999, "client")
+
+    cache.mark_ok(key)
+    stale_data = state_file.read_text()
+    cache.invalidate(key)
+    assert not cache.is_valid(key)
+
+    # Another process writes back what it has read before the invalidation
+    state_file.write_text(stale_data)
+    assert not cache.is_valid(key)
+    assert HelloCache(15, str(state_file)).is_valid(key)
+
+
+def test_newer_verification_from_another_process_is_used(tmp_path):
+    state_file = tmp_path / "hello-cache"
+    cache = HelloCache(15, str(state_file))
+    other = HelloCache(15, str(state_file))
+    key = HelloCache.make_key("127.0.0.1", 59999, "client")
+
+    cache.invalidate(key)
+    other.mark_ok(key)
+    assert cache.is_valid(key)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from lib.buddyrequests import StreamState, StreamStateResponse
+from lib.notificationhub import NotificationHub
+
+
+async def serve_notifications(state: dict):
+    async def notify_on_changes(request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        topics = await ws.receive_json()
+        await ws.send_json({"result": True})
+        await ws.send_json([state[topic] for topic in topics])
+        async for _ in ws:
+            pass
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/notifyOnChanges", notify_on_changes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def first_item(hub: NotificationHub, changed_at=None):
+    async for items in hub.subscribe([StreamStateResponse], timeout=1, changed_at=changed_at):
+        return items
+
+
+def test_resubscribing_after_a_change_gets_the_unchanged_snapshot():
+    async def run():
+        runner, base_url = await serve_notifications({"StreamState": {"state": "NotStreaming"}})
+        try:
+            async with aiohttp.ClientSession() as session:
+                hub = NotificationHub(session, base_url)
+                try:
+                    assert await asyncio.wait_for(first_item(hub), 2) == ({"state": StreamState.NotStreaming},)
+
+                    # A state changing request that left the state as it was forces a new WebSocket
+                    changed_at = time.monotonic()
+                    assert await asyncio.wait_for(first_item(hub, changed_at), 2) == ({"state": StreamState.NotStreaming},)
+                finally:
+                    await hub.close()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_consumers_get_a_full_snapshot_after_reconnecting():
+    async def run():
+        connections = []
+
+        async def notify_on_changes(request: web.Request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            await ws.receive_json()
+            await ws.send_json({"result": True})
+            await ws.send_json([{"state": "NotStreaming"}])
+            connections.append(ws)
+            if len(connections) > 1:
+                async for _ in ws:
+                    pass
+            return ws
+
+        app = web.Application()
+        app.router.add_get("/notifyOnChanges", notify_on_changes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                hub = NotificationHub(session, f"http://127.0.0.1:{runner.addresses[0][1]}", reconnect_timeout=2)
+                try:
+                    items = []
+                    async def collect():
+                        async for item in hub.subscribe([StreamStateResponse], timeout=1):
+                            items.append(item)
+                            if len(items) == 2:
+                                return
+
+                    # The first connection is closed right after the snapshot
+                    await asyncio.wait_for(collect(), 3)
+                    assert len(connections) == 2
+                    assert items[1] == ({"state": StreamState.NotStreaming},)
+                finally:
+                    await hub.close()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Dict, List, TypedDict
+
+from lib import utils
+from lib.buddyrequests import NonSteamAppDataResponse
+
+
+def test_from_json_results_can_be_modified_by_the_caller():
+    body = b'{"data": [{"app_id": "2", "app_name": "B"}, {"app_id": "1", "app_name": "A"}]}'
+
+    first = utils.from_json(NonSteamAppDataResponse, body)
+    first["data"].sort(key=lambda item: item["app_name"])
+    first["data"][0]["app_name"] = "Changed"
+
+    second = utils.from_json(NonSteamAppDataResponse, body)
+    assert second == {"data": [{"app_id": "2", "app_name": "B"}, {"app_id": "1", "app_name": "A"}]}
+
+
+class Nested(TypedDict):
+    value: int
+
+
+class Outer(TypedDict):
+    nested: Nested
+    items: List[Nested]
+    mapping: Dict[str, Nested]
+
+
+def test_from_dict_without_copy_strips_nested_unknown_keys():
+    data = {
+        "nested": {"value": 1, "stale": True},
+        "items": [{"value": 2}, {"value": 3, "stale": True}],
+        "mapping": {"a": {"value": 4, "stale": True}},
+        "stale": True,
+    }
+    expected = {"nested": {"value": 1}, "items": [{"value": 2}, {"value": 3}], "mapping": {"a": {"value": 4}}}
+
+    assert utils.from_dict(Outer, data, copy=False) == expected
+    assert utils.from_dict(Outer, data, copy=True) == expected
+
+
+def test_from_dict_without_copy_keeps_matching_data_as_is():
+    data = {"nested": {"value": 1}, "items": [{"value": 2}], "mapping": {"a": {"value": 4}}}
+
+    result = utils.from_dict(Outer, data, copy=False)
+    assert result is data
+    assert result["items"] is data["items"]
+
+
+def test_single_flight_is_not_joined_by_callers_that_can_wait_longer():
+    async def run():
+        loop = asyncio.get_running_loop()
+        single_flight = utils.SingleFlight()
+        calls = []
+
+        async def request(timeout: float):
+            calls.append(timeout)
+            async with asyncio.timeout(timeout):
+                await asyncio.sleep(0.2)
+            return timeout
+
+        short = asyncio.create_task(single_flight.run("key", lambda: request(0.05), loop.time() + 0.05))
+        await asyncio.sleep(0)
+        joined = asyncio.create_task(single_flight.run("key", lambda: request(0.05), loop.time() + 0.01))
+        patient = asyncio.create_task(single_flight.run("key", lambda: request(1)))
+        await asyncio.sleep(0)
+        also_patient = asyncio.create_task(single_flight.run("key", lambda: request(1)))
+
+        results = await asyncio.gather(short, joined, patient, also_patient, return_exceptions=True)
+        assert isinstance(results[0], TimeoutError) and isinstance(results[1], TimeoutError)
+        assert results[2:] == [1, 1]
+        assert calls == [0.05, 1]
+
+    asyncio.run(run())